@@ -108,6 +108,9 @@ class TestGraph(object):
         # TODO: these attributes must interface with jobs and runners
         self.logdir = TestGraph.logdir
         self.runner = None
+        # background state prefetches per worker
+        self._prefetches = {}
+        self._prefetched = {}
 
     def __repr__(self) -> str:
         """Provide a representation of the object."""
@@ -1959,6 +1962,55 @@ class TestGraph(object):
         test_node.params["type"] = test_node.params["configure_install"]
         return await self.runner.run_test_node(test_node)
 
+    def scan_nodes(self, test_node: TestNode, worker: TestWorker) -> None:
+        """
+        Scan the states of a node and its next nodes at once for their run decisions.
+
+        :param test_node: node about to be traversed by the worker
+        :param worker: worker traversing the graph
+
+        The node and its children (breadth first) that still need a state scan
+        by the worker are scanned within a configured batch size.
+        """
+        batch_size = test_node.params.get_numeric("states_scan_batch", 0)
+        if batch_size <= 1 or test_node.params.get("dry_run", "no") == "yes":
+            return
+
+        def needs_scan(node: TestNode) -> bool:
+            return (
+                not node.is_flat()
+                and len(node.cloned_nodes) == 0
+                and worker.id in node.params["name"]
+                and worker.id not in node._scanned_states
+                and len(node.get_stateful_objects()) > 0
+                and not node.is_finished(worker, 1)
+            )
+
+        if not needs_scan(test_node):
+            return
+        next_nodes, frontier = [], [test_node]
+        while len(frontier) > 0 and len(next_nodes) < batch_size:
+            node = frontier.pop(0)
+            if node in next_nodes or not needs_scan(node):
+                continue
+            next_nodes.append(node)
+            frontier += list(node.cleanup_nodes)
+        TestNode.scan_states_batch(next_nodes, worker)
+
+    def drop_scans(self, test_node: TestNode) -> None:
+        """
+        Drop batch state scan results that could be outdated by a node.
+
+        :param test_node: node that ran or cleaned up and thus modified states
+
+        Results of all nodes sharing any objects with the node are dropped
+        so that their run decisions rely on a scan of their own.
+        """
+        objects = set(test_node.objects)
+        for node in self.nodes:
+            if len(node._scanned_states) > 0 and objects.intersection(node.objects):
+                node._scanned_states.clear()
+
     async def traverse_node(
         self, test_node: TestNode, worker: TestWorker, params: Params
     ) -> None:
@@ -1987,6 +2039,7 @@ class TestGraph(object):
             test_node.results += previous_results
         # add shared pool and result based setup locations
         test_node.pull_locations()
+        self.scan_nodes(test_node, worker)
 
         if test_node.should_run(worker):
 
@@ -2008,6 +2061,7 @@ class TestGraph(object):
                         f"Worker {worker.id} got nonzero status from the test {test_node}"
                     )
 
+            self.drop_scans(test_node)
             for test_object in test_node.objects:
                 object_params = test_object.object_typed_params(test_node.params)
                 # if a state was set it is final and the retrieved state was overwritten
@@ -2047,11 +2101,66 @@ class TestGraph(object):
 
             if len(test_node.get_stateful_objects()) > 0:
                 test_node.sync_states(params)
+                self.drop_scans(test_node)
 
         else:
             logging.debug(f"Worker {worker.id} should not clean up {test_node}")
         test_node.started_worker = None
 
+    def prefetch_nodes(self, test_node: TestNode, worker: TestWorker) -> None:
+        """
+        Prefetch in the background states needed by the next nodes of a worker.
+
+        :param test_node: node picked by the worker as its next node
+        :param worker: worker traversing the graph
+
+        The picked node and its children up to a configured depth are
+        considered as the next nodes, skipping nodes that are still unparsed
+        or successfully prefetched before. A new prefetch will only be started
+        once the previous one of the same worker completed and any prefetch
+        failures are only logged as prefetching is merely an optimization.
+        """
+        depth = test_node.params.get_numeric("pool_prefetch_depth", 0)
+        if depth <= 0:
+            return
+        prefetch = self._prefetches.get(worker.id)
+        if prefetch is not None and not prefetch.done():
+            return
+
+        prefetched = self._prefetched.setdefault(worker.id, set())
+        next_nodes, frontier = [], [test_node]
+        for _ in range(depth):
+            frontier = [
+                n
+                for n in frontier
+                if not n.is_flat()
+                and not n.is_shared_root()
+                and worker.id in n.params["name"]
+                and n not in prefetched
+                and n not in next_nodes
+            ]
+            next_nodes += frontier
+            frontier = [c for n in frontier for c in n.cleanup_nodes]
+        if len(next_nodes) == 0:
+            return
+
+        def prefetch_states() -> None:
+            for node in next_nodes:
+                try:
+                    if node.prefetch_states(worker):
+                        prefetched.add(node)
+                except Exception as error:
+                    logging.warning(
+                        f"Worker {worker.id} could not prefetch states for {node}: {error}"
+                    )
+
+        logging.debug(
+            f"Worker {worker.id} prefetching states for the next nodes {next_nodes}"
+        )
+        self._prefetches[worker.id] = asyncio.get_running_loop().run_in_executor(
+            None, prefetch_states
+        )
+
     async def traverse_object_trees(
         self, worker: TestWorker, params: Params = None
     ) -> None:
@@ -2099,6 +2208,7 @@ class TestGraph(object):
                 # since the loop is discontinued if len(traverse_path) == 0 or root.is_cleanup_ready()
                 # a valid current node with at least one child is guaranteed
                 traverse_path.append(next.pick_child(worker))
+                self.prefetch_nodes(traverse_path[-1], worker)
                 continue
 
             # capture premature cleanup ready cases (only cleanup ready due to unparsed nodes)
@@ -2177,11 +2287,13 @@ class TestGraph(object):
                 else:
                     # inverse DFS
                     traverse_path.append(next.pick_parent(worker))
+                    self.prefetch_nodes(traverse_path[-1], worker)
             elif previous in next.setup_nodes:
 
                 # stop if test is not a setup leaf since parents have higher priority than children
                 if not next.is_setup_ready(worker):
                     traverse_path.append(next.pick_parent(worker))
+                    self.prefetch_nodes(traverse_path[-1], worker)
                     continue
                 else:
                     await self.traverse_node(next, worker, params)
@@ -2211,6 +2323,7 @@ class TestGraph(object):
                 else:
                     # normal DFS
                     traverse_path.append(next.pick_child(worker))
+                    self.prefetch_nodes(traverse_path[-1], worker)
             else:
                 raise AssertionError(
                     "Discontinuous path in the test dependency graph detected"
@@ -2222,5 +2335,8 @@ class TestGraph(object):
         assert traverse_path == [
             root
         ], f"Unfinished traverse path detected {traverse_path}"
+        prefetch = self._prefetches.pop(worker.id, None)
+        if prefetch is not None:
+            await prefetch
         logging.debug(f"Worker {worker.id} ending at the shared root")
         traverse_path.pop()
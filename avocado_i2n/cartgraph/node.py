@@ -30,12 +30,13 @@ from __future__ import annotations
 
 import os
 import re
+import json
 from functools import cmp_to_key
 from typing import Generator
 from typing import Any
 import logging as log
 
-from aexpect.exceptions import ShellCmdError
+from aexpect.exceptions import ShellCmdError, ShellError
 from aexpect import remote_door as door
 from avocado.core.test_id import TestID
 from avocado.core.nrunner.runnable import Runnable
@@ -43,6 +44,7 @@ from virttest.utils_params import Params
 
 from . import TestSwarm, TestWorker, TestObject, NetObject
 from .. import params_parser as param
+from ..session_pool import SessionPool
 
 
 logging = log.getLogger("avocado.job." + __name__)
@@ -394,6 +396,8 @@ class TestNode(Runnable):
 
         self.finished_worker = None
         self.started_worker = None
+        # batch scanned run decisions per worker to be used once
+        self._scanned_states = {}
 
         self._bridged_nodes = []
         self._cloned_nodes = []
@@ -1203,13 +1207,14 @@ class TestNode(Runnable):
                 del vt_params[key]
         super().__init__("avocado-vt", uri, **vt_params)
 
-    def scan_states(self) -> bool:
+    def get_scan_params(self) -> tuple[bool | None, Params]:
         """
-        Scan for present object states to reuse the test from previous runs.
+        Get the parameters to scan for present object states with.
 
-        :returns: whether all required states are available
+        :returns: whether the test should run if decided without a scan (or
+                  none if a scan is needed) and the parameters for the scan
         """
-        should_run = True
+        should_run = None
         node_params = self.params.copy()
 
         is_leaf = True
@@ -1244,8 +1249,27 @@ class TestNode(Runnable):
                 node_params[f"use_env{object_suffix}"] = "no"
             node_params[f"soft_boot{object_suffix}"] = "no"
 
-        if not is_leaf:
-            session = self.started_worker.get_session()
+        if is_leaf:
+            should_run = True
+        return should_run, node_params
+
+    def scan_states(self) -> bool:
+        """
+        Scan for present object states to reuse the test from previous runs.
+
+        :returns: whether all required states are available
+        """
+        worker = self.started_worker
+        if worker.id in self._scanned_states:
+            should_run = self._scanned_states.pop(worker.id)
+            logging.info(
+                f"Should{' ' if should_run else ' not '}run from batch scan {self} by {worker.id}"
+            )
+            return should_run
+
+        should_run, node_params = self.get_scan_params()
+        if should_run is None:
+            session = worker.get_session()
             control_path = os.path.join(
                 self.params["suite_path"], "controls", "pre_state.control"
             )
@@ -1266,10 +1290,109 @@ class TestNode(Runnable):
                         "Could not complete state scan due to control file error"
                     )
         logging.info(
-            f"Should{' ' if should_run else ' not '}run from scan {self} by {self.started_worker.id}"
+            f"Should{' ' if should_run else ' not '}run from scan {self} by {worker.id}"
         )
         return should_run
 
+    @staticmethod
+    def scan_states_batch(test_nodes: list["TestNode"], worker: TestWorker) -> None:
+        """
+        Scan for present object states of multiple test nodes at once.
+
+        :param test_nodes: test nodes to scan states for
+        :param worker: worker to scan the states on
+
+        The results are kept for the next run decision of each node by the
+        same worker unless dropped earlier by any node modifying the states
+        of the same objects and nodes that could not be scanned are left to
+        a scan of their own.
+        """
+        batch_params = {}
+        for test_node in test_nodes:
+            should_run, node_params = test_node.get_scan_params()
+            if should_run is None:
+                batch_params[test_node.id] = node_params
+            else:
+                test_node._scanned_states[worker.id] = should_run
+        if len(batch_params) == 0:
+            return
+
+        logging.info(f"Scanning states of {len(batch_params)} nodes by {worker.id}")
+        session = worker.get_session()
+        control_path = os.path.join(
+            test_nodes[0].params["suite_path"], "controls", "pre_state.control"
+        )
+        mod_control_path = door.set_subcontrol_parameter(control_path, "action", "scan")
+        mod_control_path = door.set_subcontrol_parameter_dict(
+            mod_control_path, "params", batch_params
+        )
+        try:
+            output = door.run_subcontrol(session, mod_control_path)
+        except ShellCmdError as error:
+            logging.warning(f"Could not complete batch state scan: {error}")
+            return
+        match = re.search(r"^SCAN RESULTS: (.+)$", output, flags=re.MULTILINE)
+        if match is None:
+            logging.warning("Could not find any batch state scan results")
+            return
+        results = json.loads(match.group(1))
+        for test_node in test_nodes:
+            # states that could not be checked are scanned again separately
+            states_exist = results.get(test_node.id)
+            if states_exist is not None:
+                test_node._scanned_states[worker.id] = not states_exist
+
+    def prefetch_states(self, worker: TestWorker) -> bool:
+        """
+        Prefetch object states needed by the node into the cache of a worker.
+
+        :param worker: worker expected to traverse the node soon
+        :returns: whether all needed states (if any) were prefetched
+        """
+        node_params = self.params.copy()
+        should_prefetch = False
+        for test_object in self.objects:
+            if test_object.key == "nets":
+                continue
+            object_params = test_object.object_typed_params(self.params)
+            object_state = object_params.get("get_state")
+            if not object_state:
+                continue
+            should_prefetch = True
+
+            # prefetching only considers the shared pool as the setup locations
+            # of other workers will only be known once the node is traversed
+            object_suffix = f"_{test_object.key}_{test_object.long_suffix}"
+            node_params[f"get_location{object_suffix}"] = object_params.get(
+                "get_location", ":" + object_params["shared_pool"]
+            )
+            if test_object.key == "vms":
+                node_params[f"use_env{object_suffix}"] = "no"
+
+        if not should_prefetch:
+            return True
+        logging.info(f"Prefetching states of {self} for {worker.id}")
+        control_path = os.path.join(
+            self.params["suite_path"], "controls", "pre_state.control"
+        )
+        mod_control_path = door.set_subcontrol_parameter(
+            control_path, "action", "prefetch"
+        )
+        mod_control_path = door.set_subcontrol_parameter_dict(
+            mod_control_path, "params", node_params
+        )
+        try:
+            # the shared worker session could be in use by a running test
+            with SessionPool.session(worker.params) as session:
+                door.run_subcontrol(session, mod_control_path)
+        except (ShellError, RuntimeError) as error:
+            logging.warning(
+                f"Prefetching states of {self} for {worker.id} could not be "
+                f"completed: {error}"
+            )
+            return False
+        return True
+
     def sync_states(self, params: Params) -> None:
         """Sync or drop present object states to clean or later skip tests from previous runs."""
         node_params = self.params.copy()
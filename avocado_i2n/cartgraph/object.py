@@ -113,8 +113,8 @@ class TestObject(object):
         # TODO: we don't support recursion at the moment but this is fine
         # for the current implicit assumption of nets->vms->images
         for composite in self.composites:
-            params = params.object_params(composite.suffix)
-        return params.object_params(self.suffix).object_params(self.key)
+            params = param.ParamsView(params, composite.suffix)
+        return param.ParamsView(param.ParamsView(params, self.suffix), self.key)
 
     def update_restrs(self, object_restrs: dict[str, str]) -> None:
         """
@@ -137,7 +137,8 @@ class TestObject(object):
         generic_params = self.recipe.get_params(
             dict_index=self.dict_index, show_dictionaries=verbose
         )
-        self._params_cache = self.object_typed_params(generic_params)
+        # the cache is long-lived and thus independent of the generic parameters
+        self._params_cache = Params(self.object_typed_params(generic_params))
         for key, value in list(self._params_cache.items()):
             if key.startswith("only_") or key.startswith("no_"):
                 restr_type, suffix = key.split("_", maxsplit=1)
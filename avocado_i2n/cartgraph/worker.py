@@ -30,12 +30,10 @@ from __future__ import annotations
 
 import logging as log
 
-import aexpect
-from aexpect.exceptions import ShellTimeoutError
-from aexpect import remote
 from aexpect.client import RemoteSession
 from virttest.utils_params import Params
 
+from ..session_pool import SessionPool
 from . import NetObject
 
 
@@ -79,8 +77,6 @@ class TestSwarm(TestEnvironment):
 class TestWorker(TestEnvironment):
     """A wrapper for a test worker traversing the graph."""
 
-    _session_cache = {}
-
     @property
     def params(self) -> Params:
         """Parameters (cache) property."""
@@ -210,28 +206,4 @@ class TestWorker(TestEnvironment):
         :returns: remote session to the slot determined from current node environment
         """
         log.getLogger("aexpect").parent = log.getLogger("avocado.job")
-
-        address = self.params["nets_shell_host"] + ":" + self.params["nets_shell_port"]
-        cache = type(self)._session_cache
-        session = cache.get(address)
-        if session:
-            # check for corrupted sessions
-            try:
-                logging.debug(
-                    "Remote session health check: " + session.cmd_output("date")
-                )
-            except ShellTimeoutError as error:
-                logging.warning(f"Bad remote session health for {address}!")
-                session = None
-        if not session:
-            session = remote.wait_for_login(
-                self.params["nets_shell_client"],
-                self.params["nets_shell_host"],
-                self.params["nets_shell_port"],
-                self.params["nets_username"],
-                self.params["nets_password"],
-                self.params["nets_shell_prompt"],
-            )
-            cache[address] = session
-
-        return session
+        return SessionPool.get(self.params)
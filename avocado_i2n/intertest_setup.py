@@ -90,6 +90,8 @@ __all__ = [
     "get",
     "set",
     "unset",
+    "gc",
+    "benchmark",
     "collect",
     "create",
     "clean",
@@ -763,6 +765,46 @@ def unset(config: dict[str, Any], tag: str = "") -> None:
     )
 
 
+@with_cartesian_graph
+def gc(config: dict[str, Any], tag: str = "") -> None:
+    """
+    Evict least recently used states from local pools exceeding their quota.
+
+    :param config: command line arguments and run configuration
+    :param tag: extra name identifier for the test to be run
+    """
+    operation = "gc"
+    _parse_and_iterate_for_objects_and_workers(
+        config,
+        tag,
+        {
+            "vm_action": operation,
+            "skip_image_processing": "yes",
+        },
+        "state " + operation,
+    )
+
+
+@with_cartesian_graph
+def benchmark(config: dict[str, Any], tag: str = "") -> None:
+    """
+    Measure the time to first command after restoring vm states of a vm.
+
+    :param config: command line arguments and run configuration
+    :param tag: extra name identifier for the test to be run
+    """
+    operation = "benchmark"
+    _parse_and_iterate_for_objects_and_workers(
+        config,
+        tag,
+        {
+            "vm_action": operation,
+            "skip_image_processing": "yes",
+        },
+        "state " + operation,
+    )
+
+
 def collect(config: dict[str, Any], tag: str = "") -> None:
     """
     Get a new test object (vm, root state) from a pool.
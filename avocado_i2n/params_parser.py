@@ -29,7 +29,9 @@ INTERFACE
 import os
 import copy
 import collections
+import contextlib
 import logging
+from typing import Generator
 
 from virttest import cartesian_config
 from virttest.utils_params import Params
@@ -459,6 +461,193 @@ class Reparsable:
         return new
 
 
+class TrackedParams(Params):
+    """Parameters counting their changes for any views depending on them."""
+
+    #: number of changes to the parameters so far
+    version = 0
+
+    def __setitem__(self, key: str, value: str) -> None:
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self.version += 1
+
+
+class ParamsView(Params):
+    """
+    Parameters of an individual object as a lazy view of its parent parameters.
+
+    The view behaves like the result of :py:meth:`Params.object_params` but
+    resolves object suffixed keys only on access and keeps any changes of its
+    own instead of copying all parent parameters. Any changes of the parent
+    parameters are thus visible in the view until it is copied.
+    """
+
+    def __init__(self, parent: Params, obj_name: str) -> None:
+        """
+        Initialize a view of the parameters of an individual object.
+
+        :param parent: parameters to resolve the object parameters from
+        :param obj_name: name of the object whose suffix is resolved
+        """
+        super().__init__()
+        self.parent = parent
+        self.suffix = "_" + obj_name
+        self.deleted = set()
+        self.version = 0
+        self._ancestors = None
+        self._bases = None
+        self._bases_stamp = None
+
+    def _get_bases(self) -> set[str]:
+        """
+        Get all parameters that could be overridden by their suffixed variants.
+
+        The result is a superset of the parameters with suffixed variants in
+        any parent and is only recomputed when a parent changes so that most
+        parameters skip resolving suffixed variants at all levels.
+
+        :returns: names preceding the view suffix in all parent parameters
+        """
+        if self._ancestors is None:
+            ancestors, params = [], self.parent
+            while isinstance(params, ParamsView):
+                ancestors.append(params)
+                params = params.parent
+            if type(params) is Params:
+                # count changes of the root parameters to detect new suffixed ones
+                params.__class__ = TrackedParams
+            self._ancestors = (ancestors, params)
+        views, root = self._ancestors
+        # untracked root parameters could always have changed
+        root_version = root.version if isinstance(root, TrackedParams) else object()
+        stamp = (root_version, *(view.version for view in views))
+        if stamp != self._bases_stamp:
+            self._bases = {
+                key.split(self.suffix)[0]
+                for params in (root, *views)
+                for key in params.data
+                if self.suffix in key
+            }
+            self._bases_stamp = stamp
+        return self._bases
+
+    def _resolve(self, key: str) -> str:
+        """
+        Resolve a parameter not changed within the view walking the parents once.
+
+        :param key: parameter to resolve
+        :returns: value of the suffixed parameter or else of the parameter itself
+        :raises: :py:class:`KeyError` if the parameter is not available
+        """
+        if key in self.deleted:
+            raise KeyError(key)
+        # suffixed parameters can only be overridden by themselves
+        if self.suffix not in key and key in self._get_bases():
+            with contextlib.suppress(KeyError):
+                return self._resolve_parent(key + self.suffix)
+        return self._resolve_parent(key)
+
+    def _resolve_parent(self, key: str) -> str:
+        """
+        Resolve a parameter from the parent of the view.
+
+        :param key: parameter to resolve
+        :returns: value of the parameter in the parent
+        :raises: :py:class:`KeyError` if the parameter is not available
+        """
+        parent = self.parent
+        if not isinstance(parent, ParamsView):
+            if key not in parent:
+                raise KeyError(key)
+            return parent[key]
+        if key in parent.data:
+            return parent.data[key]
+        return parent._resolve(key)
+
+    def __missing__(self, key: str) -> str:
+        """
+        Resolve a parameter not changed within the view from the parent.
+
+        :param key: parameter to resolve
+        :returns: value of the suffixed parameter or else of the parameter itself
+        :raises: :py:class:`KeyError` if the parameter is not available
+        """
+        return self._resolve(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self.data:
+            return True
+        try:
+            self._resolve(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Generator[str, None, None]:
+        seen = set(self.deleted)
+        for key in self.data:
+            seen.add(key)
+            yield key
+        suffixed = []
+        for key in self.parent:
+            if key.endswith(self.suffix):
+                suffixed.append(key.split(self.suffix)[0])
+            if key not in seen:
+                seen.add(key)
+                yield key
+        for key in suffixed:
+            if key not in seen:
+                seen.add(key)
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self.deleted.discard(key)
+        self.data[key] = value
+        self.version += 1
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.data.pop(key, None)
+        self.deleted.add(key)
+        self.version += 1
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def clear(self) -> None:
+        """Remove all parameters detaching the view from its parent."""
+        self.parent = Params()
+        self.data.clear()
+        self.deleted.clear()
+        self._ancestors = None
+        self._bases_stamp = None
+
+    def copy(self) -> Params:
+        """
+        Copy all parameters resolved by the view detaching them from its parent.
+
+        :returns: independent parameters unaffected by any later parent changes
+        """
+        return Params(dict(self.items()))
+
+    def object_params(self, obj_name: str) -> "ParamsView":
+        """
+        Return a view of the parameters of an individual object.
+
+        :param obj_name: name of the object whose suffix is resolved
+        :returns: a view with this view as its parent
+        """
+        return ParamsView(self, obj_name)
+
+
 ###################################################################
 # overwrite string and overwrite dictionary automation methods
 ###################################################################
@@ -51,7 +51,8 @@ from avocado.core.task.statemachine import TaskStateMachine, Worker
 from avocado.core.dispatcher import SpawnerDispatcher
 from virttest.utils_params import Params
 
-from ..cartgraph import TestGraph, TestWorker, TestNode
+from ..cartgraph import TestGraph, TestNode
+from ..session_pool import SessionPool
 
 
 logging = log.getLogger("avocado.job." + __name__)
@@ -387,9 +388,8 @@ class TestRunner(RunnerInterface):
             self.job.interrupted_reason = str(error)
             summary.add("INTERRUPTED")
 
-        # clean up any test node session cache
-        for session in TestWorker._session_cache.values():
-            session.close()
+        # clean up any test node or pool transfer sessions
+        SessionPool.close()
 
         # TODO: The avocado implementation needs a workaround here:
         # Wait until all messages may have been processed by the
@@ -0,0 +1,284 @@
+# Copyright 2013-2026 Intranet AG and contributors
+#
+# avocado-i2n is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# avocado-i2n is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with avocado-i2n.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module for pooling remote sessions shared among test workers and state pools.
+
+SUMMARY
+------------------------------------------------------
+
+Copyright: Intra2net AG
+
+INTERFACE
+------------------------------------------------------
+
+"""
+
+import time
+import threading
+import contextlib
+import logging as log
+from typing import Generator
+
+from aexpect import remote
+from aexpect.client import RemoteSession
+from aexpect.exceptions import ShellError, ShellCmdError
+from virttest.utils_params import Params
+
+
+logging = log.getLogger("avocado.job." + __name__)
+
+
+class SessionPool:
+    """
+    A pool of reusable remote sessions with lazy health checks.
+
+    Sessions are identified by the remote host address and can either be
+    acquired for exclusive use (e.g. concurrent pool transfers) within a
+    per-host limit or shared among all users of the same host (e.g. a test
+    worker's control session).
+    """
+
+    #: idle sessions per host address available for exclusive use
+    _idle = {}
+    #: number of exclusive sessions per host address (both idle and in use)
+    _count = {}
+    #: persistent session per host address shared among all its users
+    _shared = {}
+    #: host address of each pooled session
+    _addresses = {}
+    #: last time each pooled session was known to be healthy
+    _last_used = {}
+    _lock = threading.Condition()
+
+    @staticmethod
+    def get_address(params: Params) -> str:
+        """
+        Get the address identifying sessions to the same host.
+
+        :param params: configuration parameters
+        :returns: address in the format "host:port"
+        """
+        return params["nets_shell_host"] + ":" + params["nets_shell_port"]
+
+    @staticmethod
+    def login(params: Params) -> RemoteSession:
+        """
+        Create a new session to a remote host.
+
+        :param params: configuration parameters
+        :returns: a newly created session
+        """
+        return remote.wait_for_login(
+            params["nets_shell_client"],
+            params["nets_shell_host"],
+            params["nets_shell_port"],
+            params["nets_username"],
+            params["nets_password"],
+            params["nets_shell_prompt"],
+            timeout=params.get_numeric("session_pool_login_timeout", 240),
+        )
+
+    @classmethod
+    def check(cls, session: RemoteSession, params: Params) -> bool:
+        """
+        Check the health of a session only if it was idle for long enough.
+
+        :param session: session to check
+        :param params: configuration parameters
+        :returns: whether the session can be reused
+        """
+        if not session.is_alive():
+            return False
+        interval = params.get_numeric("session_pool_check_interval", 60)
+        if time.monotonic() - cls._last_used.get(session, 0) < interval:
+            return True
+        try:
+            logging.debug(
+                "Remote session health check: "
+                + session.cmd_output(
+                    "date", timeout=params.get_numeric("session_pool_check_timeout", 10)
+                )
+            )
+        except ShellError as error:
+            logging.warning(f"Bad remote session health: {error}")
+            return False
+        cls._last_used[session] = time.monotonic()
+        return True
+
+    @classmethod
+    def acquire(cls, params: Params) -> RemoteSession:
+        """
+        Acquire a session to a remote host for exclusive use.
+
+        :param params: configuration parameters
+        :returns: a reused healthy session or a newly created one
+        :raises: :py:class:`RuntimeError` if the per-host session limit is not
+                 freed up within the configured timeout
+        """
+        address = cls.get_address(params)
+        limit = params.get_numeric("session_pool_limit", 4)
+        timeout = params.get_numeric("session_pool_timeout", 300)
+        deadline = time.monotonic() + timeout
+        while True:
+            with cls._lock:
+                cls.evict(params)
+                idle = cls._idle.setdefault(address, [])
+                session = idle.pop() if idle else None
+                if session is None:
+                    count = cls._count.get(address, 0)
+                    if count < limit:
+                        cls._count[address] = count + 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not cls._lock.wait(remaining):
+                        raise RuntimeError(
+                            f"Waiting for a free session to {address} took more "
+                            f"than the allowed {timeout} seconds"
+                        )
+                    continue
+            if cls.check(session, params):
+                return session
+            cls.discard(session)
+
+        try:
+            session = cls.login(params)
+        except Exception:
+            with cls._lock:
+                cls._count[address] -= 1
+                cls._lock.notify()
+            raise
+        with cls._lock:
+            cls._addresses[session] = address
+            cls._last_used[session] = time.monotonic()
+        return session
+
+    @classmethod
+    def release(cls, session: RemoteSession) -> None:
+        """
+        Release an exclusively acquired session back to the pool.
+
+        :param session: session to release
+        """
+        with cls._lock:
+            address = cls._addresses.get(session)
+            if address is None:
+                # the pool was closed while the session was in use
+                session.close()
+                return
+            cls._idle.setdefault(address, []).append(session)
+            cls._last_used[session] = time.monotonic()
+            cls._lock.notify()
+
+    @classmethod
+    def discard(cls, session: RemoteSession) -> None:
+        """
+        Close and forget an exclusively acquired session.
+
+        :param session: session to discard
+        """
+        with cls._lock:
+            address = cls._addresses.pop(session, None)
+            cls._last_used.pop(session, None)
+            if address is not None:
+                cls._count[address] -= 1
+            cls._lock.notify()
+        session.close()
+
+    @classmethod
+    @contextlib.contextmanager
+    def session(cls, params: Params) -> Generator[RemoteSession, None, None]:
+        """
+        Use a session to a remote host exclusively within a context.
+
+        :param params: configuration parameters
+        """
+        session = cls.acquire(params)
+        try:
+            yield session
+        except ShellCmdError:
+            # a failed command does not affect the session itself
+            cls.release(session)
+            raise
+        except ShellError:
+            # the session state is unknown and thus not reusable
+            cls.discard(session)
+            raise
+        except BaseException:
+            cls.release(session)
+            raise
+        else:
+            cls.release(session)
+
+    @classmethod
+    def get(cls, params: Params) -> RemoteSession:
+        """
+        Get a persistent session to a remote host shared by all its users.
+
+        :param params: configuration parameters
+        :returns: a previously shared healthy session or a newly created one
+        """
+        address = cls.get_address(params)
+        with cls._lock:
+            session = cls._shared.get(address)
+        if session is not None:
+            if cls.check(session, params):
+                return session
+            logging.warning(f"Reconnecting bad remote session to {address}")
+            with cls._lock:
+                cls._shared.pop(address, None)
+                cls._last_used.pop(session, None)
+            session.close()
+        session = cls.login(params)
+        with cls._lock:
+            cls._shared[address] = session
+            cls._last_used[session] = time.monotonic()
+        return session
+
+    @classmethod
+    def evict(cls, params: Params) -> None:
+        """
+        Close all exclusive sessions that were idle for too long.
+
+        :param params: configuration parameters
+        """
+        idle_timeout = params.get_numeric("session_pool_idle_timeout", 600)
+        now = time.monotonic()
+        with cls._lock:
+            for address, idle in cls._idle.items():
+                for session in list(idle):
+                    if now - cls._last_used.get(session, 0) > idle_timeout:
+                        logging.debug(f"Evicting idle remote session to {address}")
+                        idle.remove(session)
+                        cls._addresses.pop(session, None)
+                        cls._last_used.pop(session, None)
+                        cls._count[address] -= 1
+                        session.close()
+
+    @classmethod
+    def close(cls) -> None:
+        """Close all idle and shared sessions."""
+        with cls._lock:
+            for idle in cls._idle.values():
+                for session in idle:
+                    session.close()
+            for session in cls._shared.values():
+                session.close()
+            cls._idle.clear()
+            cls._count.clear()
+            cls._shared.clear()
+            cls._addresses.clear()
+            cls._last_used.clear()
+            cls._lock.notify_all()
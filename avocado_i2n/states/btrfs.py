@@ -25,24 +25,118 @@ INTERFACE
 ------------------------------------------------------
 
 """
+
+import os
+import logging as log
 from typing import Any
 
+from avocado.utils import process
+from virttest import env_process
 from virttest.utils_params import Params
 
 from .setup import StateBackend
 
 
+logging = log.getLogger("avocado.job." + __name__)
+
+#: inode number of the root directory of every Btrfs subvolume
+BTRFS_FIRST_FREE_OBJECTID = 256
+
+
 class BtrfsBackend(StateBackend):
-    """Backend manipulating states as Btrfs volume snapshots."""
+    """
+    Backend manipulating image states as Btrfs subvolume snapshots.
+
+    The directory of each image is a writable subvolume (the pointer to the
+    current state) while each state is a read-only snapshot of it stored in
+    the swarm pool so that all state operations are copy-on-write and thus
+    independent of the image size.
+
+    .. note:: Each image requires its own directory named after it within the
+        images base directory (e.g. ``image_name = image1/image``) as the entire
+        directory is snapshotted and restored along with the image.
+    """
+
+    @staticmethod
+    def get_image_path(params: Params) -> str:
+        """
+        Get the path to the image file.
+
+        :param params: configuration parameters
+        :returns: absolute path to the image
+        """
+        image_path = params["image_name"]
+        if not os.path.isabs(image_path):
+            image_path = os.path.join(params["images_base_dir"], image_path)
+        return os.path.normpath(image_path)
 
     @classmethod
-    def show(cls, params: Params, object: Any = None) -> None:
+    def get_pointer_dir(cls, params: Params) -> str:
+        """
+        Get the path to the writable subvolume containing the image.
+
+        :param params: configuration parameters
+        :returns: path to the image directory
+        :raises: :py:class:`ValueError` if the image is not in its own directory
+        """
+        pointer_dir = os.path.normpath(
+            os.path.join(params["images_base_dir"], params["images"])
+        )
+        image_path = cls.get_image_path(params)
+        if os.path.dirname(image_path) != pointer_dir:
+            raise ValueError(
+                f"The image {image_path} must be placed in its own subvolume "
+                f"{pointer_dir} not shared with other images"
+            )
+        return pointer_dir
+
+    @staticmethod
+    def get_states_dir(params: Params) -> str:
+        """
+        Get the path to the directory containing all state snapshots of the image.
+
+        :param params: configuration parameters
+        :returns: path to the states directory in the swarm pool
+        """
+        return os.path.join(params["swarm_pool"], params["object_id"], params["images"])
+
+    @staticmethod
+    def _subvolume_exists(path: str) -> bool:
+        """
+        Check whether a subvolume exists.
+
+        :param path: path to the subvolume
+        :returns: whether the subvolume exists
+        """
+        result = process.run(
+            f"btrfs subvolume show {path}", ignore_status=True, sudo=True
+        )
+        return result.exit_status == 0
+
+    @classmethod
+    def show(cls, params: Params, object: Any = None) -> list[str]:
         """
         Return a list of available states of a specific type.
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement Btrfs states based on demand.")
+        states_dir = cls.get_states_dir(params)
+        logging.debug(
+            f"Showing Btrfs states for {params['vms']}/{params['images']} in {states_dir}"
+        )
+        if not os.path.isdir(states_dir):
+            return []
+        states = []
+        with os.scandir(states_dir) as entries:
+            for entry in entries:
+                # the root directory of any subvolume has the first free inode
+                if (
+                    entry.is_dir(follow_symlinks=False)
+                    and entry.stat(follow_symlinks=False).st_ino
+                    == BTRFS_FIRST_FREE_OBJECTID
+                ):
+                    states.append(entry.name)
+        return sorted(states)
 
     @classmethod
     def get(cls, params: Params, object: Any = None) -> None:
@@ -51,7 +145,13 @@ class BtrfsBackend(StateBackend):
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement Btrfs states based on demand.")
+        vm_name, image_name = params["vms"], params["images"]
+        pointer_dir = cls.get_pointer_dir(params)
+        state_dir = os.path.join(cls.get_states_dir(params), params["get_state"])
+        logging.info(f"Restoring {vm_name}/{image_name} to state {params['get_state']}")
+        if cls._subvolume_exists(pointer_dir):
+            process.run(f"btrfs subvolume delete {pointer_dir}", sudo=True)
+        process.run(f"btrfs subvolume snapshot {state_dir} {pointer_dir}", sudo=True)
 
     @classmethod
     def set(cls, params: Params, object: Any = None) -> None:
@@ -60,7 +160,15 @@ class BtrfsBackend(StateBackend):
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement Btrfs states based on demand.")
+        vm_name, image_name = params["vms"], params["images"]
+        pointer_dir = cls.get_pointer_dir(params)
+        states_dir = cls.get_states_dir(params)
+        logging.info(
+            f"Taking a snapshot '{params['set_state']}' of {vm_name}/{image_name}"
+        )
+        os.makedirs(states_dir, exist_ok=True)
+        state_dir = os.path.join(states_dir, params["set_state"])
+        process.run(f"btrfs subvolume snapshot -r {pointer_dir} {state_dir}", sudo=True)
 
     @classmethod
     def unset(cls, params: Params, object: Any = None) -> None:
@@ -69,16 +177,36 @@ class BtrfsBackend(StateBackend):
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement Btrfs states based on demand.")
+        vm_name, image_name = params["vms"], params["images"]
+        state_dir = os.path.join(cls.get_states_dir(params), params["unset_state"])
+        logging.info(
+            f"Removing snapshot '{params['unset_state']}' of {vm_name}/{image_name}"
+        )
+        process.run(f"btrfs subvolume delete {state_dir}", sudo=True)
 
     @classmethod
-    def check_root(cls, params: Params, object: Any = None) -> None:
+    def check_root(cls, params: Params, object: Any = None) -> bool:
         """
         Check whether a root state or essentially the object exists.
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement Btrfs states based on demand.")
+        vm_name, image_name = params["vms"], params["images"]
+        pointer_dir = cls.get_pointer_dir(params)
+        logging.debug(
+            f"Checking whether {vm_name}/{image_name} exists in {pointer_dir}"
+        )
+        if object is not None and object.is_alive():
+            logging.info(
+                "The required virtual machine %s is alive and it shouldn't be", vm_name
+            )
+            return False
+        if cls._subvolume_exists(pointer_dir):
+            logging.info(f"The required subvolume {pointer_dir} exists")
+            return True
+        else:
+            logging.info(f"The required subvolume {pointer_dir} doesn't exist")
+            return False
 
     @classmethod
     def set_root(cls, params: Params, object: Any = None) -> None:
@@ -86,14 +214,35 @@ class BtrfsBackend(StateBackend):
         Set a root state to provide object existence.
 
         All arguments match the base class.
+
+        Create a subvolume for the image directory and the image in it.
         """
-        raise NotImplementedError("Implement Btrfs states based on demand.")
+        vm_name = params["vms"]
+        if object is not None and object.is_alive():
+            object.destroy(gracefully=params.get_boolean("soft_boot", True))
+        pointer_dir = cls.get_pointer_dir(params)
+        logging.info(f"Creating original subvolume {pointer_dir} for {vm_name}")
+        os.makedirs(os.path.dirname(pointer_dir), exist_ok=True)
+        process.run(f"btrfs subvolume create {pointer_dir}", sudo=True)
+
+        image_path = cls.get_image_path(params)
+        logging.info("Creating image %s for %s", image_path, vm_name)
+        params.update({"create_image": "yes", "force_create_image": "yes"})
+        env_process.preprocess_image(None, params, image_path)
 
     @classmethod
     def unset_root(cls, params: Params, object: Any = None) -> None:
         """
         Unset a root state to prevent object existence.
 
-        All arguments match the base class and in addition:
+        All arguments match the base class.
+
+        Remove the subvolume of the image directory while keeping all
+        state snapshots since these don't depend on it.
         """
-        raise NotImplementedError("Implement Btrfs states based on demand.")
+        vm_name = params["vms"]
+        if object is not None and object.is_alive():
+            object.destroy(gracefully=params.get_boolean("soft_boot", True))
+        pointer_dir = cls.get_pointer_dir(params)
+        logging.info(f"Removing original subvolume {pointer_dir} for {vm_name}")
+        process.run(f"btrfs subvolume delete {pointer_dir}", sudo=True)
@@ -33,6 +33,7 @@ INTERFACE
 
 import os
 import re
+import json
 import logging
 import shutil
 import time
@@ -44,11 +45,18 @@ from avocado.utils import lv_utils
 from virttest import env_process
 from virttest.utils_params import Params
 
-from .setup import StateBackend
+from .setup import StateBackend, StateInventory
+from .pool import image_lock
 
 
 class LVMBackend(StateBackend):
-    """Backend manipulating states as logical volume snapshots."""
+    """
+    Backend manipulating states as thin logical volume snapshots.
+
+    All objects on a host share one long-lived volume group and thin pool
+    with the logical volumes of each object prefixed by the object's name
+    while all present logical volumes are listed once per state operation.
+    """
 
     @classmethod
     def _get_image_mount_loc(cls, params: Params) -> str:
@@ -67,6 +75,68 @@ class LVMBackend(StateBackend):
         else:
             return params["images_base_dir"]
 
+    @staticmethod
+    def get_volume_name(params: Params, name: str) -> str:
+        """
+        Get the name of a logical volume of an object in the shared volume group.
+
+        :param params: configuration parameters
+        :param name: name of the logical volume within the object
+        :returns: name of the logical volume unique among all objects
+        """
+        return f"{params['vms']}_{params['images']}_{name}"
+
+    @staticmethod
+    def _list_volumes(params: Params, object: Any = None) -> dict[str, set[str]]:
+        """
+        List all volume groups and logical volumes on the host.
+
+        All arguments match the base class and in addition:
+
+        :returns: names of logical volumes per volume group
+        :raises: :py:class:`process.CmdError` if the volumes cannot be listed
+        """
+        # volume groups without any logical volumes are only listed by vgs
+        result = process.run("vgs --reportformat json -o vg_name", sudo=True)
+        volumes = {}
+        for report in json.loads(result.stdout_text)["report"]:
+            for group in report["vg"]:
+                volumes[group["vg_name"]] = set()
+        result = process.run("lvs --reportformat json -o vg_name,lv_name", sudo=True)
+        for report in json.loads(result.stdout_text)["report"]:
+            for volume in report["lv"]:
+                volumes.setdefault(volume["vg_name"], set()).add(volume["lv_name"])
+        return volumes
+
+    @classmethod
+    def get_volumes(cls, params: Params, object: Any = None) -> set[str] | None:
+        """
+        Get the names of all logical volumes in the volume group of an object.
+
+        All arguments match the base class and in addition:
+
+        :returns: names of the logical volumes or none if the volume group is missing
+
+        The volumes are listed anew for each state operation as other processes
+        on the host could create or remove volumes at any time.
+        """
+        volumes = StateInventory.reuse(cls._list_volumes, params, object)
+        vg_volumes = volumes.get(params["vg_name"])
+        return set(vg_volumes) if vg_volumes is not None else None
+
+    @staticmethod
+    def _remove_volumes(vg_name: str, lv_names: list[str]) -> None:
+        """
+        Remove logical volumes from the host.
+
+        :param vg_name: name of the volume group
+        :param lv_names: names of the logical volumes
+        """
+        if not lv_names:
+            return
+        volumes = " ".join(f"{vg_name}/{lv_name}" for lv_name in lv_names)
+        process.run(f"lvremove -f {volumes}", sudo=True)
+
     @classmethod
     def show(cls, params: Params, object: Any = None) -> list[str]:
         """
@@ -74,7 +144,11 @@ class LVMBackend(StateBackend):
 
         All arguments match the base class.
         """
-        return lv_utils.lv_list(params["vg_name"])
+        prefix = cls.get_volume_name(params, "")
+        volumes = cls.get_volumes(params, object) or set()
+        states = [v[len(prefix) :] for v in volumes if v.startswith(prefix)]
+        # the original volume is the root rather than a state
+        return sorted(s for s in states if s != params["lv_name"])
 
     @classmethod
     def get(cls, params: Params, object: Any = None) -> None:
@@ -83,29 +157,28 @@ class LVMBackend(StateBackend):
 
         All arguments match the base class.
         """
-        vm_name = params["vms"]
+        vm_name, vg_name = params["vms"], params["vg_name"]
         mount_loc = cls._get_image_mount_loc(params)
-        params["lv_snapshot_name"] = params["get_state"]
+        pointer = cls.get_volume_name(params, params["lv_pointer_name"])
+        snapshot = cls.get_volume_name(params, params["get_state"])
         if mount_loc:
             # mount to avoid not-mounted errors
             try:
-                lv_utils.lv_mount(
-                    params["vg_name"], params["lv_pointer_name"], mount_loc
-                )
+                lv_utils.lv_mount(vg_name, pointer, mount_loc)
             except lv_utils.LVException:
                 pass
-            lv_utils.lv_umount(params["vg_name"], params["lv_pointer_name"])
+            lv_utils.lv_umount(vg_name, pointer)
         try:
             logging.info("Restoring %s to state %s", vm_name, params["get_state"])
-            lv_utils.lv_remove(params["vg_name"], params["lv_pointer_name"])
-            lv_utils.lv_take_snapshot(
-                params["vg_name"], params["lv_snapshot_name"], params["lv_pointer_name"]
+            cls._remove_volumes(vg_name, [pointer])
+            process.run(
+                f"lvcreate --snapshot --setactivationskip n --name {pointer} "
+                f"{vg_name}/{snapshot}",
+                sudo=True,
             )
         finally:
             if mount_loc:
-                lv_utils.lv_mount(
-                    params["vg_name"], params["lv_pointer_name"], mount_loc
-                )
+                lv_utils.lv_mount(vg_name, pointer, mount_loc)
 
     @classmethod
     def set(cls, params: Params, object: Any = None) -> None:
@@ -114,11 +187,12 @@ class LVMBackend(StateBackend):
 
         All arguments match the base class.
         """
-        vm_name = params["vms"]
-        params["lv_snapshot_name"] = params["set_state"]
+        vm_name, vg_name = params["vms"], params["vg_name"]
+        pointer = cls.get_volume_name(params, params["lv_pointer_name"])
+        snapshot = cls.get_volume_name(params, params["set_state"])
         logging.info("Taking a snapshot '%s' of %s", params["set_state"], vm_name)
-        lv_utils.lv_take_snapshot(
-            params["vg_name"], params["lv_pointer_name"], params["lv_snapshot_name"]
+        process.run(
+            f"lvcreate --snapshot --name {snapshot} {vg_name}/{pointer}", sudo=True
         )
 
     @classmethod
@@ -134,9 +208,9 @@ class LVMBackend(StateBackend):
         lv_pointer = params["lv_pointer_name"]
         if params["unset_state"] == lv_pointer:
             raise ValueError("Cannot unset built-in state '%s'" % lv_pointer)
-        params["lv_snapshot_name"] = params["unset_state"]
-        logging.info("Removing snapshot %s of %s", params["lv_snapshot_name"], vm_name)
-        lv_utils.lv_remove(params["vg_name"], params["lv_snapshot_name"])
+        logging.info("Removing snapshot %s of %s", params["unset_state"], vm_name)
+        snapshot = cls.get_volume_name(params, params["unset_state"])
+        cls._remove_volumes(params["vg_name"], [snapshot])
 
     @classmethod
     def check_root(cls, params: Params, object: Any = None) -> bool:
@@ -148,7 +222,8 @@ class LVMBackend(StateBackend):
         vm_name = params["vms"]
         image_name = params["image_name"]
         logging.debug("Checking whether %s exists (root state requested)", vm_name)
-        if lv_utils.lv_check(params["vg_name"], params["lv_name"]):
+        volumes = cls.get_volumes(params, object) or set()
+        if cls.get_volume_name(params, params["lv_name"]) in volumes:
             logging.info(
                 "The required virtual machine %s's %s (%s) exists",
                 vm_name,
@@ -172,37 +247,54 @@ class LVMBackend(StateBackend):
 
         All arguments match the base class.
 
-        Create a disk, virtual group, thin pool and logical volume
-        for each object.
+        Create a thin logical volume for each object reusing the volume
+        group and thin pool of the host or creating them if missing.
         """
-        vm_name = params["vms"]
+        vm_name, vg_name = params["vms"], params["vg_name"]
+        pool_name = params["lv_pool_name"]
         mount_loc = cls._get_image_mount_loc(params)
         logging.info("Creating original logical volume for %s", vm_name)
-        vg_setup(
-            params["vg_name"],
-            params["disk_vg_size"],
-            params["disk_basedir"],
-            params["disk_sparse_filename"],
-            params["use_tmpfs"] == "yes",
-        )
-        lv_utils.lv_create(
-            params["vg_name"],
-            params["lv_name"],
-            params["lv_size"],
-            # NOTE: call by key to keep good argument order which wasn't
-            # accepted upstream for backward API compatibility
-            pool_name=params["lv_pool_name"],
-            pool_size=params["lv_pool_size"],
+        # other processes on the host could be creating the same shared volumes
+        os.makedirs(params["disk_basedir"], exist_ok=True)
+        with image_lock(os.path.join(params["disk_basedir"], vg_name)):
+            volumes = cls._list_volumes(params, object).get(vg_name)
+            if volumes is None:
+                logging.info("Creating shared volume group %s", vg_name)
+                vg_setup(
+                    vg_name,
+                    params["disk_vg_size"],
+                    params["disk_basedir"],
+                    params["disk_sparse_filename"],
+                    params["use_tmpfs"] == "yes",
+                )
+                volumes = set()
+            if pool_name not in volumes:
+                logging.info("Creating shared thin pool %s", pool_name)
+                process.run(
+                    f"lvcreate --thinpool {pool_name} --size {params['lv_pool_size']} "
+                    f"{vg_name} -y",
+                    sudo=True,
+                )
+
+        volume = cls.get_volume_name(params, params["lv_name"])
+        pointer = cls.get_volume_name(params, params["lv_pointer_name"])
+        cls._remove_volumes(vg_name, sorted(volumes & {volume, pointer}))
+        process.run(
+            f"lvcreate --name {volume} --virtualsize {params['lv_size']} "
+            f"--thin {vg_name}/{pool_name} -y",
+            sudo=True,
         )
-        lv_utils.lv_take_snapshot(
-            params["vg_name"], params["lv_name"], params["lv_pointer_name"]
+        process.run(
+            f"lvcreate --snapshot --setactivationskip n --name {pointer} "
+            f"{vg_name}/{volume}",
+            sudo=True,
         )
         if mount_loc:
             if not os.path.exists(mount_loc):
                 os.mkdir(mount_loc)
             lv_utils.lv_mount(
-                params["vg_name"],
-                params["lv_pointer_name"],
+                vg_name,
+                pointer,
                 mount_loc,
                 create_filesystem="ext4",
             )
@@ -231,23 +323,23 @@ class LVMBackend(StateBackend):
 
         :raises: :py:class:`exceptions.TestWarn` if permanent vm was detected
 
-        Remove the disk, virtual group, thin pool and logical volume
-        of each object.
+        Remove all logical volumes of each object while keeping the shared
+        volume group and thin pool of the host.
         """
-        vm_name = params["vms"]
+        vm_name, vg_name = params["vms"], params["vg_name"]
         mount_loc = cls._get_image_mount_loc(params)
+        pointer = cls.get_volume_name(params, params["lv_pointer_name"])
         logging.info("Removing original logical volume for %s", vm_name)
+        volumes = cls.get_volumes(params, object)
         try:
             if mount_loc:
-                if lv_utils.vg_check(params["vg_name"]):
+                if volumes is not None and pointer in volumes:
                     # mount to avoid not-mounted errors
                     try:
-                        lv_utils.lv_mount(
-                            params["vg_name"], params["lv_pointer_name"], mount_loc
-                        )
+                        lv_utils.lv_mount(vg_name, pointer, mount_loc)
                     except lv_utils.LVException:
                         pass
-                    lv_utils.lv_umount(params["vg_name"], params["lv_pointer_name"])
+                    lv_utils.lv_umount(vg_name, pointer)
                 if os.path.exists(mount_loc):
                     try:
                         os.rmdir(mount_loc)
@@ -260,14 +352,11 @@ class LVMBackend(StateBackend):
                             "Permanent vm %s was detected but cannot be "
                             "removed automatically" % vm_name
                         )
-            vg_cleanup(
-                params["disk_sparse_filename"],
-                os.path.join(params["disk_basedir"], params["vg_name"]),
-                params["vg_name"],
-                None,
-                params["use_tmpfs"] == "yes",
+            prefix = cls.get_volume_name(params, "")
+            cls._remove_volumes(
+                vg_name, sorted(v for v in volumes or [] if v.startswith(prefix))
             )
-        except exceptions.TestError as ex:
+        except (exceptions.TestError, process.CmdError) as ex:
             logging.error(ex)
 
 
@@ -26,6 +26,8 @@ INTERFACE
 
 """
 
+import tempfile
+import logging as log
 from typing import Any
 
 from virttest.utils_params import Params
@@ -33,17 +35,65 @@ from virttest.utils_params import Params
 from .setup import StateBackend
 
 
+logging = log.getLogger("avocado.job." + __name__)
+
+
 class LXCBackend(StateBackend):
-    """Backend manipulating states as LXC container snapshots."""
+    """
+    Backend manipulating states as LXC container snapshots.
+
+    The container of a net (its worker slot) is identified by the net's host
+    and each state is a container snapshot whose name is allocated by LXC so
+    that the state name is instead stored as the snapshot comment.
+
+    .. note:: Containers are stopped for snapshot operations and started again
+        if they were running before.
+    """
+
+    @staticmethod
+    def get_container(params: Params) -> Any:
+        """
+        Get the container whose states are manipulated.
+
+        :param params: configuration parameters
+        :returns: LXC container of the net
+        """
+        import lxc
+
+        return lxc.Container(params["nets_host"])
+
+    @staticmethod
+    def get_snapshots(container: Any) -> dict[str, str]:
+        """
+        Get the snapshot names of all states of a container.
+
+        :param container: LXC container to list the snapshots of
+        :returns: snapshot names indexed by the state names in their comments
+        """
+        snapshots = {}
+        for snapshot_name, comment_path, _, _ in container.snapshot_list():
+            if not comment_path:
+                continue
+            try:
+                with open(comment_path) as handle:
+                    state_name = handle.read().strip()
+            except FileNotFoundError:
+                continue
+            snapshots[state_name] = snapshot_name
+        return snapshots
 
     @classmethod
-    def show(cls, params: Params, object: Any = None) -> None:
+    def show(cls, params: Params, object: Any = None) -> list[str]:
         """
         Return a list of available states of a specific type.
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement LXC states based on demand.")
+        container = cls.get_container(params)
+        logging.debug(f"Showing LXC states for container {container.name}")
+        if not container.defined:
+            return []
+        return list(cls.get_snapshots(container).keys())
 
     @classmethod
     def get(cls, params: Params, object: Any = None) -> None:
@@ -52,7 +102,20 @@ class LXCBackend(StateBackend):
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement LXC states based on demand.")
+        container = cls.get_container(params)
+        state_name = params["get_state"]
+        snapshot_name = cls.get_snapshots(container)[state_name]
+        logging.info(f"Restoring container {container.name} to state {state_name}")
+        was_running = container.running
+        if was_running:
+            container.stop()
+        # restoring without a new name replaces the container itself
+        if not container.snapshot_restore(snapshot_name):
+            raise RuntimeError(
+                f"Could not restore container {container.name} to state {state_name}"
+            )
+        if was_running:
+            container.start()
 
     @classmethod
     def set(cls, params: Params, object: Any = None) -> None:
@@ -61,7 +124,22 @@ class LXCBackend(StateBackend):
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement LXC states based on demand.")
+        container = cls.get_container(params)
+        state_name = params["set_state"]
+        logging.info(f"Taking a snapshot '{state_name}' of container {container.name}")
+        was_running = container.running
+        if was_running:
+            container.stop()
+        with tempfile.NamedTemporaryFile("w", suffix=".comment") as comment:
+            comment.write(state_name)
+            comment.flush()
+            snapshot_name = container.snapshot(comment.name)
+        if was_running:
+            container.start()
+        if not snapshot_name:
+            raise RuntimeError(
+                f"Could not take a snapshot '{state_name}' of container {container.name}"
+            )
 
     @classmethod
     def unset(cls, params: Params, object: Any = None) -> None:
@@ -70,16 +148,29 @@ class LXCBackend(StateBackend):
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement LXC states based on demand.")
+        container = cls.get_container(params)
+        state_name = params["unset_state"]
+        snapshot_name = cls.get_snapshots(container)[state_name]
+        logging.info(f"Removing snapshot '{state_name}' of container {container.name}")
+        if not container.snapshot_destroy(snapshot_name):
+            raise RuntimeError(
+                f"Could not remove snapshot '{state_name}' of container {container.name}"
+            )
 
     @classmethod
-    def check_root(cls, params: Params, object: Any = None) -> None:
+    def check_root(cls, params: Params, object: Any = None) -> bool:
         """
         Check whether a root state or essentially the object exists.
 
         All arguments match the base class.
         """
-        raise NotImplementedError("Implement LXC states based on demand.")
+        container = cls.get_container(params)
+        if container.defined:
+            logging.info(f"The required container {container.name} exists")
+            return True
+        else:
+            logging.info(f"The required container {container.name} doesn't exist")
+            return False
 
     @classmethod
     def set_root(cls, params: Params, object: Any = None) -> None:
@@ -87,14 +178,31 @@ class LXCBackend(StateBackend):
         Set a root state to provide object existence.
 
         All arguments match the base class.
+
+        Create the container from a configurable template.
         """
-        raise NotImplementedError("Implement LXC states based on demand.")
+        container = cls.get_container(params)
+        template = params.get("lxc_template", "download")
+        template_args = tuple(params.get("lxc_template_args", "").split())
+        logging.info(f"Creating container {container.name} from template {template}")
+        if not container.create(template, 0, template_args):
+            raise RuntimeError(f"Could not create container {container.name}")
 
     @classmethod
     def unset_root(cls, params: Params, object: Any = None) -> None:
         """
         Unset a root state to prevent object existence.
 
-        All arguments match the base class and in addition:
+        All arguments match the base class.
+
+        Remove the container along with all its snapshots since these are
+        stored within the container.
         """
-        raise NotImplementedError("Implement LXC states based on demand.")
+        container = cls.get_container(params)
+        if container.running:
+            container.stop()
+        for snapshot_name, _, _, _ in container.snapshot_list():
+            container.snapshot_destroy(snapshot_name)
+        logging.info(f"Removing container {container.name}")
+        if not container.destroy():
+            raise RuntimeError(f"Could not remove container {container.name}")
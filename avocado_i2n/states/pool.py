@@ -28,59 +28,74 @@ INTERFACE
 
 import os
 import time
-from typing import Any
+from typing import Any, Generator
 import logging as log
 
 import shutil
+import glob
 import contextlib
 import fcntl
 import errno
 import json
+import socket
+import asyncio
+import threading
+import select
+import ctypes
+import ctypes.util
+import tempfile
+import atexit
+import heapq
+import struct
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from aexpect import remote, ops_linux as ops
 from aexpect.client import RemoteSession
 from avocado.utils import crypto
 from virttest.utils_params import Params
+from virttest import utils_numeric
 
 from virttest.qemu_storage import QemuImg
 
-from .setup import StateBackend
+from ..session_pool import SessionPool
+from .setup import StateBackend, StateInventory
 
 
 logging = log.getLogger("avocado.job." + __name__)
 
 
 #: skip waiting on locks if we only read from the pool for all processes
+#: (local readers share locks and thus rarely need this)
 #: WARNING: use it only if you know what you are doing
 SKIP_LOCKS = False
 
+#: ioctl request number for cloning a file on copy-on-write filesystems
+FICLONE = 0x40049409
+
 
 class TransferOps:
     """A small namespace for pool transfer operations of multiple types."""
 
-    _session_cache = {}
+    #: cached remote pool trees per pool location if listing caching is enabled
+    #: (kept per thread for concurrently processed parametric objects)
+    _listings = threading.local()
 
     @classmethod
-    def get_session(cls, host: str, params: Params) -> RemoteSession:
+    @contextlib.contextmanager
+    def cached_listings(cls) -> Generator[None, None, None]:
         """
-        Get a possibly reused session to the remote location.
+        Cache all remote pool listings within a context like a state check.
 
-        :param host: remote host name for the remote location
-        :param params: configuration parameters
-        :returns: a new session or previously cached session
+        Nested contexts reuse the cache of the outermost context.
         """
-        session = cls._session_cache.get(host)
-        if not session:
-            session = remote.remote_login(
-                params["nets_shell_client"],
-                params["nets_shell_host"],
-                params["nets_shell_port"],
-                params["nets_username"],
-                params["nets_password"],
-                params["nets_shell_prompt"],
-            )
-            cls._session_cache[host] = session
-        return session
+        if getattr(cls._listings, "cache", None) is not None:
+            yield
+            return
+        cls._listings.cache = {}
+        try:
+            yield
+        finally:
+            cls._listings.cache = None
 
     @classmethod
     def list_paths(cls, pool_path: str, params: Params) -> list[str]:
@@ -110,10 +125,18 @@ class TransferOps:
         hosts, path = pool_path.split(":")
         if hosts != "":
             return cls.compare_remote(cache_path, pool_path, params)
-        elif ";" in path:
-            return cls.compare_link(cache_path, path.replace(";", ""), params)
-        else:
-            return cls.compare_local(cache_path, path, params)
+        # comparing only reads from the pool and can thus happen concurrently
+        update_timeout = params.get_numeric("update_pool_timeout", 300)
+        with image_lock(
+            path.replace(";", ""),
+            update_timeout,
+            shared=True,
+            fair=params.get_boolean("pool_lock_fair"),
+        ):
+            if ";" in path:
+                return cls.compare_link(cache_path, path.replace(";", ""), params)
+            else:
+                return cls.compare_local(cache_path, path, params)
 
     @classmethod
     def download(cls, cache_path: str, pool_path: str, params: Params) -> None:
@@ -125,12 +148,15 @@ class TransferOps:
         :param params: configuration parameters
         """
         hosts, path = pool_path.split(":")
-        if hosts != "":
-            cls.download_remote(cache_path, pool_path, params)
-        elif ";" in path:
-            cls.download_link(cache_path, path.replace(";", ""), params)
-        else:
-            cls.download_local(cache_path, path, params)
+        # prefetched states are not yet needed by any running test
+        kind = "prefetch" if params.get_boolean("pool_prefetch") else "download"
+        with TransferScheduler.slot(hosts, kind, params):
+            if hosts != "":
+                cls.download_remote(cache_path, pool_path, params)
+            elif ";" in path:
+                cls.download_link(cache_path, path.replace(";", ""), params)
+            else:
+                cls.download_local(cache_path, path, params)
 
     @classmethod
     def upload(cls, cache_path: str, pool_path: str, params: Params) -> None:
@@ -142,12 +168,13 @@ class TransferOps:
         :param params: configuration parameters
         """
         hosts, path = pool_path.split(":")
-        if hosts != "":
-            cls.upload_remote(cache_path, pool_path, params)
-        elif ";" in path:
-            cls.upload_link(cache_path, path.replace(";", ""), params)
-        else:
-            cls.upload_local(cache_path, path, params)
+        with TransferScheduler.slot(hosts, "upload", params):
+            if hosts != "":
+                cls.upload_remote(cache_path, pool_path, params)
+            elif ";" in path:
+                cls.upload_link(cache_path, path.replace(";", ""), params)
+            else:
+                cls.upload_local(cache_path, path, params)
 
     @classmethod
     def delete(cls, pool_path: str, params: Params) -> None:
@@ -165,6 +192,104 @@ class TransferOps:
         else:
             cls.delete_local(path, params)
 
+    @staticmethod
+    def copy_file(src_path: str, dst_path: str, params: Params) -> None:
+        """
+        Copy a file locally using copy-on-write clones where possible.
+
+        :param src_path: local path to copy from
+        :param dst_path: local path to copy to
+        :param params: configuration parameters
+        :raises: :py:class:`ValueError` if the reflink policy is invalid
+        :raises: :py:class:`OSError` if reflinks are required but not supported
+
+        The `pool_reflink` policy can be "yes" to require a reflink (clone),
+        "no" to forbid it, or "auto" to try it before falling back to a
+        sparse-aware copy that skips holes in the source file.
+        """
+        reflink = params.get("pool_reflink", "auto")
+        if reflink not in ["auto", "yes", "no"]:
+            raise ValueError(
+                f"Invalid reflink policy {reflink}, must be one of auto, yes, no"
+            )
+        # only publish complete copies so that failures leave no empty states
+        # and concurrent copies to the same destination don't mix their data
+        part_path = f"{dst_path}.{os.getpid()}.{threading.get_ident()}.part"
+        cloned = False
+        try:
+            with open(src_path, "rb") as src, open(part_path, "wb") as dst:
+                if reflink != "no":
+                    try:
+                        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                    except OSError as error:
+                        if reflink == "yes":
+                            raise OSError(
+                                error.errno,
+                                f"Required reflink of {src_path} to {dst_path} "
+                                f"is not supported: {error.strerror}",
+                            ) from error
+                        logging.debug(
+                            f"Cannot reflink {src_path}, using sparse copy: {error}"
+                        )
+                    else:
+                        logging.debug(f"Cloned {src_path} to {dst_path} via reflink")
+                        cloned = True
+                if not cloned:
+                    TransferOps.copy_sparse(src.fileno(), dst.fileno())
+            shutil.copymode(src_path, part_path)
+            os.replace(part_path, dst_path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.unlink(part_path)
+            raise
+
+    @staticmethod
+    def copy_sparse(src_fd: int, dst_fd: int) -> None:
+        """
+        Copy only the data segments of a file preserving its holes.
+
+        :param src_fd: file descriptor to copy from
+        :param dst_fd: file descriptor to copy to
+        """
+        size = os.fstat(src_fd).st_size
+        offset = 0
+        while offset < size:
+            try:
+                data_start = os.lseek(src_fd, offset, os.SEEK_DATA)
+            except OSError as error:
+                # no more data until the end of the file
+                if error.errno == errno.ENXIO:
+                    break
+                # no hole detection support by the filesystem
+                if error.errno != errno.EINVAL:
+                    raise
+                data_start = offset
+                data_end = size
+            else:
+                data_end = os.lseek(src_fd, data_start, os.SEEK_HOLE)
+            while data_start < data_end:
+                try:
+                    copied = os.copy_file_range(
+                        src_fd,
+                        dst_fd,
+                        data_end - data_start,
+                        data_start,
+                        data_start,
+                    )
+                except OSError as error:
+                    # e.g. cross-filesystem copies on older kernels
+                    if error.errno not in [errno.EXDEV, errno.ENOSYS, errno.EINVAL]:
+                        raise
+                    chunk = os.pread(
+                        src_fd, min(data_end - data_start, 1048576), data_start
+                    )
+                    copied = os.pwrite(dst_fd, chunk, data_start)
+                if copied == 0:
+                    break
+                data_start += copied
+            offset = data_end
+        os.ftruncate(dst_fd, size)
+
     @staticmethod
     def list_local(pool_path: str, params: Params) -> list[str]:
         """
@@ -204,11 +329,17 @@ class TransferOps:
         os.makedirs(os.path.dirname(cache_path), exist_ok=True)
 
         update_timeout = params.get_numeric("update_pool_timeout", 300)
-        with image_lock(pool_path, update_timeout) as lock:
+        with image_lock(
+            pool_path,
+            update_timeout,
+            shared=True,
+            fair=params.get_boolean("pool_lock_fair"),
+        ) as lock:
+            PoolCollector.touch(pool_path)
             if TransferOps.compare_local(cache_path, pool_path, params):
                 logging.info(f"Skip download of an already available {cache_path}")
                 return
-            shutil.copy(pool_path, cache_path)
+            TransferOps.copy_file(pool_path, cache_path, params)
 
     @staticmethod
     def upload_local(cache_path: str, pool_path: str, params: Params) -> None:
@@ -218,12 +349,75 @@ class TransferOps:
         All arguments are identical to the main entry method.
         """
         update_timeout = params.get_numeric("update_pool_timeout", 300)
-        with image_lock(pool_path, update_timeout) as lock:
+        with image_lock(
+            pool_path, update_timeout, fair=params.get_boolean("pool_lock_fair")
+        ) as lock:
             if TransferOps.compare_local(cache_path, pool_path, params):
                 logging.info(f"Skip upload of an already available {cache_path}")
                 return
             os.makedirs(os.path.dirname(pool_path), exist_ok=True)
-            shutil.copy(cache_path, pool_path)
+            objects_dir = params.get("pool_objects")
+            if objects_dir:
+                TransferOps.store_local(cache_path, pool_path, objects_dir, params)
+                return
+            # replace rather than overwrite a file possibly linked elsewhere
+            if os.path.exists(pool_path):
+                os.unlink(pool_path)
+            TransferOps.copy_file(cache_path, pool_path, params)
+
+    @staticmethod
+    def store_local(
+        cache_path: str, pool_path: str, objects_dir: str, params: Params
+    ) -> None:
+        """
+        Store a path in the pool as a link to a content-addressed object.
+
+        Identical files are stored only once in the objects directory and all
+        pool paths with the same content are hard links to them.
+
+        :param cache_path: cache path to store
+        :param pool_path: pool path to link to the stored object
+        :param objects_dir: pool directory of all content-addressed objects
+        :param params: configuration parameters
+        """
+        object_path = os.path.join(
+            objects_dir, crypto.hash_file(cache_path, algorithm="sha256")
+        )
+        os.makedirs(objects_dir, exist_ok=True)
+        update_timeout = params.get_numeric("update_pool_timeout", 300)
+        # stored objects are not yet linked and thus must not be swept meanwhile
+        with image_lock(objects_dir, update_timeout, shared=True):
+            if os.path.exists(object_path):
+                logging.info(f"Deduplicating {pool_path} as the stored {object_path}")
+            else:
+                part_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.part"
+                TransferOps.copy_file(cache_path, part_path, params)
+                os.replace(part_path, object_path)
+            link_path = f"{pool_path}.{os.getpid()}.{threading.get_ident()}.part"
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(link_path)
+            os.link(object_path, link_path)
+            os.replace(link_path, pool_path)
+
+    @staticmethod
+    def sweep_local(objects_dir: str, params: Params) -> None:
+        """
+        Remove all content-addressed objects no longer linked by any pool path.
+
+        :param objects_dir: pool directory of all content-addressed objects
+        :param params: configuration parameters
+        """
+        update_timeout = params.get_numeric("update_pool_timeout", 300)
+        with image_lock(objects_dir, update_timeout), os.scandir(
+            objects_dir
+        ) as entries:
+            for entry in entries:
+                # skip partially stored objects
+                if "." in entry.name or entry.stat().st_nlink > 1:
+                    continue
+                logging.info(f"Removing unreferenced pool object {entry.path}")
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(entry.path)
 
     @staticmethod
     def delete_local(pool_path: str, params: Params) -> None:
@@ -233,8 +427,15 @@ class TransferOps:
         All arguments are identical to the main entry method.
         """
         update_timeout = params.get_numeric("update_pool_timeout", 300)
-        with image_lock(pool_path, update_timeout) as lock:
+        with image_lock(
+            pool_path, update_timeout, fair=params.get_boolean("pool_lock_fair")
+        ) as lock:
+            # linked paths hold a reference to a content-addressed object
+            linked = os.stat(pool_path).st_nlink > 1
             os.unlink(pool_path)
+        objects_dir = params.get("pool_objects")
+        if linked and objects_dir and os.path.isdir(objects_dir):
+            TransferOps.sweep_local(objects_dir, params)
 
     @staticmethod
     def list_remote(pool_path: str, params: Params) -> list[str]:
@@ -244,13 +445,51 @@ class TransferOps:
         All arguments are identical to the main entry method.
         """
         host, path = pool_path.split(":")
-        session = TransferOps.get_session(host, params)
-        status, output = session.cmd_status_output(f"ls {path}")
+        cache = getattr(TransferOps._listings, "cache", None)
+        if cache is not None:
+            # fetch the entire pool tree of the shown location at once if possible
+            location = params.get("show_location", pool_path)
+            location_host, root = location.split(":")
+            if location_host != host or os.path.commonpath([root, path]) != root:
+                location, root = pool_path, path
+            if location not in cache:
+                cache[location] = TransferOps.list_tree_remote(location, params)
+            relpath = os.path.relpath(path, root)
+            return list(cache[location].get("" if relpath == "." else relpath, []))
+
+        with SessionPool.session(params) as session:
+            status, output = session.cmd_status_output(f"ls {path}")
         if status != 0:
             logging.debug(f"Path {path} not found: {output}")
             return []
         return output.split()
 
+    @staticmethod
+    def list_tree_remote(pool_path: str, params: Params) -> dict[str, list[str]]:
+        """
+        List an entire tree of states in a path from the pool with a single command.
+
+        :param pool_path: pool path to list the tree of pool states from
+        :param params: configuration parameters
+        :returns: entries of each subdirectory relative to the pool path
+        """
+        host, path = pool_path.split(":")
+        depth = params.get_numeric("pool_listing_depth", 3)
+        with SessionPool.session(params) as session:
+            status, output = session.cmd_status_output(
+                f"find {path} -mindepth 1 -maxdepth {depth} -printf '%P\\n'"
+            )
+        if status != 0:
+            logging.debug(f"Path {path} not found: {output}")
+            return {}
+        tree = {}
+        for relpath in output.splitlines():
+            if not relpath.strip():
+                continue
+            dirname, basename = os.path.split(relpath.strip())
+            tree.setdefault(dirname, []).append(basename)
+        return tree
+
     @staticmethod
     def compare_remote(cache_path: str, pool_path: str, params: Params) -> bool:
         """
@@ -264,8 +503,8 @@ class TransferOps:
             local_hash = ""
         host, path = pool_path.split(":")
 
-        session = TransferOps.get_session(host, params)
-        remote_hash = ops.hash_file(session, path, "1M", "md5")
+        with SessionPool.session(params) as session:
+            remote_hash = ops.hash_file(session, path, "1M", "md5")
 
         return local_hash == remote_hash
 
@@ -277,27 +516,29 @@ class TransferOps:
         All arguments are identical to the main entry method.
         """
         os.makedirs(os.path.dirname(cache_path), exist_ok=True)
-        # TODO: no support for remote lock files yet
         host, path = pool_path.split(":")
 
-        if TransferOps.compare_remote(cache_path, pool_path, params):
-            logging.info(
-                f"Skip download of an already available and valid {cache_path}"
-            )
-            return
-        if os.path.exists(cache_path):
-            logging.info(f"Force download of an already available {cache_path}")
+        update_timeout = params.get_numeric("update_pool_timeout", 300)
+        with RemoteLock(pool_path, params, update_timeout):
+            if TransferOps.compare_remote(cache_path, pool_path, params):
+                logging.info(
+                    f"Skip download of an already available and valid {cache_path}"
+                )
+                return
+            if os.path.exists(cache_path):
+                logging.info(f"Force download of an already available {cache_path}")
 
-        remote.copy_files_from(
-            params["nets_shell_host"],
-            params["nets_file_transfer_client"],
-            params["nets_username"],
-            params["nets_password"],
-            params["nets_file_transfer_port"],
-            path,
-            cache_path,
-            timeout=params.get_numeric("update_pool_timeout", 300),
-        )
+            remote.copy_files_from(
+                params["nets_shell_host"],
+                params["nets_file_transfer_client"],
+                params["nets_username"],
+                params["nets_password"],
+                params["nets_file_transfer_port"],
+                path,
+                cache_path,
+                limit=TransferScheduler.get_limit(params["nets_file_transfer_client"]),
+                timeout=update_timeout,
+            )
 
     @staticmethod
     def upload_remote(cache_path: str, pool_path: str, params: Params) -> None:
@@ -307,14 +548,67 @@ class TransferOps:
         All arguments are identical to the main entry method.
         """
         # TODO: need to create remote directory if not available
-        # TODO: no support for remote lock files yet
         host, path = pool_path.split(":")
 
-        if TransferOps.compare_remote(cache_path, pool_path, params):
-            logging.info(f"Skip upload of an already available {pool_path}")
-            return
-        logging.info(f"Will possibly force upload to {pool_path}")
+        update_timeout = params.get_numeric("update_pool_timeout", 300)
+        with RemoteLock(pool_path, params, update_timeout):
+            if TransferOps.compare_remote(cache_path, pool_path, params):
+                logging.info(f"Skip upload of an already available {pool_path}")
+                return
+            logging.info(f"Will possibly force upload to {pool_path}")
+            objects_dir = params.get("pool_objects")
+            if objects_dir:
+                TransferOps.store_remote(cache_path, pool_path, objects_dir, params)
+                return
 
+            with SessionPool.session(params) as session:
+                # replace rather than overwrite a file possibly linked elsewhere
+                session.cmd(f"rm -f {path}")
+            remote.copy_files_to(
+                params["nets_shell_host"],
+                params["nets_file_transfer_client"],
+                params["nets_username"],
+                params["nets_password"],
+                params["nets_file_transfer_port"],
+                cache_path,
+                path,
+                limit=TransferScheduler.get_limit(params["nets_file_transfer_client"]),
+                timeout=update_timeout,
+            )
+
+    @staticmethod
+    def store_remote(
+        cache_path: str, pool_path: str, objects_dir: str, params: Params
+    ) -> None:
+        """
+        Store a path in the pool as a link to a content-addressed object.
+
+        All arguments are identical to the local method.
+        """
+        host, path = pool_path.split(":")
+        object_path = os.path.join(
+            objects_dir, crypto.hash_file(cache_path, algorithm="sha256")
+        )
+        update_timeout = params.get_numeric("update_pool_timeout", 300)
+        link_cmd = (
+            f"mkdir -p {os.path.dirname(path)} && "
+            f"ln -f {object_path} {path}.part && mv -f {path}.part {path}"
+        )
+        # stored objects are not yet linked and thus must not be swept meanwhile
+        objects_lock = f"{host}:{objects_dir}"
+        with RemoteLock(objects_lock, params, update_timeout):
+            with SessionPool.session(params) as session:
+                stored = session.cmd_status(f"test -e {object_path}") == 0
+                if stored:
+                    logging.info(
+                        f"Deduplicating {pool_path} as the stored {object_path}"
+                    )
+                    session.cmd(link_cmd)
+                    return
+                session.cmd(f"mkdir -p {objects_dir}")
+
+        # partially stored objects are never swept and can be transferred unlocked
+        part_path = f"{object_path}.{socket.gethostname()}.{os.getpid()}.part"
         remote.copy_files_to(
             params["nets_shell_host"],
             params["nets_file_transfer_client"],
@@ -322,9 +616,13 @@ class TransferOps:
             params["nets_password"],
             params["nets_file_transfer_port"],
             cache_path,
-            path,
-            timeout=params.get_numeric("update_pool_timeout", 300),
+            part_path,
+            limit=TransferScheduler.get_limit(params["nets_file_transfer_client"]),
+            timeout=update_timeout,
         )
+        with RemoteLock(objects_lock, params, update_timeout):
+            with SessionPool.session(params) as session:
+                session.cmd(f"mv -f {part_path} {object_path} && {link_cmd}")
 
     @staticmethod
     def delete_remote(pool_path: str, params: Params) -> None:
@@ -334,15 +632,19 @@ class TransferOps:
         All arguments are identical to the main entry method.
         """
         host, path = pool_path.split(":")
-        session = remote.remote_login(
-            params["nets_shell_client"],
-            params["nets_shell_host"],
-            params["nets_shell_port"],
-            params["nets_username"],
-            params["nets_password"],
-            params["nets_shell_prompt"],
-        )
-        session.cmd(f"rm {path}")
+        update_timeout = params.get_numeric("update_pool_timeout", 300)
+        objects_dir = params.get("pool_objects")
+        with RemoteLock(pool_path, params, update_timeout):
+            with SessionPool.session(params) as session:
+                session.cmd(f"rm {path}")
+        if objects_dir:
+            with RemoteLock(f"{host}:{objects_dir}", params, update_timeout):
+                with SessionPool.session(params) as session:
+                    # remove all content-addressed objects no longer linked
+                    session.cmd(
+                        f"find {objects_dir} -maxdepth 1 -type f -links 1 "
+                        "! -name '*.*' -delete 2>/dev/null || true"
+                    )
 
     @staticmethod
     def compare_link(cache_path: str, pool_path: str, params: Params) -> bool:
@@ -379,7 +681,13 @@ class TransferOps:
         os.makedirs(os.path.dirname(cache_path), exist_ok=True)
 
         update_timeout = params.get_numeric("update_pool_timeout", 300)
-        with image_lock(pool_path, update_timeout) as lock:
+        with image_lock(
+            pool_path,
+            update_timeout,
+            shared=True,
+            fair=params.get_boolean("pool_lock_fair"),
+        ) as lock:
+            PoolCollector.touch(pool_path)
             if TransferOps.compare_link(cache_path, pool_path, params):
                 logging.info(f"Skip link of an already available {cache_path}")
                 return
@@ -559,6 +867,110 @@ class QCOW2ImageTransfer(StateBackend):
         image_file = json.loads(image_info).get("backing-filename", "")
         return os.path.basename(image_file.replace(".qcow2", ""))
 
+    @staticmethod
+    def get_objects_dir(pool_dir: str) -> str:
+        """
+        Get the directory of content-addressed objects of a pool.
+
+        :param pool_dir: root pool directory including its host
+        :returns: path to the objects directory on the pool host
+        """
+        _, path = pool_dir.split(":", 1)
+        return os.path.join(path.replace(";", ""), ".objects")
+
+    @staticmethod
+    def get_compressed_path(cache_path: str) -> str:
+        """
+        Get the path to the compressed upload artifact of a state image.
+
+        :param cache_path: path to the state image in the cache
+        :returns: path to the artifact that is only valid for the current image
+                  file since any recreation or modification changes its status
+        """
+        stat = os.stat(cache_path)
+        return f"{cache_path}.{stat.st_ino}-{stat.st_ctime_ns}.compressed"
+
+    @classmethod
+    def compress(cls, state: str, cache_dir: str, params: Params) -> str:
+        """
+        Compress the clusters of a state image in the cache for the pool format.
+
+        The compressed image remains a valid QCOW2 image decompressed on the
+        fly when read so that it can be stored, transferred, and used as is.
+        It is stored as a separate upload artifact next to the state image
+        which itself remains untouched while it might be in use.
+
+        :param state: state name
+        :param cache_dir: root cache directory containing the state image
+        :param params: configuration parameters of the state image
+        :returns: path to the image to upload
+        """
+        compression = params.get("pool_compression", "none")
+        if compression == "none":
+            return os.path.join(
+                cache_dir, params["object_id"], params["images"], state + ".qcow2"
+            )
+        if compression not in ["zlib", "zstd"]:
+            raise ValueError(
+                f"Unsupported pool compression {compression}, must be one of "
+                "none, zlib, zstd"
+            )
+        vm_id, image_name = params["object_id"], params["images"]
+        vm_dir = os.path.join(cache_dir, vm_id)
+        params = params.copy()
+        params["image_chain"] = f"snapshot {image_name}"
+        params["image_name_snapshot"] = os.path.join(image_name, state)
+        params["image_format_snapshot"] = "qcow2"
+        snapshot_params = params.object_params("snapshot")
+        qemu_img = QemuImg(snapshot_params, vm_dir, "snapshot")
+        cache_path = qemu_img.image_filename
+        compressed_path = cls.get_compressed_path(cache_path)
+        if os.path.exists(compressed_path):
+            logging.debug(f"Reusing the compressed state {state} for upload")
+            return compressed_path
+        image_info = json.loads(qemu_img.info(force_share=True, output="json"))
+        format_info = image_info.get("format-specific", {}).get("data", {})
+        # every QCOW2 v3 image reports a compression type even if uncompressed
+        if format_info.get("compression-type") == compression:
+            result = qemu_img.check(
+                snapshot_params, vm_dir, force_share=True, output="json"
+            )
+            try:
+                check_info = json.loads(result.stdout_text)
+            except ValueError:
+                check_info = {}
+            if (
+                check_info.get("compressed-clusters", 0) > 0
+                or check_info.get("allocated-clusters") == 0
+            ):
+                logging.debug(
+                    f"Skip compression of an already compressed state {state}"
+                )
+                return cache_path
+
+        logging.info(f"Compressing state {state} of {image_name} with {compression}")
+        part_name = f"{state}.{os.getpid()}.{threading.get_ident()}.compressed"
+        snapshot_params["convert_target"] = "compressed"
+        snapshot_params["convert_compressed"] = "yes"
+        snapshot_params["image_name_compressed"] = os.path.join(image_name, part_name)
+        snapshot_params["image_format_compressed"] = "qcow2"
+        snapshot_params["image_compression_type_compressed"] = compression
+        backing_file = image_info.get("backing-filename")
+        if backing_file:
+            # the compressed image has to keep the same backing chain
+            snapshot_params["convert_backing_file_compressed"] = backing_file
+            snapshot_params["image_extra_params_compressed"] = "backing_fmt=qcow2"
+        qemu_img.convert(snapshot_params, vm_dir)
+        os.replace(
+            os.path.join(vm_dir, image_name, part_name + ".qcow2"), compressed_path
+        )
+        # artifacts of previous versions of the state image are obsolete
+        for obsolete_path in glob.glob(f"{glob.escape(cache_path)}.*.compressed"):
+            if obsolete_path != compressed_path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(obsolete_path)
+        return compressed_path
+
     @classmethod
     def compare_chain(
         cls, state: str, cache_dir: str, pool_dir: str, params: Params
@@ -584,6 +996,11 @@ class QCOW2ImageTransfer(StateBackend):
                 pool_path = os.path.join(
                     pool_dir, vm_id, image_name, next_state + ".qcow2"
                 )
+                # the pool contains the compressed upload artifact if any
+                with contextlib.suppress(FileNotFoundError):
+                    compressed_path = cls.get_compressed_path(cache_path)
+                    if os.path.exists(compressed_path):
+                        cache_path = compressed_path
                 if not cls.ops.compare(cache_path, pool_path, image_params):
                     logging.warning(
                         f"The image {image_name} has different {next_state} between cache {cache_path} and pool {pool_path}"
@@ -625,6 +1042,9 @@ class QCOW2ImageTransfer(StateBackend):
         """
         transfer_operation = cls.ops.download if down else cls.ops.upload
         vm_id = params["object_id"]
+        if not down and params.get_boolean("pool_dedup"):
+            params = params.copy()
+            params["pool_objects"] = cls.get_objects_dir(pool_dir)
 
         logging.debug(f"Transferring backing chain for {state}")
         next_state = state
@@ -637,6 +1057,8 @@ class QCOW2ImageTransfer(StateBackend):
                 pool_path = os.path.join(
                     pool_dir, vm_id, image_name, next_state + ".qcow2"
                 )
+                if not down:
+                    cache_path = cls.compress(next_state, cache_dir, image_params)
                 # if only vm state is not available this would indicate image corruption
                 transfer_operation(cache_path, pool_path, image_params)
             if next_state == state and params["object_type"] in ["vms", "nets/vms"]:
@@ -698,6 +1120,11 @@ class QCOW2ImageTransfer(StateBackend):
             f"from the shared pool {pool_dir} to {cache_dir}"
         )
 
+        if params.get_boolean("pool_gc_auto"):
+            reserve = params.get("pool_gc_reserve", "0")
+            PoolCollector.run(
+                params, int(float(utils_numeric.normalize_data_size(reserve, "B")))
+            )
         cls.transfer_chain(state, cache_dir, pool_dir, params, down=True)
 
     @classmethod
@@ -742,6 +1169,9 @@ class QCOW2ImageTransfer(StateBackend):
             f"Removing shared {state_tag} state {state} "
             f"from the shared pool {pool_dir}"
         )
+        if params.get_boolean("pool_dedup"):
+            params = params.copy()
+            params["pool_objects"] = cls.get_objects_dir(pool_dir)
 
         for image_name in params.objects("images"):
             image_params = params.object_params(image_name)
@@ -766,10 +1196,12 @@ class RootSourcedStateBackend(StateBackend):
 
         All arguments match the base class.
         """
-        local_root_exists = cls._check_root(params, object)
+        local_root_exists = StateInventory.reuse(cls._check_root, params, object)
         if params["pool_scope"] == "own":
             return local_root_exists
-        pool_root_exists = cls.transport.check_root(params, object)
+        pool_root_exists = StateInventory.reuse(
+            cls.transport.check_root, params, object
+        )
         # TODO: boot state has to be deprecated and it cannot be handled remotely
         return local_root_exists or (
             pool_root_exists and params["object_type"] not in ["vms", "nets/vms"]
@@ -789,8 +1221,10 @@ class RootSourcedStateBackend(StateBackend):
             cls._get_root(params, object)
             return
 
-        local_root_exists = cls._check_root(params, object)
-        pool_root_exists = cls.transport.check_root(params, object)
+        local_root_exists = StateInventory.reuse(cls._check_root, params, object)
+        pool_root_exists = StateInventory.reuse(
+            cls.transport.check_root, params, object
+        )
 
         if pool_root_exists:
             if local_root_exists:
@@ -918,7 +1352,7 @@ class SourcedStateBackend(StateBackend):
         sources = cls.get_sources("show", params)
         scopes = params.get_list("pool_scope")
         if "own" in scopes:
-            cache_states = cls._show(params, object)
+            cache_states = StateInventory.reuse(cls._show, params, object)
         else:
             cache_states = []
 
@@ -936,8 +1370,12 @@ class SourcedStateBackend(StateBackend):
             if source_scope == "own" or source_scope not in scopes:
                 continue
             logging.debug(f"Choosing {source} as the show source to use")
+            # states that are still being uploaded are not yet complete in the pool
+            UploadQueue.wait(UploadQueue.get_path(source, params))
 
-            mirror_states = cls.transport.show(source_params, object)
+            mirror_states = StateInventory.reuse(
+                cls.transport.show, source_params, object
+            )
             pool_states = (
                 set(mirror_states)
                 if not pool_states
@@ -970,11 +1408,14 @@ class SourcedStateBackend(StateBackend):
             if source_scope == "own" or source_scope not in scopes:
                 continue
             logging.debug(f"Choosing {source} as the get source to use")
+            UploadQueue.wait(UploadQueue.get_path(source, params))
 
             source_params["show_location"] = source
-            local_state_exists = params["get_state"] in cls._show(params, object)
-            pool_state_exists = params["get_state"] in cls.transport.show(
-                source_params, object
+            local_state_exists = params["get_state"] in StateInventory.reuse(
+                cls._show, params, object
+            )
+            pool_state_exists = params["get_state"] in StateInventory.reuse(
+                cls.transport.show, source_params, object
             )
 
             if pool_state_exists:
@@ -1006,7 +1447,9 @@ class SourcedStateBackend(StateBackend):
         if "own" in scopes:
             cls._set(params, object)
         else:
-            local_state_exists = params["set_state"] in cls._show(params, object)
+            local_state_exists = params["set_state"] in StateInventory.reuse(
+                cls._show, params, object
+            )
             if not local_state_exists:
                 raise RuntimeError("Updating state pool requires local states")
 
@@ -1025,7 +1468,16 @@ class SourcedStateBackend(StateBackend):
                 continue
             logging.debug(f"Choosing {source} as the set source to use")
 
-            cls.transport.set(source_params, object)
+            if params.get_boolean("pool_upload_async"):
+                pool_path = UploadQueue.get_path(source, params)
+                # uploads of the same object to the same pool are serialized
+                UploadQueue.wait(pool_path)
+                # detach the parameters from any changes until the upload runs
+                UploadQueue.submit(
+                    pool_path, cls.transport.set, source_params.copy(), object
+                )
+            else:
+                cls.transport.set(source_params, object)
 
     @classmethod
     def unset(cls, params: Params, object: Any = None) -> None:
@@ -1053,41 +1505,956 @@ class SourcedStateBackend(StateBackend):
             if source_scope == "own" or source_scope not in scopes:
                 continue
             logging.debug(f"Choosing {source} as the unset source to use")
+            UploadQueue.wait(UploadQueue.get_path(source, params))
 
             cls.transport.unset(source_params, object)
 
 
-@contextlib.contextmanager
-def image_lock(resource_path: str, timeout: int = 300) -> None:
+class UploadQueue:
     """
-    Wait for a lock to free image for state pool operations.
+    A queue of pool uploads running in the background.
 
-    :param resource_path: path to the potentially locked resource
-    :param timeout: timeout to wait before erroring out (default 5 mins)
+    Uploads are performed by a few background threads and tracked by the pool
+    path of the uploaded object so that consumers of the same pool path in the
+    same process only wait for its own uploads while all remaining uploads
+    are waited for at the latest when the process exits.
     """
-    if SKIP_LOCKS:
-        yield None
-        return
-    lockfile = resource_path + ".lock"
-    os.makedirs(os.path.dirname(lockfile), exist_ok=True)
-    with open(lockfile, "wb") as fd:
-        for _ in range(timeout):
+
+    #: maximal number of concurrent background uploads
+    max_workers = 2
+
+    _executor = None
+    #: pending uploads per pool path of the uploaded object
+    _pending = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_path(location: str, params: Params) -> str:
+        """
+        Get the pool path identifying the uploads of an object.
+
+        :param location: pool location in the format "net:path"
+        :param params: configuration parameters of the object
+        :returns: pool path of the object states
+        """
+        return os.path.join(location, params.get("object_id", ""))
+
+    @classmethod
+    def submit(cls, pool_path: str, function: Any, *args: Any) -> Future:
+        """
+        Schedule an upload to run in the background.
+
+        :param pool_path: pool path of the uploaded object
+        :param function: upload function to run
+        :param args: arguments for the upload function
+        :returns: future for the result of the upload
+        """
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.max_workers, thread_name_prefix="pool-upload"
+                )
+                atexit.register(cls.wait, raise_errors=False)
+            future = cls._executor.submit(function, *args)
+            cls._pending.setdefault(pool_path, []).append(future)
+        return future
+
+    @classmethod
+    def wait(cls, pool_path: str = None, raise_errors: bool = True) -> None:
+        """
+        Wait for pending background uploads to complete.
+
+        :param pool_path: pool path of the object to wait for or none for all
+        :param raise_errors: whether to raise an error if any upload failed
+        :raises: :py:class:`RuntimeError` if any of the uploads failed
+        """
+        with cls._lock:
+            if pool_path is None:
+                pending = [f for futures in cls._pending.values() for f in futures]
+                cls._pending.clear()
+            else:
+                pending = cls._pending.pop(pool_path, [])
+        errors = []
+        for future in pending:
             try:
-                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                future.result()
+            except Exception as error:
+                logging.error(f"Background pool upload failed: {error}")
+                errors.append(error)
+        if errors and raise_errors:
+            raise RuntimeError(
+                f"{len(errors)} background pool upload(s) failed"
+            ) from errors[0]
+
+
+class PoolCollector:
+    """
+    A garbage collector evicting least recently used states from local pools.
+
+    Only leaf states are evicted, i.e. states that are not backing any other
+    state or image (e.g. the images of running vms), so that once a leaf is
+    evicted its own backing state might become a leaf evicted later on. Root
+    states are never evicted but are accounted for in the pool usage.
+    """
+
+    #: magic bytes at the start of every QCOW2 image header
+    QCOW2_MAGIC = b"QFI\xfb"
+
+    @staticmethod
+    def touch(path: str) -> None:
+        """
+        Record an access to a pool path preserving its modification time.
+
+        :param path: accessed pool path
+        """
+        with contextlib.suppress(FileNotFoundError):
+            mtime = os.stat(path).st_mtime_ns
+            os.utime(path, ns=(time.time_ns(), mtime))
+
+    @classmethod
+    def get_backing(cls, path: str) -> str:
+        """
+        Get the backing file of a QCOW2 image directly from its header.
+
+        :param path: path to the QCOW2 image
+        :returns: absolute path to the backing file or empty string if none
+        """
+        with open(path, "rb") as image:
+            header = image.read(20)
+            if len(header) < 20 or header[:4] != cls.QCOW2_MAGIC:
+                return ""
+            offset, size = struct.unpack(">QI", header[8:20])
+            if offset == 0 or size == 0:
+                return ""
+            image.seek(offset)
+            backing_file = image.read(size).decode()
+        if backing_file.startswith("json:"):
+            return ""
+        return os.path.normpath(os.path.join(os.path.dirname(path), backing_file))
+
+    @classmethod
+    def scan(cls, pool_dir: str) -> tuple[dict[str, tuple[int, float]], list[str], int]:
+        """
+        Scan a local pool for states that could be evicted.
+
+        :param pool_dir: root directory of the local pool
+        :returns: size and last access of each state, all QCOW2 images in the
+                  pool, and the total size of all pool files
+        """
+        states, images, usage = {}, [], 0
+        if not os.path.isdir(pool_dir):
+            return states, images, usage
+        for vm_entry in os.scandir(pool_dir):
+            # skip content-addressed objects and any other auxiliary files
+            if vm_entry.name.startswith(".") or not vm_entry.is_dir():
+                continue
+            for entry in os.scandir(vm_entry.path):
+                if entry.is_dir() and not entry.name.endswith(".queue"):
+                    image_entries = [
+                        e
+                        for e in os.scandir(entry.path)
+                        if e.name.endswith(".qcow2") and e.is_file()
+                    ]
+                    for image_entry in image_entries:
+                        stat = image_entry.stat()
+                        size = stat.st_blocks * 512
+                        states[image_entry.path] = (
+                            size,
+                            max(stat.st_atime, stat.st_mtime),
+                        )
+                        images.append(image_entry.path)
+                        usage += size
+                elif entry.is_file() and entry.name.endswith((".qcow2", ".state")):
+                    stat = entry.stat()
+                    size = stat.st_blocks * 512
+                    usage += size
+                    if entry.name.endswith(".state"):
+                        states[entry.path] = (size, max(stat.st_atime, stat.st_mtime))
+                    else:
+                        # root states are never evicted
+                        images.append(entry.path)
+        return states, images, usage
+
+    @classmethod
+    def collect(
+        cls,
+        pool_dirs: list[str],
+        quota: int,
+        params: Params,
+        image_dirs: list[str] = None,
+        reserve: int = 0,
+    ) -> list[str]:
+        """
+        Evict least recently used leaf states until the pools fit in a quota.
+
+        :param pool_dirs: root directories of local pools to collect from
+        :param quota: maximal total size of all pools in bytes
+        :param params: configuration parameters
+        :param image_dirs: directories of images (e.g. of running vms) which
+                           could be backed by states in the pools
+        :param reserve: additional space in bytes to free up below the quota
+        :returns: all evicted states
+        """
+        states, images, usage = {}, [], 0
+        for pool_dir in pool_dirs:
+            pool_states, pool_images, pool_usage = cls.scan(pool_dir)
+            states.update(pool_states)
+            images += pool_images
+            usage += pool_usage
+        for image_dir in image_dirs or []:
+            if not os.path.isdir(image_dir):
+                continue
+            for vm_entry in os.scandir(image_dir):
+                if vm_entry.is_dir():
+                    images += [
+                        e.path
+                        for e in os.scandir(vm_entry.path)
+                        if e.name.endswith(".qcow2") and e.is_file()
+                    ]
+        target = quota - reserve
+        if usage <= target:
+            logging.debug(f"Pool usage {usage} is within the quota {target}")
+            return []
+
+        # each state and image depends on its backing state and each vm state
+        # depends on the image states with the same name
+        dependencies = {}
+        for image in images:
+            with contextlib.suppress(OSError, UnicodeDecodeError):
+                dependencies[image] = [cls.get_backing(image)]
+        for path in states:
+            if path.endswith(".state"):
+                vm_dir, state = os.path.split(path[: -len(".state")])
+                dependencies[path] = [
+                    image
+                    for image in images
+                    if os.path.dirname(os.path.dirname(image)) == vm_dir
+                    and os.path.basename(image) == state + ".qcow2"
+                ]
+        references = {path: 0 for path in states}
+        for dependents in dependencies.values():
+            for dependency in dependents:
+                if dependency in references:
+                    references[dependency] += 1
+
+        leaves = [(states[p][1], p) for p, count in references.items() if count == 0]
+        heapq.heapify(leaves)
+        delete_params = params.copy()
+        # states still in use by other workers are skipped rather than waited for
+        delete_params["update_pool_timeout"] = "0"
+        evicted = []
+        while usage > target and leaves:
+            _, path = heapq.heappop(leaves)
+            pool_dir = [d for d in pool_dirs if path.startswith(d.rstrip("/") + "/")][0]
+            delete_params["pool_objects"] = os.path.join(pool_dir, ".objects")
+            try:
+                TransferOps.delete_local(path, delete_params)
+            except (RuntimeError, FileNotFoundError) as error:
+                logging.warning(f"Could not evict {path}: {error}")
+                continue
+            logging.info(f"Evicted least recently used state {path}")
+            evicted.append(path)
+            usage -= states[path][0]
+            # an evicted state no longer references its own dependencies
+            for dependency in dependencies.get(path, []):
+                if dependency not in references:
+                    continue
+                references[dependency] -= 1
+                if references[dependency] == 0:
+                    heapq.heappush(leaves, (states[dependency][1], dependency))
+        if usage > target:
+            logging.warning(
+                f"Pool usage {usage} remains above the quota {target} since "
+                "all remaining states are still in use"
+            )
+        if evicted:
+            # evicted states could be listed for any object in the pool
+            StateInventory.invalidate()
+        return evicted
+
+    @classmethod
+    def run(cls, params: Params, reserve: int = 0) -> list[str]:
+        """
+        Evict states from the local pools of the current host if over quota.
+
+        :param params: configuration parameters
+        :param reserve: additional space in bytes to free up below the quota
+        :returns: all evicted states
+        """
+        quota = params.get("pool_gc_quota", "")
+        if not quota:
+            return []
+        quota = int(float(utils_numeric.normalize_data_size(quota, "B")))
+        pool_dirs = [params["swarm_pool"]]
+        shared_pool = params.get("shared_pool", "")
+        # only local shared pools (without a remote host) can be collected
+        if shared_pool.startswith(":") and not shared_pool.endswith(";"):
+            pool_dirs += [shared_pool[1:]]
+        return cls.collect(
+            pool_dirs, quota, params, [params["vms_base_dir"]], reserve=reserve
+        )
+
+
+class TransferScheduler:
+    """
+    A per-host scheduler for pool transfers of all workers on the same host.
+
+    Transfers from or to the same pool host take one of a limited number of
+    slots (files locked for the duration of a transfer) where waiting transfers
+    of higher priority like downloads needed by runnable tests are served
+    before lower priority ones like uploads of freshly created states. Every
+    started transfer also gets a share of the total bandwidth to the pool host
+    weighted by the kinds of all running transfers.
+    """
+
+    #: priority of each kind of transfer where lower values are served first
+    priorities = {"download": 0, "upload": 1, "prefetch": 2}
+
+    _current = threading.local()
+
+    @classmethod
+    def get_limit(cls, client: str = "scp") -> str:
+        """
+        Get the bandwidth limit of the scheduled transfer in the current thread.
+
+        :param client: file transfer client to get the limit in the units of
+                       where rsync expects KiB/s while scp expects Kbit/s
+        :returns: bandwidth limit in the client units or empty string if unlimited
+        """
+        limit = getattr(cls._current, "limit", 0)
+        if limit <= 0:
+            return ""
+        if client == "rsync":
+            limit = max(1, limit * 1000 // 8192)
+        return str(limit)
+
+    @classmethod
+    @contextlib.contextmanager
+    def slot(cls, host: str, kind: str, params: Params) -> Generator[None, None, None]:
+        """
+        Wait for a free transfer slot to a pool host and use it within a context.
+
+        :param host: pool host or empty string for a local pool which is never
+                     scheduled
+        :param kind: kind of the transfer, one of "download", "upload", or
+                     "prefetch"
+        :param params: configuration parameters
+        :raises: :py:class:`RuntimeError` if no transfer slot was freed up within
+                 the timeout
+        """
+        max_slots = params.get_numeric("pool_transfer_slots", 0)
+        if SKIP_LOCKS or max_slots <= 0 or host == "":
+            yield
+            return
+        slots_dir = os.path.join(
+            params.get(
+                "pool_transfer_dir",
+                os.path.join(tempfile.gettempdir(), "avocado-i2n-transfers"),
+            ),
+            host,
+        )
+        queue_dir = os.path.join(slots_dir, "queue")
+        timeout = params.get_numeric("update_pool_timeout", 300)
+
+        priority = cls.priorities[kind]
+        name = f"{priority}-{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}"
+        ticket = _draw_ticket(queue_dir, name)
+        watch = None
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                rank = len(_tickets_ahead(queue_dir, name))
+                slot, running = cls._take(slots_dir, max_slots, rank)
+                if slot is not None:
+                    break
+                if watch is None:
+                    # retry right after watching to not miss any release
+                    watch = _FileWatch([slots_dir, queue_dir])
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(
+                        f"Waiting for a transfer slot to {host} took more than "
+                        f"the allowed {timeout} seconds"
+                    )
+                logging.debug(f"Waiting for a transfer slot to {host}")
+                interval = (
+                    ImageLock.event_interval
+                    if watch.active
+                    else ImageLock.poll_interval
+                )
+                watch.wait(min(remaining, interval))
+        finally:
+            if watch is not None:
+                watch.close()
+            _return_ticket(queue_dir, name, ticket)
+
+        try:
+            with open(slot.name, "wb") as kind_file:
+                kind_file.write(kind.encode())
+            cls._current.limit = cls._share(kind, running, params)
+            yield
+        finally:
+            cls._current.limit = 0
+            fcntl.flock(slot, fcntl.LOCK_UN)
+            # touching the slot file wakes up any waiters
+            os.utime(slot.name)
+            slot.close()
+
+    @staticmethod
+    def _take(slots_dir: str, max_slots: int, rank: int) -> tuple[Any, list[str]]:
+        """
+        Take the free transfer slot corresponding to a rank among the waiters.
+
+        :param slots_dir: directory of the transfer slots to a pool host
+        :param max_slots: number of transfer slots to the pool host
+        :param rank: number of waiters with precedence over the current one
+        :returns: the opened and locked slot file if taken and kinds of all
+                  running transfers
+        """
+        taken, running, free = None, [], 0
+        for i in range(max_slots):
+            slot_path = os.path.join(slots_dir, f"slot{i}")
+            if not os.path.exists(slot_path):
+                open(slot_path, "ab").close()
+            # probing slots only for reading does not wake up any waiters
+            slot = open(slot_path, "rb")
+            try:
+                fcntl.flock(slot, fcntl.LOCK_SH | fcntl.LOCK_NB)
             except IOError as error:
-                # block here but still support a finite timeout
-                if error.errno != errno.EACCES and error.errno != errno.EAGAIN:
+                if error.errno != errno.EWOULDBLOCK:
+                    slot.close()
                     raise
-            else:
-                break
-            logging.debug("Waiting for image to become available")
-            time.sleep(1)
-        else:
-            raise RuntimeError(
-                f"Waiting to acquire {lockfile} took more than "
-                f"the allowed {timeout} seconds"
+                running.append(slot.read().decode())
+                slot.close()
+                continue
+            if taken is None and free == rank:
+                try:
+                    fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError as error:
+                    if error.errno != errno.EWOULDBLOCK:
+                        slot.close()
+                        raise
+                    # some other waiter is probing or taking the same slot
+                    slot.close()
+                    continue
+                taken = slot
+                continue
+            free += 1
+            slot.close()
+        return taken, running
+
+    @staticmethod
+    def _share(kind: str, running: list[str], params: Params) -> int:
+        """
+        Get the bandwidth share of a transfer among all running transfers.
+
+        :param kind: kind of the transfer
+        :param running: kinds of all other running transfers
+        :param params: configuration parameters
+        :returns: bandwidth limit in Kbit/s or zero if unlimited
+        """
+        bandwidth = params.get_numeric("pool_transfer_bandwidth", 0)
+        cap = (
+            params.get_numeric("pool_prefetch_bandwidth", 0)
+            if kind == "prefetch"
+            else 0
+        )
+        if bandwidth <= 0:
+            return max(cap, 0)
+        weights = {
+            "download": params.get_numeric("pool_download_share", 3),
+            "upload": params.get_numeric("pool_upload_share", 1),
+            "prefetch": params.get_numeric("pool_prefetch_share", 1),
+        }
+        total = weights[kind] + sum(weights.get(other, 0) for other in running)
+        share = max(1, int(bandwidth * weights[kind] / total))
+        return min(share, cap) if cap > 0 else share
+
+
+class RemoteLock:
+    """
+    A lease lock for a resource in a remote pool.
+
+    The lease is a directory created atomically next to the remote resource
+    and kept alive through regular heartbeats so that leases of owners that
+    crashed expire and can be broken by other waiters. The lock can be used
+    both as a regular and as an asynchronous context manager.
+    """
+
+    def __init__(self, pool_path: str, params: Params, timeout: int = 300) -> None:
+        """
+        Construct a lease lock for a remote pool resource.
+
+        :param pool_path: remote pool path to the potentially locked resource
+        :param params: configuration parameters
+        :param timeout: timeout to wait before erroring out (default 5 mins)
+        """
+        _, path = pool_path.split(":")
+        self.lease_path = path + ".lease"
+        self.params = params
+        self.timeout = timeout
+        self.lease_timeout = params.get_numeric("pool_lease_timeout", 60)
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+        self._heartbeat = None
+        self._released = threading.Event()
+
+    def __enter__(self) -> "RemoteLock":
+        """Acquire the lock when entering a context."""
+        self.acquire()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        """Release the lock when leaving a context."""
+        self.release()
+
+    async def __aenter__(self) -> "RemoteLock":
+        """Acquire the lock when entering an asynchronous context."""
+        await asyncio.get_running_loop().run_in_executor(None, self.acquire)
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        """Release the lock when leaving an asynchronous context."""
+        await asyncio.get_running_loop().run_in_executor(None, self.release)
+
+    def acquire(self) -> None:
+        """
+        Wait for the lease to become available and take it over.
+
+        :raises: :py:class:`RuntimeError` if the lease could not be acquired
+                 within the timeout
+        """
+        if SKIP_LOCKS:
+            return
+        lease_path = self.lease_path
+        poll_interval = self.params.get_numeric("pool_lock_poll", 1)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with SessionPool.session(self.params) as session:
+                output = session.cmd_output(
+                    f"mkdir -p {os.path.dirname(lease_path)}; "
+                    f"if mkdir {lease_path} 2>/dev/null; then "
+                    f"echo {self.owner} > {lease_path}/owner && echo acquired; "
+                    f"else echo $(( $(date +%s) - $(stat -c %Y {lease_path}) )); fi"
+                ).strip()
+                if output == "acquired":
+                    break
+                try:
+                    lease_age = int(output)
+                except ValueError:
+                    # the lease was released in the meantime
+                    lease_age = 0
+                if lease_age > self.lease_timeout:
+                    logging.warning(
+                        f"Breaking expired lease {lease_path} without heartbeat "
+                        f"for {lease_age} seconds"
+                    )
+                    self._break(session)
+                    continue
+            if time.monotonic() > deadline:
+                raise RuntimeError(
+                    f"Waiting to acquire {lease_path} took more than "
+                    f"the allowed {self.timeout} seconds"
+                )
+            logging.debug("Waiting for remote image to become available")
+            time.sleep(poll_interval)
+
+        self._released.clear()
+        self._heartbeat = threading.Thread(target=self._renew, daemon=True)
+        self._heartbeat.start()
+
+    def release(self) -> None:
+        """Stop the heartbeats and give up the lease."""
+        if SKIP_LOCKS:
+            return
+        self._released.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        lease_path = self.lease_path
+        # only give up our own lease which could have been broken as expired
+        released_path = f"{lease_path}.{self.owner}.released"
+        with SessionPool.session(self.params) as session:
+            session.cmd_output(
+                f'if [ "$(cat {lease_path}/owner 2>/dev/null)" = "{self.owner}" ] && '
+                f"mv -T {lease_path} {released_path} 2>/dev/null; then "
+                f"rm -rf {released_path}; fi"
             )
+
+    def _break(self, session: RemoteSession) -> None:
+        """
+        Break an expired lease without affecting any newer lease.
+
+        :param session: remote session to the host of the lease
+
+        The lease is atomically moved away under a name unique to the breaker
+        so that concurrent breakers can never remove a lease acquired after
+        it expired. A lease that turns out to be fresh again (acquired by
+        another waiter right after a concurrent break) is moved back.
+        """
+        lease_path = self.lease_path
+        broken_path = f"{lease_path}.{self.owner}.broken"
+        session.cmd_output(
+            f"if mv -T {lease_path} {broken_path} 2>/dev/null; then "
+            f"if [ $(( $(date +%s) - $(stat -c %Y {broken_path}) )) "
+            f"-gt {self.lease_timeout} ]; then rm -rf {broken_path}; "
+            f"else mv -T {broken_path} {lease_path} 2>/dev/null "
+            f"|| rm -rf {broken_path}; fi; fi"
+        )
+
+    def _renew(self) -> None:
+        """Renew the lease regularly until it is released."""
+        while not self._released.wait(self.lease_timeout / 3):
+            try:
+                with SessionPool.session(self.params) as session:
+                    # never recreate a broken lease as a regular file
+                    session.cmd_output(f"touch -c {self.lease_path}")
+            except Exception as error:
+                logging.warning(f"Failed to renew lease {self.lease_path}: {error}")
+
+
+class ImageLock:
+    """
+    A lock for a resource in a local pool.
+
+    Waiters sleep until the lock file is released by a previous holder (using
+    inotify where available) instead of polling it. Multiple holders of a
+    shared lock can coexist while an exclusive lock is held by a single one,
+    both across processes and across threads of the same process.
+    Waiters can optionally be served in FIFO order through a queue of ticket
+    files next to the lock file to avoid starving some of them. The lock can
+    be used both as a regular and as an asynchronous context manager.
+    """
+
+    #: maximal time to sleep between lock attempts without any wakeup events
+    poll_interval = 1.0
+    #: maximal time to sleep between lock attempts in case of missed events
+    event_interval = 10.0
+
+    #: lock files opened by the current process shared among all its threads
+    #: since POSIX record locks are owned by processes and would be released
+    #: on closing any file descriptor for the lock file
+    _files = {}
+    _files_lock = threading.Lock()
+
+    def __init__(
+        self,
+        resource_path: str,
+        timeout: int = 300,
+        shared: bool = False,
+        fair: bool = False,
+    ) -> None:
+        """
+        Construct a lock for a local pool resource.
+
+        :param resource_path: path to the potentially locked resource
+        :param timeout: timeout to wait before erroring out (default 5 mins)
+        :param shared: whether to share the lock with other shared lock holders
+        :param fair: whether to acquire the lock only after all previous waiters
+        """
+        self.lockfile = resource_path + ".lock"
+        self.queue_dir = resource_path + ".queue"
+        self.timeout = timeout
+        self.shared = shared
+        self.fair = fair
+        self.fd = None
+        self._ticket = None
+
+    def __enter__(self) -> "ImageLock":
+        """Acquire the lock when entering a context."""
+        self.acquire()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        """Release the lock when leaving a context."""
+        self.release()
+
+    async def __aenter__(self) -> "ImageLock":
+        """Acquire the lock when entering an asynchronous context."""
+        await asyncio.get_running_loop().run_in_executor(None, self.acquire)
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        """Release the lock when leaving an asynchronous context."""
+        await asyncio.get_running_loop().run_in_executor(None, self.release)
+
+    def acquire(self) -> None:
+        """
+        Wait for the lock to become available and take it over.
+
+        :raises: :py:class:`RuntimeError` if the lock could not be acquired
+                 within the timeout
+        """
+        if SKIP_LOCKS:
+            return
+        os.makedirs(os.path.dirname(self.lockfile), exist_ok=True)
+        state = self._open()
+        watch = None
         try:
-            yield fd
+            if self.fair:
+                self._enqueue()
+            deadline = time.monotonic() + self.timeout
+            while True:
+                if (not self.fair or self._is_next()) and self._try_lock():
+                    break
+                if watch is None:
+                    # retry right after watching to not miss any release
+                    watch = _FileWatch(
+                        [self.lockfile] + ([self.queue_dir] if self.fair else [])
+                    )
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(
+                        f"Waiting to acquire {self.lockfile} took more than "
+                        f"the allowed {self.timeout} seconds"
+                    )
+                logging.debug("Waiting for image to become available")
+                interval = self.event_interval if watch.active else self.poll_interval
+                watch.wait(min(remaining, interval))
+        except BaseException:
+            self._close()
+            raise
         finally:
-            fcntl.lockf(fd, fcntl.LOCK_UN)
+            if watch is not None:
+                watch.close()
+            self._dequeue()
+        self.fd = state["fd"]
+
+    def release(self) -> None:
+        """Give up the lock."""
+        if SKIP_LOCKS or self.fd is None:
+            return
+        try:
+            with self._files_lock:
+                state = self._files[self.lockfile]
+                if self.shared:
+                    state["shared"] -= 1
+                else:
+                    state["exclusive"] = False
+                if state["shared"] == 0 and not state["exclusive"]:
+                    fcntl.lockf(state["fd"], fcntl.LOCK_UN)
+                    # touching the lock file wakes up any waiters
+                    os.utime(self.lockfile)
+        finally:
+            self._close()
+            self.fd = None
+
+    def _open(self) -> dict[str, Any]:
+        """
+        Open the lock file for the current process unless already open.
+
+        :returns: lock file state in the current process
+        """
+        with self._files_lock:
+            state = self._files.get(self.lockfile)
+            if state is None:
+                # shared locks require the lock file to be readable
+                state = {
+                    "fd": open(self.lockfile, "a+b"),
+                    "users": 0,
+                    "shared": 0,
+                    "exclusive": False,
+                }
+                self._files[self.lockfile] = state
+            state["users"] += 1
+        return state
+
+    def _close(self) -> None:
+        """Close the lock file for the current process if no longer used."""
+        with self._files_lock:
+            state = self._files[self.lockfile]
+            state["users"] -= 1
+            if state["users"] == 0:
+                state["fd"].close()
+                del self._files[self.lockfile]
+
+    def _try_lock(self) -> bool:
+        """
+        Try to lock the lock file without blocking.
+
+        :returns: whether the lock was acquired
+        """
+        with self._files_lock:
+            state = self._files[self.lockfile]
+            if state["exclusive"] or (state["shared"] and not self.shared):
+                return False
+            if state["shared"] == 0:
+                mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+                try:
+                    fcntl.lockf(state["fd"], mode | fcntl.LOCK_NB)
+                except IOError as error:
+                    if error.errno != errno.EACCES and error.errno != errno.EAGAIN:
+                        raise
+                    return False
+            if self.shared:
+                state["shared"] += 1
+            else:
+                state["exclusive"] = True
+            return True
+
+    def _enqueue(self) -> None:
+        """Draw a ticket at the end of the waiting queue."""
+        mode = "sh" if self.shared else "ex"
+        name = f"{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}-{mode}"
+        self._ticket = (name, _draw_ticket(self.queue_dir, name))
+
+    def _dequeue(self) -> None:
+        """Return the ticket of the waiting queue if any."""
+        if self._ticket is None:
+            return
+        name, ticket = self._ticket
+        self._ticket = None
+        _return_ticket(self.queue_dir, name, ticket)
+
+    def _is_next(self) -> bool:
+        """
+        Check whether no previous waiter is still in the queue.
+
+        Shared lock waiters can only be blocked by previous exclusive waiters.
+
+        :returns: whether it is the turn of the current waiter
+        """
+        name, _ = self._ticket
+        ahead = _tickets_ahead(self.queue_dir, name)
+        if self.shared:
+            ahead = [other for other in ahead if not other.endswith("-sh")]
+        return len(ahead) == 0
+
+
+def _draw_ticket(queue_dir: str, name: str) -> Any:
+    """
+    Draw a ticket in a queue of waiters shared among processes.
+
+    :param queue_dir: directory of the waiting queue
+    :param name: name of the ticket determining its position in the queue
+    :returns: the opened ticket file locked for as long as it is kept open
+    """
+    os.makedirs(queue_dir, exist_ok=True)
+    # the ticket has to be locked before it becomes visible to other waiters
+    draft = os.path.join(queue_dir, "." + name)
+    ticket = open(draft, "wb")
+    fcntl.flock(ticket, fcntl.LOCK_EX)
+    os.rename(draft, os.path.join(queue_dir, name))
+    return ticket
+
+
+def _return_ticket(queue_dir: str, name: str, ticket: Any) -> None:
+    """
+    Return a ticket to leave a queue of waiters.
+
+    :param queue_dir: directory of the waiting queue
+    :param name: name of the ticket
+    :param ticket: opened ticket file
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(os.path.join(queue_dir, name))
+    ticket.close()
+
+
+def _tickets_ahead(queue_dir: str, name: str) -> list[str]:
+    """
+    Get all tickets of waiters ahead in a queue.
+
+    Tickets of crashed waiters are detected from their released locks and
+    removed from the queue.
+
+    :param queue_dir: directory of the waiting queue
+    :param name: name of the ticket of the current waiter
+    :returns: names of the tickets ahead of the current one
+    """
+    ahead = []
+    for other in sorted(os.listdir(queue_dir)):
+        if other.startswith("."):
+            continue
+        if other >= name:
+            break
+        other_path = os.path.join(queue_dir, other)
+        try:
+            with open(other_path, "rb") as other_ticket:
+                fcntl.flock(other_ticket, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except FileNotFoundError:
+            continue
+        except IOError as error:
+            if error.errno != errno.EWOULDBLOCK:
+                raise
+            ahead.append(other)
+            continue
+        logging.warning(f"Removing stale ticket {other_path}")
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(other_path)
+    return ahead
+
+
+class _FileWatch:
+    """Wakeup events about released lock files or removed lock tickets."""
+
+    #: inotify event masks for touched or closed files and removed directory entries
+    IN_ATTRIB, IN_CLOSE_WRITE, IN_DELETE = 0x4, 0x8, 0x200
+
+    def __init__(self, paths: list[str]) -> None:
+        """
+        Start watching a list of paths for wakeup events.
+
+        :param paths: lock files or lock ticket directories to watch
+        """
+        self.fd = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        mask = self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_DELETE
+        for path in paths:
+            if libc.inotify_add_watch(fd, path.encode(), mask) < 0:
+                os.close(fd)
+                return
+        self.fd = fd
+
+    @property
+    def active(self) -> bool:
+        """Whether wakeup events are delivered at all."""
+        return self.fd is not None
+
+    def wait(self, timeout: float) -> None:
+        """
+        Wait for a wakeup event or a timeout.
+
+        :param timeout: maximal time to wait
+        """
+        if self.fd is None:
+            time.sleep(timeout)
+            return
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            with contextlib.suppress(BlockingIOError):
+                while os.read(self.fd, 4096):
+                    pass
+
+    def close(self) -> None:
+        """Stop watching for wakeup events."""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+@contextlib.contextmanager
+def image_lock(
+    resource_path: str, timeout: int = 300, shared: bool = False, fair: bool = False
+) -> Generator[Any, None, None]:
+    """
+    Wait for a lock to free image for state pool operations.
+
+    :param resource_path: path to the potentially locked resource
+    :param timeout: timeout to wait before erroring out (default 5 mins)
+    :param shared: whether to share the lock with other shared lock holders
+    :param fair: whether to acquire the lock only after all previous waiters
+    """
+    lock = ImageLock(resource_path, timeout, shared=shared, fair=fair)
+    lock.acquire()
+    try:
+        yield lock.fd
+    finally:
+        lock.release()
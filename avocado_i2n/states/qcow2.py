@@ -27,9 +27,11 @@ INTERFACE
 """
 
 import os
-import re
+import glob
 import json
-import shutil
+import errno
+import contextlib
+import threading
 from typing import Any
 import logging as log
 
@@ -37,33 +39,95 @@ from virttest import env_process
 from virttest.qemu_storage import QemuImg
 from virttest.utils_params import Params
 
-from .pool import RootSourcedStateBackend, SourcedStateBackend
+from .pool import (
+    RootSourcedStateBackend,
+    SourcedStateBackend,
+    TransferOps,
+    PoolCollector,
+)
 
 
 logging = log.getLogger("avocado.job." + __name__)
 
 
-#: off qemu states regex (0 vm size)
-QEMU_OFF_STATES_REGEX = re.compile(
-    r"^\d+\s+([\w\.-]+)\s*(0 B)\s+\d{4}-\d\d-\d\d", flags=re.MULTILINE
-)
-#: on qemu states regex (>0 vm size)
-QEMU_ON_STATES_REGEX = re.compile(
-    r"^\d+\s+([\w\.-]+)\s*(?!0 B)(\d+e?[\-\+]?[\.\d]* \w+)\s+\d{4}-\d\d-\d\d",
-    flags=re.MULTILINE,
-)
-
-
 class QCOW2Backend(RootSourcedStateBackend):
     """Backend manipulating image states as internal QCOW2 snapshots."""
 
     _require_running_object = False
 
+    #: cached snapshot table and identity (mtime and size) per image file
+    _snapshots = {}
+    _lock = threading.Lock()
+
     @classmethod
     def state_type(cls) -> str:
         """State type string representation depending used for logging."""
         return "on/vm" if cls._require_running_object else "off/image"
 
+    @staticmethod
+    def get_image_key(image_file: str) -> tuple[int, int] | None:
+        """
+        Get the identity of an image file used to validate its snapshot table.
+
+        :param image_file: path to the image file
+        :returns: modification time and size of the image or None if missing
+        """
+        try:
+            stat = os.stat(image_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def get_snapshots(cls, qemu_img: QemuImg) -> dict[str, int]:
+        """
+        Get the snapshot table of an image parsing it only if the image changed.
+
+        :param qemu_img: image whose internal snapshots to list
+        :returns: vm state size of each snapshot by snapshot name
+        """
+        image_file = qemu_img.image_filename
+        # take the identity before reading so that later changes invalidate it
+        key = cls.get_image_key(image_file)
+        with cls._lock:
+            cached = cls._snapshots.get(image_file)
+        if key is not None and cached is not None and cached[0] == key:
+            return dict(cached[1])
+        image_info = qemu_img.info(force_share=True, output="json")
+        snapshots = {}
+        if image_info is not None:
+            for snapshot in json.loads(image_info).get("snapshots", []):
+                snapshots[snapshot["name"]] = snapshot["vm-state-size"]
+        with cls._lock:
+            if key is None:
+                cls._snapshots.pop(image_file, None)
+            else:
+                cls._snapshots[image_file] = (key, snapshots)
+        return dict(snapshots)
+
+    @classmethod
+    def _update_snapshots(
+        cls, image_file: str, state: str, vm_state_size: int | None = None
+    ) -> None:
+        """
+        Update the cached snapshot table of an image after changing its snapshots.
+
+        :param image_file: path to the image file
+        :param state: name of the created or removed snapshot
+        :param vm_state_size: vm state size of a created snapshot or None if removed
+        """
+        key = cls.get_image_key(image_file)
+        with cls._lock:
+            cached = cls._snapshots.pop(image_file, None)
+            if cached is None or key is None:
+                return
+            snapshots = dict(cached[1])
+            if vm_state_size is None:
+                snapshots.pop(state, None)
+            else:
+                snapshots[state] = vm_state_size
+            cls._snapshots[image_file] = (key, snapshots)
+
     @classmethod
     def show(cls, params: Params, object: Any = None) -> list[str]:
         """
@@ -77,22 +141,17 @@ class QCOW2Backend(RootSourcedStateBackend):
             cls.state_type(),
             params["images"],
         )
-        on_snapshots_dump = qemu_img.snapshot_list(force_share=True)
-        pattern = (
-            QEMU_ON_STATES_REGEX
-            if cls._require_running_object
-            else QEMU_OFF_STATES_REGEX
-        )
-        state_tuples = re.findall(pattern, on_snapshots_dump)
         states = []
-        for state_tuple in state_tuples:
+        for state, vm_state_size in cls.get_snapshots(qemu_img).items():
+            if (vm_state_size > 0) != cls._require_running_object:
+                continue
             logging.debug(
                 "Detected %s state '%s' of size %s",
                 cls.state_type(),
-                state_tuple[0],
-                state_tuple[1],
+                state,
+                vm_state_size,
             )
-            states.append(state_tuple[0])
+            states.append(state)
         return states
 
     @classmethod
@@ -130,6 +189,7 @@ class QCOW2Backend(RootSourcedStateBackend):
             "Creating %s state '%s' of %s/%s", cls.state_type(), state, vm_name, image
         )
         qemu_img.snapshot_create()
+        cls._update_snapshots(qemu_img.image_filename, state, 0)
 
     @classmethod
     def unset(cls, params: Params, object: Any = None) -> None:
@@ -148,6 +208,7 @@ class QCOW2Backend(RootSourcedStateBackend):
             "Removing %s state '%s' of %s/%s", cls.state_type(), state, vm_name, image
         )
         qemu_img.snapshot_del()
+        cls._update_snapshots(qemu_img.image_filename, state)
 
     @classmethod
     def _check_root(cls, params: Params, object: Any = None) -> bool:
@@ -305,6 +366,7 @@ class QCOW2ExtBackend(SourcedStateBackend, QCOW2Backend):
             image_name,
         )
         qemu_img.create(params, ignore_errors=False)
+        PoolCollector.touch(params["image_name_snapshot"] + ".qcow2")
 
     @classmethod
     def _set(cls, params: Params, object: Any = None) -> None:
@@ -355,14 +417,61 @@ class QCOW2ExtBackend(SourcedStateBackend, QCOW2Backend):
                 )
                 os.makedirs(image_dir, exist_ok=True)
                 os.unlink(state_file)
-                shutil.copy(qemu_img.image_filename, state_file)
+                cls._freeze(qemu_img.image_filename, state_file, params, object)
             else:
                 raise RuntimeError(
                     "Cannot perform nontrivial pre-existing state overwrite for qcow2ext"
                 )
         else:
             os.makedirs(image_dir, exist_ok=True)
-            shutil.copy(qemu_img.image_filename, state_file)
+            cls._freeze(qemu_img.image_filename, state_file, params, object)
+
+    @classmethod
+    def _freeze(
+        cls, image_file: str, state_file: str, params: Params, object: Any = None
+    ) -> None:
+        """
+        Freeze the current top image into a state file.
+
+        :param image_file: path to the current top (pointer) image
+        :param state_file: path to the state file to create
+        :param params: configuration parameters
+        :param object: object whose states are manipulated
+        :raises: :py:class:`ValueError` if the freeze mode is invalid
+
+        The `qcow2ext_freeze` mode can be "copy" to perform a sparse-aware
+        (or copy-on-write) copy of the top image or "rebase" to move the top
+        image to the state file and recreate it as an empty overlay on top of
+        the new state, avoiding any data copying for offline objects.
+        """
+        freeze_mode = params.get("qcow2ext_freeze", "copy")
+        if freeze_mode not in ["copy", "rebase"]:
+            raise ValueError(
+                f"Invalid freeze mode {freeze_mode}, must be one of copy, rebase"
+            )
+        if freeze_mode == "rebase" and object is not None and object.is_alive():
+            logging.debug("Cannot rebase the image of a running vm, copying instead")
+        elif freeze_mode == "rebase":
+            try:
+                os.rename(image_file, state_file)
+            except OSError as error:
+                if error.errno != errno.EXDEV:
+                    raise
+                logging.debug(f"Cannot move {image_file} across filesystems")
+            else:
+                vm_name, image_name = params["vms"], params["images"]
+                pointer_params = params.copy()
+                pointer_params["image_chain"] = f"snapshot {image_name}"
+                pointer_params["image_name_snapshot"] = state_file[:-6]
+                pointer_params["image_format_snapshot"] = "qcow2"
+                qemu_img = QemuImg(
+                    pointer_params,
+                    os.path.join(params["vms_base_dir"], vm_name),
+                    image_name,
+                )
+                qemu_img.create(pointer_params, ignore_errors=False)
+                return
+        TransferOps.copy_file(image_file, state_file, params)
 
     @classmethod
     def _unset(cls, params: Params, object: Any = None) -> None:
@@ -387,7 +496,12 @@ class QCOW2ExtBackend(SourcedStateBackend, QCOW2Backend):
             image_name,
         )
         # TODO: should we move to pointer image in case removed state is in backing chain?
-        os.unlink(os.path.join(image_dir, state + ".qcow2"))
+        state_file = os.path.join(image_dir, state + ".qcow2")
+        os.unlink(state_file)
+        # compressed upload artifacts are obsolete without their state
+        for artifact in glob.glob(f"{glob.escape(state_file)}.*.compressed"):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(artifact)
 
     @classmethod
     def check_root(cls, params: Params, object: Any = None) -> bool:
@@ -432,7 +546,7 @@ class QCOW2VTBackend(QCOW2Backend):
     _require_running_object = True
 
     @classmethod
-    def show(cls, params: Params, object: Any = None) -> set[str]:
+    def show(cls, params: Params, object: Any = None) -> list[str]:
         """
         Return a list of available states of a specific type.
 
@@ -441,17 +555,17 @@ class QCOW2VTBackend(QCOW2Backend):
         logging.debug(
             f"Showing {cls.state_type()} internal states for vm {params['vms']}"
         )
-        states = set()
+        states = None
         for image_name in params.objects("images"):
             image_params = params.object_params(image_name)
             # TODO: refine method arguments by providing at least the image name directly
             image_params["images"] = image_name
             image_states = super().show(image_params, object=object)
-            if len(states) == 0:
+            if states is None:
                 states = image_states
             else:
-                states = states.intersect(image_states)
-        return states
+                states = [state for state in states if state in image_states]
+        return states or []
 
     @classmethod
     def get(cls, params: Params, object: Any = None) -> None:
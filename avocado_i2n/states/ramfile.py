@@ -31,8 +31,11 @@ from typing import Any
 import logging as log
 
 from virttest import env_process
-from virttest.virt_vm import VMCreateError
+from virttest import qemu_migration
+from virttest import utils_misc
+from virttest.virt_vm import VMCreateError, VMMigrateFailedError, VMMigrateTimeoutError
 from virttest.utils_params import Params
+from virttest.qemu_capabilities import Flags
 
 from .pool import SourcedStateBackend
 
@@ -40,11 +43,204 @@ from .pool import SourcedStateBackend
 logging = log.getLogger("avocado.job." + __name__)
 
 
+#: magic bytes, compression, and decompression commands of supported compressors
+COMPRESSORS = {
+    "gzip": (b"\x1f\x8b", "gzip -c", "gzip -dc"),
+    "zstd": (b"\x28\xb5\x2f\xfd", "zstd -q -T0 -c", "zstd -q -dc"),
+}
+#: magic bytes of uncompressed migration streams
+STREAM_MAGIC = b"QEVM"
+#: size of the stream header with the configuration section listing the
+#: validated migration capabilities like the mapped ram file format
+STREAM_HEADER_SIZE = 4096
+
+
 class RamfileBackend(SourcedStateBackend):
     """Backend manipulating vm states as ram dump files."""
 
     image_state_backend = None
 
+    @staticmethod
+    def _get_compression(state_file: str) -> str | None:
+        """
+        Detect the compression of a ram dump file from its magic bytes.
+
+        :param state_file: path to the ram dump file
+        :returns: name of the compressor or none for uncompressed dumps
+        """
+        try:
+            with open(state_file, "rb") as handle:
+                magic = handle.read(4)
+        except OSError:
+            return None
+        for compression, (compression_magic, _, _) in COMPRESSORS.items():
+            if magic.startswith(compression_magic):
+                return compression
+        return None
+
+    @staticmethod
+    def _get_format(state_file: str) -> str:
+        """
+        Detect the file format of a ram dump file from its stream header.
+
+        :param state_file: path to the ram dump file
+        :returns: "mapped" for the mapped ram file format or else "stream"
+        """
+        try:
+            with open(state_file, "rb") as handle:
+                header = handle.read(STREAM_HEADER_SIZE)
+        except OSError:
+            return "stream"
+        if header.startswith(STREAM_MAGIC) and b"mapped-ram" in header:
+            return "mapped"
+        return "stream"
+
+    @staticmethod
+    def _enable_mapped_ram(params: Params, vm: Any) -> None:
+        """
+        Enable the mapped ram file format and its parallel transfer for a vm.
+
+        :param params: configuration parameters
+        :param vm: vm whose migration capabilities to set
+        """
+        vm.monitor.set_migrate_capability(True, "mapped-ram")
+        channels = params.get_numeric("ramfile_multifd_channels", 4)
+        if channels > 0:
+            vm.monitor.set_migrate_capability(True, "multifd")
+            vm.monitor.set_migrate_parameter("multifd-channels", channels)
+
+    @classmethod
+    def _save(cls, params: Params, vm: Any, state_file: str) -> None:
+        """
+        Save the ram of a paused vm to a file.
+
+        :param params: configuration parameters
+        :param vm: paused vm to save
+        :param state_file: path to the ram dump file
+        :raises: :py:class:`ValueError` if the compression or ram file format is invalid
+        :raises: :py:class:`VMMigrateFailedError` if the save failed
+        :raises: :py:class:`VMMigrateTimeoutError` if the save didn't complete in time
+
+        Unless compressing, using the mapped ram file format, or resuming the vm
+        afterwards, the built-in save is used which also resets the vm. Otherwise
+        the migration stream is piped through the configured compressor or written
+        with pages at fixed file offsets while the vm is left paused with all its
+        images inactive, i.e. flushed and unlocked, until it is resumed.
+        """
+        compression = params.get("ramfile_compression", "")
+        ramfile_format = params.get("ramfile_format", "stream")
+        if ramfile_format not in ["stream", "mapped"]:
+            raise ValueError(
+                f"Invalid ram file format {ramfile_format}, must be one of stream, mapped"
+            )
+        if compression and compression not in COMPRESSORS:
+            raise ValueError(
+                f"Invalid compression {compression}, must be one of "
+                f"{', '.join(COMPRESSORS.keys())}"
+            )
+        if ramfile_format == "mapped":
+            if compression:
+                raise ValueError("Cannot compress ram dumps in the mapped format")
+            uri = f"file:{state_file}"
+        elif compression or params.get("ramfile_set_mode", "restore") != "restore":
+            compress_cmd = COMPRESSORS[compression][1] if compression else "cat"
+            uri = f"exec:{compress_cmd}>{state_file}"
+        else:
+            vm.save_to_file(state_file)
+            return
+        vm.verify_status("paused")
+        if ramfile_format == "mapped":
+            cls._enable_mapped_ram(params, vm)
+        # same migration speed and downtime as for the built-in save
+        qemu_migration.set_speed(vm, str(2 << 39))
+        qemu_migration.set_downtime(vm, vm.MIGRATE_TIMEOUT)
+        logging.debug(f"Saving vm {vm.name} to {uri}")
+        try:
+            vm.monitor.migrate(uri, wait=False)
+
+            def save_completed() -> bool:
+                status = str(vm.monitor.info("migrate"))
+                if "failed" in status:
+                    raise VMMigrateFailedError(f"Saving to {state_file} failed")
+                return "completed" in status
+
+            if not utils_misc.wait_for(save_completed, vm.MIGRATE_TIMEOUT, step=1):
+                raise VMMigrateTimeoutError(
+                    f"Timeout expired while waiting for saving to {state_file}"
+                )
+        finally:
+            qemu_migration.set_speed(vm, str(32 << 20))
+            qemu_migration.set_downtime(vm, 0.3)
+
+    @classmethod
+    def _restore(cls, params: Params, vm: Any, state_file: str) -> None:
+        """
+        Restore the ram of a vm from a file leaving the vm paused.
+
+        :param params: configuration parameters
+        :param vm: vm to restore
+        :param state_file: path to the ram dump file
+        :raises: :py:class:`ValueError` if the vm is still migrating afterwards
+                 or if the mapped ram file format is not supported
+
+        The compression and the file format are detected from the ram dump
+        itself regardless of the current configuration. Ram dumps in the mapped
+        ram file format are loaded with pages read directly from their fixed
+        file offsets by parallel multifd channels and with zero pages never
+        read at all.
+        """
+        compression = cls._get_compression(state_file)
+        ramfile_format = "stream" if compression else cls._get_format(state_file)
+        if ramfile_format == "stream" and compression is None:
+            vm.restore_from_file(state_file)
+            return
+        if (
+            ramfile_format == "mapped"
+            and vm.devices is not None
+            and not vm.check_capability(Flags.INCOMING_DEFER)
+        ):
+            raise ValueError(
+                "Mapped ram file format requires deferred incoming migration"
+            )
+        if vm.is_alive():
+            vm.destroy(gracefully=False, free_mac_addresses=False)
+        logging.debug(f"Restoring vm {vm.name} from {state_file} ({ramfile_format})")
+        if ramfile_format == "mapped":
+            # the incoming migration mode is irrelevant as long as it is deferred
+            vm.create(
+                name=vm.name,
+                params=vm.params,
+                root_dir=vm.root_dir,
+                timeout=vm.MIGRATE_TIMEOUT,
+                migration_mode="unix",
+                mac_source=vm,
+            )
+            if not vm.deferral_incoming:
+                # the capabilities are only known after the vm was defined
+                vm.destroy(gracefully=False, free_mac_addresses=False)
+                raise ValueError(
+                    "Mapped ram file format requires deferred incoming migration"
+                )
+            cls._enable_mapped_ram(params, vm)
+            vm.monitor.migrate_incoming(f"file:{state_file}")
+        else:
+            vm.create(
+                name=vm.name,
+                params=vm.params,
+                root_dir=vm.root_dir,
+                timeout=vm.MIGRATE_TIMEOUT,
+                migration_mode="exec",
+                migration_exec_cmd=f"{COMPRESSORS[compression][2]} {state_file}",
+                mac_source=vm,
+            )
+        if not utils_misc.wait_for(
+            lambda: not vm.monitor.verify_status("inmigrate"),
+            timeout=vm.MIGRATE_TIMEOUT,
+            step=1,
+        ):
+            raise ValueError("Still paused inmigrate monitor status")
+        vm.verify_status("paused")
+
     @classmethod
     def _show(cls, params: Params, object: Any = None) -> list[str]:
         """
@@ -57,31 +253,37 @@ class RamfileBackend(SourcedStateBackend):
             f"Showing external states for vm {params['vms']} locally in {state_dir}"
         )
         vm_dir = os.path.join(state_dir, params["object_id"])
-        snapshots = os.listdir(vm_dir)
 
-        images_states = set()
+        images_states = None
         for image_name in params.objects("images"):
             image_params = params.object_params(image_name)
             # TODO: refine method arguments by providing at least the image name directly
             image_params["images"] = image_name
             image_snapshots = cls.image_state_backend.show(image_params, object=object)
-            if len(images_states) == 0:
-                images_states = image_snapshots
+            if images_states is None:
+                images_states = set(image_snapshots)
             else:
-                images_states = images_states.intersect(image_snapshots)
+                images_states &= set(image_snapshots)
+            if not images_states:
+                # memory states are only complete with states of all images
+                break
+        images_states = images_states or set()
 
         states = []
-        for snapshot in snapshots:
-            if not snapshot.endswith(".state"):
-                continue
-            size = os.stat(os.path.join(vm_dir, snapshot)).st_size
-            state = snapshot[:-6]
-            logging.debug(
-                f"Detected memory state '{snapshot}' of size "
-                f"{round(size / 1024**3, 3)} GB ({size})"
-            )
-            if state in images_states:
-                logging.debug(f"Memory state '{snapshot}' is a complete vm state")
+        with os.scandir(vm_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".state"):
+                    continue
+                state = entry.name[:-6]
+                if state not in images_states:
+                    continue
+                if logging.isEnabledFor(log.DEBUG):
+                    # only stat for logging as the size is not needed otherwise
+                    size = entry.stat().st_size
+                    logging.debug(
+                        f"Detected memory state '{entry.name}' of size "
+                        f"{round(size / 1024**3, 3)} GB ({size}) as a complete vm state"
+                    )
                 states.append(state)
         return states
 
@@ -105,7 +307,7 @@ class RamfileBackend(SourcedStateBackend):
         state_dir = params["swarm_pool"]
         vm_dir = os.path.join(state_dir, params["object_id"])
         state_file = os.path.join(vm_dir, params["check_state"] + ".state")
-        vm.restore_from_file(state_file)
+        cls._restore(params, vm, state_file)
         vm.resume(timeout=3)
 
     @classmethod
@@ -114,9 +316,21 @@ class RamfileBackend(SourcedStateBackend):
         Store a state saving the current changes.
 
         All arguments match the base class.
+
+        The `ramfile_set_mode` can be "restore" to destroy the vm before setting
+        its image states and restore it from the saved ram afterwards or "resume"
+        to set the image states while the saved vm is paused with inactive images
+        and simply resume it afterwards, skipping a full ram reload. The latter
+        is only suitable for image backends that can take states of the images of
+        a running (yet paused) vm.
         """
         vm, vm_name = object, params["vms"]
         logging.info("Setting vm state '%s' of %s", params["set_state"], vm_name)
+        set_mode = params.get("ramfile_set_mode", "restore")
+        if set_mode not in ["restore", "resume"]:
+            raise ValueError(
+                f"Invalid set mode {set_mode}, must be one of restore, resume"
+            )
         vm.pause()
 
         state_dir = params["swarm_pool"]
@@ -124,8 +338,9 @@ class RamfileBackend(SourcedStateBackend):
         state_file = os.path.join(vm_dir, params["check_state"] + ".state")
         if os.path.exists(state_file):
             os.unlink(state_file)
-        vm.save_to_file(state_file)
-        vm.destroy(gracefully=False)
+        cls._save(params, vm, state_file)
+        if set_mode == "restore":
+            vm.destroy(gracefully=False)
 
         for image_name in params.objects("images"):
             image_params = params.object_params(image_name)
@@ -136,7 +351,8 @@ class RamfileBackend(SourcedStateBackend):
         # BUG: because the built-in functionality uses system_reset
         # which leads to unclean file systems in some cases it is
         # better to restore from the saved state
-        vm.restore_from_file(state_file)
+        if set_mode == "restore":
+            cls._restore(params, vm, state_file)
         vm.resume(timeout=3)
 
     @classmethod
@@ -27,7 +27,11 @@ INTERFACE
 """
 
 import os
+import threading
+import contextlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any
+from typing import Callable
 from typing import Generator
 import logging as log
 
@@ -36,6 +40,8 @@ from avocado_vt.test import VirtTest
 from virttest.utils_env import Env
 from virttest.utils_params import Params
 
+from ..params_parser import ParamsView
+
 
 logging = log.getLogger("avocado.job." + __name__)
 
@@ -44,6 +50,7 @@ logging = log.getLogger("avocado.job." + __name__)
 __all__ = [
     "BACKENDS",
     "ROOTS",
+    "StateInventory",
     "show_states",
     "check_states",
     "get_states",
@@ -146,6 +153,162 @@ BACKENDS = {}
 ROOTS = ["root", "0root", "boot", "0boot"]
 
 
+class StateInventory:
+    """
+    An inventory of available states memoizing state backend listings.
+
+    Listings are kept per backend, location, object, and image for the
+    lifetime of the current process and are dropped for an entire object
+    as soon as any of its states is retrieved, stored, or removed. Listings
+    that involve shared pool sources could be changed by other workers at
+    any time and are thus never kept beyond a single state operation.
+
+    In addition, all lower level listings and root checks of a backend are
+    shared among the state check and the actual state operation that follows
+    it on the same object within the same thread.
+    """
+
+    _listings = {}
+    #: incremented on every invalidation to discard listings in progress
+    _generation = 0
+    _lock = threading.Lock()
+    #: results of the state operation currently performed by each thread
+    _operations = threading.local()
+
+    @staticmethod
+    def get_key(params: Params) -> tuple[str, ...]:
+        """
+        Get the inventory key of the states of a parametric object.
+
+        :param params: parameters of the parametric object
+        :returns: backend, location, object identifier, and image of the states
+        """
+        return (
+            params["states"],
+            params.get("show_location", ""),
+            params.get("pool_scope", ""),
+            params["object_type"],
+            params.get("object_id", params["object_name"]),
+            (
+                params.get("images", "")
+                if params["object_type"].endswith("images")
+                else ""
+            ),
+        )
+
+    @classmethod
+    def show(
+        cls, backend: type[StateBackend], params: Params, object: Any = None
+    ) -> list[str]:
+        """
+        Return a list of available states reusing a previous listing if possible.
+
+        :param backend: state backend to list the states with
+        :param params: configuration parameters
+        :param object: object whose states are manipulated
+        :returns: list of detected states
+        """
+        if not params.get_boolean("states_inventory_cache"):
+            return backend.show(params, object)
+        if getattr(backend, "transport", None) is not None and any(
+            scope != "own" for scope in params.get_list("pool_scope")
+        ):
+            return backend.show(params, object)
+        key = cls.get_key(params)
+        with cls._lock:
+            if key in cls._listings:
+                return list(cls._listings[key])
+            generation = cls._generation
+        states = backend.show(params, object)
+        with cls._lock:
+            if generation == cls._generation:
+                cls._listings[key] = list(states)
+        return states
+
+    @classmethod
+    @contextlib.contextmanager
+    def operation(cls) -> Generator[None, None, None]:
+        """
+        Share listings and root checks within a state operation of an object.
+
+        Nested contexts reuse the results of the outermost context.
+        """
+        if getattr(cls._operations, "results", None) is not None:
+            yield
+            return
+        cls._operations.results = {}
+        try:
+            yield
+        finally:
+            cls._operations.results = None
+
+    @classmethod
+    def reuse(
+        cls, function: Callable[[Params, Any], Any], params: Params, object: Any = None
+    ) -> Any:
+        """
+        Call a listing or root check reusing its result within the current operation.
+
+        :param function: backend function listing states or checking roots
+        :param params: configuration parameters
+        :param object: object whose states are manipulated
+        :returns: the (possibly reused) result of the function
+        """
+        results = getattr(cls._operations, "results", None)
+        if results is None:
+            return function(params, object)
+        key = (
+            function,
+            params.get("show_location", ""),
+            params.get("pool_scope", ""),
+            params["object_type"].split("/")[-1],
+            params.get("nets", ""),
+            params.get("vms", ""),
+            params.get("images", ""),
+        )
+        if key not in results:
+            results[key] = function(params, object)
+        result = results[key]
+        return list(result) if isinstance(result, list) else result
+
+    @classmethod
+    def invalidate(cls, params: Params = None, persistent: bool = True) -> None:
+        """
+        Drop all listings of a parametric object or of all objects.
+
+        :param params: parameters of the parametric object or none for all
+        :param persistent: whether to also drop listings beyond the current operation
+        """
+        if getattr(cls._operations, "results", None):
+            cls._operations.results.clear()
+        if not persistent:
+            return
+        with cls._lock:
+            cls._generation += 1
+            if params is None:
+                cls._listings.clear()
+                return
+            object_id = cls.get_key(params)[4]
+            for key in [k for k in cls._listings if k[4] == object_id]:
+                del cls._listings[key]
+
+    @classmethod
+    @contextlib.contextmanager
+    def update(
+        cls, params: Params, persistent: bool = True
+    ) -> Generator[None, None, None]:
+        """
+        Modify the states of a parametric object within a context.
+
+        :param params: parameters of the parametric object
+        :param persistent: whether to also drop listings beyond the current operation
+        """
+        try:
+            yield
+        finally:
+            cls.invalidate(params, persistent)
+
+
 def _parametric_object_iteration(
     params: dict[str, str], composites: list[tuple[str, str]] = None
 ) -> Generator[Params, None, None]:
@@ -168,14 +331,14 @@ def _parametric_object_iteration(
     composites.append(None)
     for params_obj_name in params.objects(params_obj_type):
         composites[-1] = (params_obj_name, params_obj_type)
-        obj_params = params.object_params(params_obj_name)
+        obj_params = ParamsView(params, params_obj_name)
         obj_params[params_obj_type] = params_obj_name
         obj_params["object_name"] = "/".join([c[0] for c in composites])
         obj_params["object_type"] = "/".join([c[1] for c in composites])
         if params_obj_type != object_composition[-1]:
             yield from _parametric_object_iteration(obj_params, composites)
         # object type parameters don't propagate downwards in the hierarchy
-        obj_type_params = obj_params.object_params(params_obj_type)
+        obj_type_params = ParamsView(obj_params, params_obj_type)
         yield obj_type_params
     composites.pop()
 
@@ -217,6 +380,74 @@ def _state_check_chain(
     return state_exists
 
 
+def _parametric_object_operation(
+    operation: Callable[[Params, Env], None], run_params: Params, env: Env = None
+) -> None:
+    """
+    Perform a state operation on each object from a hierarchy of parametric objects.
+
+    :param operation: state operation on a single parametric object
+    :param run_params: configuration parameters
+    :param env: test environment or nothing if not needed
+    :raises: :py:class:`exceptions.TestError` if the operation failed for
+             multiple objects (an error for a single object is reraised)
+
+    Objects are processed in sequence unless `states_concurrency` allows for
+    multiple threads in which case each object is processed as soon as all
+    objects composing it (e.g. all images of a vm) are processed and skipped
+    if any of them failed.
+    """
+    concurrency = run_params.get_numeric("states_concurrency", 1)
+    if concurrency <= 1:
+        for state_params in _parametric_object_iteration(run_params):
+            with StateInventory.operation():
+                operation(state_params, env)
+        return
+
+    def process(state_params: Params, dependencies: list[Future]) -> bool:
+        for dependency in dependencies:
+            if dependency.exception() is not None or not dependency.result():
+                logging.error(
+                    f"Skipping {state_params['object_type']} states of "
+                    f"{state_params['object_name']} due to failed composing objects"
+                )
+                return False
+        with StateInventory.operation():
+            operation(state_params, env)
+        return True
+
+    # composing objects precede the objects they compose in the iteration order
+    # and are thus always scheduled before any thread can wait on them
+    futures = {}
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="states"
+    ) as executor:
+        for state_params in list(_parametric_object_iteration(run_params)):
+            prefix = state_params["object_name"] + "/"
+            dependencies = [f for n, f in futures.items() if n.startswith(prefix)]
+            # threads get parameters detached from the shared parent parameters
+            futures[state_params["object_name"]] = executor.submit(
+                process, state_params.copy(), dependencies
+            )
+
+    errors = []
+    for params_obj_name, future in futures.items():
+        error = future.exception()
+        if error is not None:
+            logging.error(f"State operation for {params_obj_name} failed: {error}")
+            errors.append(error)
+    if len(errors) == 1:
+        raise errors[0]
+    elif len(errors) > 1:
+        # aborts (e.g. due to unavailable states) are more severe than errors
+        aborts = [e for e in errors if isinstance(e, exceptions.TestAbortError)]
+        error_class = exceptions.TestAbortError if aborts else exceptions.TestError
+        raise error_class(
+            f"State operation failed for {len(errors)} objects: "
+            + ", ".join(str(e) for e in errors)
+        ) from (aborts + errors)[0]
+
+
 def show_states(run_params: Params, env: Env = None) -> list[str]:
     """
     Return a list of available states of a specific type.
@@ -225,37 +456,40 @@ def show_states(run_params: Params, env: Env = None) -> list[str]:
     :param env: test environment or nothing if not needed
     :returns: list of detected states
     """
-    states = []
-    for state_params in _parametric_object_iteration(run_params):
-        params_obj_name = state_params["object_name"]
-        params_obj_type = state_params["object_type"]
-        if params_obj_type in state_params.objects("skip_types"):
-            continue
-        if params_obj_type == "nets/vms/images" and state_params.get_boolean(
-            "image_readonly", False
-        ):
-            logging.warning(
-                f"Incorrect configuration: cannot use any state "
-                f"from readonly image {params_obj_name} - skipping"
-            )
-            continue
+    from .pool import TransferOps
+
+    with TransferOps.cached_listings():
+        states = []
+        for state_params in _parametric_object_iteration(run_params):
+            params_obj_name = state_params["object_name"]
+            params_obj_type = state_params["object_type"]
+            if params_obj_type in state_params.objects("skip_types"):
+                continue
+            if params_obj_type == "nets/vms/images" and state_params.get_boolean(
+                "image_readonly", False
+            ):
+                logging.warning(
+                    f"Incorrect configuration: cannot use any state "
+                    f"from readonly image {params_obj_name} - skipping"
+                )
+                continue
 
-        logging.debug(
-            "Checking %s for available %s states using %s",
-            params_obj_name,
-            params_obj_type,
-            state_params["states"],
-        )
-        state_backend = BACKENDS[state_params["states"]]
-        params_obj_states = state_backend.show(state_params, env)
-        logging.info(
-            "Detected %s states for %s: %s",
-            params_obj_type,
-            params_obj_name,
-            ", ".join(params_obj_states),
-        )
-        states += params_obj_states
-    return states
+            logging.debug(
+                "Checking %s for available %s states using %s",
+                params_obj_name,
+                params_obj_type,
+                state_params["states"],
+            )
+            state_backend = BACKENDS[state_params["states"]]
+            params_obj_states = StateInventory.show(state_backend, state_params, env)
+            logging.info(
+                "Detected %s states for %s: %s",
+                params_obj_type,
+                params_obj_name,
+                ", ".join(params_obj_states),
+            )
+            states += params_obj_states
+        return states
 
 
 def check_states(run_params: Params, env: Env = None) -> bool:
@@ -268,86 +502,96 @@ def check_states(run_params: Params, env: Env = None) -> bool:
     .. note:: We can check for multiple states of multiple objects at the
         same time through our choice of configuration.
     """
-    for state_params in _parametric_object_iteration(run_params):
-        params_obj_name = state_params["object_name"]
-        params_obj_type = state_params["object_type"]
-        if params_obj_type in state_params.objects("skip_types"):
-            continue
-        if params_obj_type == "nets/vms/images" and state_params.get_boolean(
-            "image_readonly", False
-        ):
-            logging.warning(
-                f"Incorrect configuration: cannot use any state "
-                f"from readonly image {params_obj_name} - skipping"
-            )
-            continue
+    from .pool import TransferOps
+
+    with TransferOps.cached_listings():
+        for state_params in _parametric_object_iteration(run_params):
+            params_obj_name = state_params["object_name"]
+            params_obj_type = state_params["object_type"]
+            if params_obj_type in state_params.objects("skip_types"):
+                continue
+            if params_obj_type == "nets/vms/images" and state_params.get_boolean(
+                "image_readonly", False
+            ):
+                logging.warning(
+                    f"Incorrect configuration: cannot use any state "
+                    f"from readonly image {params_obj_name} - skipping"
+                )
+                continue
 
-        # if the snapshot is not defined skip (leaf tests that are no setup)
-        if not state_params.get("check_state"):
-            logging.debug(
-                f"Skip checking any {params_obj_type} state for {params_obj_name}"
-            )
-            continue
-        else:
-            state = state_params["check_state"]
-        # NOTE: there is no concept of "check_mode" here
-        state_params["check_opts"] = state_params.get("check_opts", "soft_boot=yes")
-        # TODO: document after experimental period
-        state_params["check_mode"] = state_params.get("check_mode", "rf")
-
-        state_backend = BACKENDS[state_params["states"]]
-        # TODO: we don't support other parametric object instances
-        vm = env.get_vm(state_params["vms"]) if env is not None else None
-        # TODO: consider whether we need this with more advanced env handling
-        # if vm is None and env is not None:
-        #    vm = env.create_vm(state_params.get('vm_type'), state_params.get('target'),
-        #                       params_obj_name, state_params, None)
-        state_object = env if params_obj_type == "nets" else vm
-
-        action_if_root_exists = state_params["check_mode"][0]
-        action_if_root_doesnt_exist = state_params["check_mode"][1]
-
-        # always check the corresponding root state as a prerequisite
-        root_exists = state_backend.check_root(state_params, state_object)
-        root_params = state_params.copy()
-        if not root_exists:
-            if action_if_root_doesnt_exist == "f":
-                root_params["pool_scope"] = "own"
-                state_backend.set_root(root_params, state_object)
-                root_exists = True
-            elif action_if_root_doesnt_exist == "r":
-                return False
-            else:
-                raise exceptions.TestError(
-                    f"Invalid policy {action_if_root_doesnt_exist}: The root "
-                    "nonexistence action can be either of 'reuse' or 'force'."
+            # if the snapshot is not defined skip (leaf tests that are no setup)
+            if not state_params.get("check_state"):
+                logging.debug(
+                    f"Skip checking any {params_obj_type} state for {params_obj_name}"
                 )
-        elif action_if_root_exists == "f":
-            root_params["pool_scope"] = "own"
-            # TODO: implement unset root for all parametric object types
-            if params_obj_type == "nets/vms":
-                vm.destroy(
-                    gracefully=root_params.get_dict("check_opts").get(
-                        "soft_boot", "yes"
+                continue
+            else:
+                state = state_params["check_state"]
+            # NOTE: there is no concept of "check_mode" here
+            state_params["check_opts"] = state_params.get("check_opts", "soft_boot=yes")
+            # TODO: document after experimental period
+            state_params["check_mode"] = state_params.get("check_mode", "rf")
+
+            state_backend = BACKENDS[state_params["states"]]
+            # TODO: we don't support other parametric object instances
+            vm = env.get_vm(state_params["vms"]) if env is not None else None
+            # TODO: consider whether we need this with more advanced env handling
+            # if vm is None and env is not None:
+            #    vm = env.create_vm(state_params.get('vm_type'), state_params.get('target'),
+            #                       params_obj_name, state_params, None)
+            state_object = env if params_obj_type == "nets" else vm
+
+            action_if_root_exists = state_params["check_mode"][0]
+            action_if_root_doesnt_exist = state_params["check_mode"][1]
+
+            # always check the corresponding root state as a prerequisite
+            root_exists = state_backend.check_root(state_params, state_object)
+            root_params = state_params.copy()
+            if not root_exists:
+                if action_if_root_doesnt_exist == "f":
+                    root_params["pool_scope"] = "own"
+                    with StateInventory.update(root_params):
+                        state_backend.set_root(root_params, state_object)
+                    root_exists = True
+                elif action_if_root_doesnt_exist == "r":
+                    return False
+                else:
+                    raise exceptions.TestError(
+                        f"Invalid policy {action_if_root_doesnt_exist}: The root "
+                        "nonexistence action can be either of 'reuse' or 'force'."
                     )
-                    == "yes"
-                )
+            elif action_if_root_exists == "f":
+                root_params["pool_scope"] = "own"
+                with StateInventory.update(root_params):
+                    # TODO: implement unset root for all parametric object types
+                    if params_obj_type == "nets/vms":
+                        vm.destroy(
+                            gracefully=root_params.get_dict("check_opts").get(
+                                "soft_boot", "yes"
+                            )
+                            == "yes"
+                        )
+                    else:
+                        state_backend.unset_root(root_params, state_object)
+                    state_backend.set_root(root_params, state_object)
+                root_exists = True
             else:
-                state_backend.unset_root(root_params, state_object)
-            state_backend.set_root(root_params, state_object)
-            root_exists = True
-        else:
-            state_backend.get_root(root_params, state_object)
+                # provisioning roots for checks only completes missing roots
+                # and thus only affects root checks within the same operation
+                with StateInventory.update(root_params, persistent=False):
+                    state_backend.get_root(root_params, state_object)
 
-        if state in ROOTS:
-            state_exists = root_exists
-        else:
-            state_exists = state in state_backend.show(state_params, state_object)
+            if state in ROOTS:
+                state_exists = root_exists
+            else:
+                state_exists = state in StateInventory.show(
+                    state_backend, state_params, state_object
+                )
 
-        if not state_exists:
-            return False
+            if not state_exists:
+                return False
 
-    return True
+        return True
 
 
 def get_states(run_params: Params, env: Env = None) -> None:
@@ -359,81 +603,132 @@ def get_states(run_params: Params, env: Env = None) -> None:
         the vm is unavailable from the env, or snapshot exists in passive mode (abort)
     :raises: :py:class:`exceptions.TestError` if invalid policy was used
     """
-    for state_params in _parametric_object_iteration(run_params):
-        params_obj_name = state_params["object_name"]
-        params_obj_type = state_params["object_type"]
-        if params_obj_type in state_params.objects("skip_types"):
-            logging.debug(
-                f"Skip getting states of types {', '.join(state_params.objects('skip_types'))}"
-            )
-            continue
-        if params_obj_type == "nets/vms/images" and state_params.get_boolean(
-            "image_readonly", False
-        ):
-            logging.warning(
-                f"Incorrect configuration: cannot use any state "
-                f"from readonly image {params_obj_name} - skipping"
-            )
-            continue
+    _parametric_object_operation(_get_object_states, run_params, env)
 
-        # if the state is not defined skip (leaf tests that are no setup)
-        if not state_params.get("get_state"):
-            logging.debug(
-                f"Skip getting any {params_obj_type} state for {params_obj_name}"
-            )
-            continue
-        else:
-            state = state_params["get_state"]
-        state_params["get_mode"] = state_params.get("get_mode", "ra")
 
-        logging.info(f"Getting {params_obj_type} state {state} for {params_obj_name}")
-        state_exists = _state_check_chain(
-            "get", env, params_obj_type, params_obj_name, state_params
+def _get_object_states(state_params: Params, env: Env = None) -> None:
+    """
+    Retrieve a state of a single parametric object disregarding the current changes.
+
+    All arguments are identical to the main entry method.
+    """
+    params_obj_name = state_params["object_name"]
+    params_obj_type = state_params["object_type"]
+    if params_obj_type in state_params.objects("skip_types"):
+        logging.debug(
+            f"Skip getting states of types {', '.join(state_params.objects('skip_types'))}"
+        )
+        return
+    if params_obj_type == "nets/vms/images" and state_params.get_boolean(
+        "image_readonly", False
+    ):
+        logging.warning(
+            f"Incorrect configuration: cannot use any state "
+            f"from readonly image {params_obj_name} - skipping"
+        )
+        return
+
+    # if the state is not defined skip (leaf tests that are no setup)
+    if not state_params.get("get_state"):
+        logging.debug(f"Skip getting any {params_obj_type} state for {params_obj_name}")
+        return
+    else:
+        state = state_params["get_state"]
+    state_params["get_mode"] = state_params.get("get_mode", "ra")
+
+    logging.info(f"Getting {params_obj_type} state {state} for {params_obj_name}")
+    state_exists = _state_check_chain(
+        "get", env, params_obj_type, params_obj_name, state_params
+    )
+    state_backend = BACKENDS[state_params["states"]]
+    # TODO: we don't support other parametric object instances
+    vm = env.get_vm(state_params["vms"]) if env is not None else None
+    state_object = env if params_obj_type == "nets" else vm
+
+    action_if_exists = state_params["get_mode"][0]
+    action_if_doesnt_exist = state_params["get_mode"][1]
+    if not state_exists and "a" == action_if_doesnt_exist:
+        logging.info("Aborting because of missing snapshot for setup")
+        raise exceptions.TestAbortError(
+            "Snapshot '%s' of %s doesn't exist. Aborting "
+            "due to passive mode." % (state_params["get_state"], params_obj_name)
+        )
+    elif not state_exists and "i" == action_if_doesnt_exist:
+        logging.warning("Ignoring missing snapshot for setup")
+        return
+    elif not state_exists:
+        raise exceptions.TestError(
+            "Invalid policy %s: The start action on missing state can be "
+            "either of 'abort', 'ignore'." % state_params["get_mode"]
+        )
+    elif state_exists and "a" == action_if_exists:
+        logging.info("Aborting because of unwanted snapshot for setup")
+        raise exceptions.TestAbortError(
+            "Snapshot '%s' of %s already exists. Aborting "
+            "due to passive mode." % (state_params["get_state"], params_obj_name)
+        )
+    elif state_exists and "r" == action_if_exists:
+        pass
+    elif state_exists and "i" == action_if_exists:
+        logging.warning("Ignoring present snapshot for setup")
+        return
+    elif state_exists:
+        raise exceptions.TestError(
+            "Invalid policy %s: The start action on present state can be "
+            "either of 'abort', 'reuse', 'ignore'." % state_params["get_mode"]
         )
-        state_backend = BACKENDS[state_params["states"]]
-        # TODO: we don't support other parametric object instances
-        vm = env.get_vm(state_params["vms"]) if env is not None else None
-        state_object = env if params_obj_type == "nets" else vm
-
-        action_if_exists = state_params["get_mode"][0]
-        action_if_doesnt_exist = state_params["get_mode"][1]
-        if not state_exists and "a" == action_if_doesnt_exist:
-            logging.info("Aborting because of missing snapshot for setup")
-            raise exceptions.TestAbortError(
-                "Snapshot '%s' of %s doesn't exist. Aborting "
-                "due to passive mode." % (state_params["get_state"], params_obj_name)
-            )
-        elif not state_exists and "i" == action_if_doesnt_exist:
-            logging.warning("Ignoring missing snapshot for setup")
-            continue
-        elif not state_exists:
-            raise exceptions.TestError(
-                "Invalid policy %s: The start action on missing state can be "
-                "either of 'abort', 'ignore'." % state_params["get_mode"]
-            )
-        elif state_exists and "a" == action_if_exists:
-            logging.info("Aborting because of unwanted snapshot for setup")
-            raise exceptions.TestAbortError(
-                "Snapshot '%s' of %s already exists. Aborting "
-                "due to passive mode." % (state_params["get_state"], params_obj_name)
-            )
-        elif state_exists and "r" == action_if_exists:
-            pass
-        elif state_exists and "i" == action_if_exists:
-            logging.warning("Ignoring present snapshot for setup")
-            continue
-        elif state_exists:
-            raise exceptions.TestError(
-                "Invalid policy %s: The start action on present state can be "
-                "either of 'abort', 'reuse', 'ignore'." % state_params["get_mode"]
-            )
 
+    with StateInventory.update(state_params):
         if state_params["get_state"] in ROOTS:
             state_backend.get_root(state_params, state_object)
         else:
             state_backend.get(state_params, state_object)
 
 
+def prefetch_states(run_params: Params, env: Env = None) -> None:
+    """
+    Download states from their pools into the local cache without using them.
+
+    :param run_params: configuration parameters
+
+    Prefetching is only an optimization for a later state retrieval so that
+    root states, states of backends without pools, and states missing from
+    the pools are skipped and any transfer errors are only logged.
+    """
+    from .pool import SourcedStateBackend, TransferOps
+
+    with TransferOps.cached_listings():
+        for state_params in _parametric_object_iteration(run_params):
+            params_obj_name = state_params["object_name"]
+            params_obj_type = state_params["object_type"]
+            if params_obj_type in state_params.objects("skip_types"):
+                continue
+            state = state_params.get("get_state")
+            if not state or state in ROOTS:
+                continue
+            state_backend = BACKENDS[state_params["states"]]
+            if not issubclass(state_backend, SourcedStateBackend):
+                continue
+            # only pool scopes are considered to never change the current object
+            scopes = state_params.get_list("pool_scope", ["swarm", "cluster", "shared"])
+            state_params["pool_scope"] = " ".join(s for s in scopes if s != "own")
+            if not state_params["pool_scope"]:
+                continue
+            state_params["pool_prefetch"] = "yes"
+
+            logging.info(
+                f"Prefetching {params_obj_type} state {state} for {params_obj_name}"
+            )
+            try:
+                with StateInventory.update(state_params):
+                    state_backend.get(state_params, None)
+            except Exception as error:
+                logging.warning(
+                    f"Could not prefetch {params_obj_type} state {state} "
+                    f"for {params_obj_name}: {error}"
+                )
+
+
 def set_states(run_params: Params, env: Env = None) -> None:
     """
     Store a state saving the current changes.
@@ -442,96 +737,105 @@ def set_states(run_params: Params, env: Env = None) -> None:
     :raises: :py:class:`exceptions.TestAbortError` if unexpected/missing snapshot in passive mode (abort)
     :raises: :py:class:`exceptions.TestError` if invalid policy was used
     """
-    for state_params in _parametric_object_iteration(run_params):
-        params_obj_name = state_params["object_name"]
-        params_obj_type = state_params["object_type"]
-        if params_obj_type in state_params.objects("skip_types"):
-            logging.debug(
-                f"Skip setting states of types {', '.join(state_params.objects('skip_types'))}"
-            )
-            continue
-        if params_obj_type == "nets/vms/images" and state_params.get_boolean(
-            "image_readonly", False
-        ):
-            logging.warning(
-                f"Incorrect configuration: cannot use any state "
-                f"from readonly image {params_obj_name} - skipping"
-            )
-            continue
+    _parametric_object_operation(_set_object_states, run_params, env)
 
-        # if the state is not defined skip (leaf tests that are no setup)
-        if not state_params.get("set_state"):
-            logging.debug(
-                f"Skip setting any {params_obj_type} state for {params_obj_name}"
-            )
-            continue
-        else:
-            state = state_params["set_state"]
-        state_params["set_mode"] = state_params.get("set_mode", "ff")
 
-        logging.info(f"Setting {params_obj_type} state {state} for {params_obj_name}")
-        state_exists = _state_check_chain(
-            "set", env, params_obj_type, params_obj_name, state_params
+def _set_object_states(state_params: Params, env: Env = None) -> None:
+    """
+    Store a state of a single parametric object saving the current changes.
+
+    All arguments are identical to the main entry method.
+    """
+    params_obj_name = state_params["object_name"]
+    params_obj_type = state_params["object_type"]
+    if params_obj_type in state_params.objects("skip_types"):
+        logging.debug(
+            f"Skip setting states of types {', '.join(state_params.objects('skip_types'))}"
         )
-        state_backend = BACKENDS[state_params["states"]]
-        # TODO: we don't support other parametric object instances
-        vm = env.get_vm(state_params["vms"]) if env is not None else None
-        state_object = env if params_obj_type == "nets" else vm
-
-        action_if_exists = state_params["set_mode"][0]
-        action_if_doesnt_exist = state_params["set_mode"][1]
-        if state_exists and "a" == action_if_exists:
-            logging.info("Aborting because of unwanted snapshot for later cleanup")
-            raise exceptions.TestAbortError(
-                "Snapshot '%s' of %s already exists. Aborting "
-                "due to passive mode." % (state_params["set_state"], params_obj_name)
-            )
-        elif state_exists and "r" == action_if_exists:
-            logging.info("Keeping the already existing snapshot untouched")
-            continue
-        elif state_exists and "f" == action_if_exists:
-            logging.info("Overwriting the already existing snapshot")
-            state_params["unset_state"] = state_params["set_state"]
-            if state_params["set_state"] in ROOTS:
+        return
+    if params_obj_type == "nets/vms/images" and state_params.get_boolean(
+        "image_readonly", False
+    ):
+        logging.warning(
+            f"Incorrect configuration: cannot use any state "
+            f"from readonly image {params_obj_name} - skipping"
+        )
+        return
+
+    # if the state is not defined skip (leaf tests that are no setup)
+    if not state_params.get("set_state"):
+        logging.debug(f"Skip setting any {params_obj_type} state for {params_obj_name}")
+        return
+    else:
+        state = state_params["set_state"]
+    state_params["set_mode"] = state_params.get("set_mode", "ff")
+
+    logging.info(f"Setting {params_obj_type} state {state} for {params_obj_name}")
+    state_exists = _state_check_chain(
+        "set", env, params_obj_type, params_obj_name, state_params
+    )
+    state_backend = BACKENDS[state_params["states"]]
+    # TODO: we don't support other parametric object instances
+    vm = env.get_vm(state_params["vms"]) if env is not None else None
+    state_object = env if params_obj_type == "nets" else vm
+
+    action_if_exists = state_params["set_mode"][0]
+    action_if_doesnt_exist = state_params["set_mode"][1]
+    if state_exists and "a" == action_if_exists:
+        logging.info("Aborting because of unwanted snapshot for later cleanup")
+        raise exceptions.TestAbortError(
+            "Snapshot '%s' of %s already exists. Aborting "
+            "due to passive mode." % (state_params["set_state"], params_obj_name)
+        )
+    elif state_exists and "r" == action_if_exists:
+        logging.info("Keeping the already existing snapshot untouched")
+        return
+    elif state_exists and "f" == action_if_exists:
+        logging.info("Overwriting the already existing snapshot")
+        state_params["unset_state"] = state_params["set_state"]
+        if state_params["set_state"] in ROOTS:
+            with StateInventory.update(state_params):
                 state_backend.unset_root(state_params, state_object)
+        else:
+            from .pool import SourcedStateBackend
+
+            if issubclass(state_backend, SourcedStateBackend):
+                # overwriting arbitrary external states in the backing chain can result in invalid
+                # derivative states when branching out and other problems, do this only manually if
+                # you really know what you are doing which would depend on a case-by-case basis
+                logging.warning(
+                    "Preserving the already existing snapshot due to overwrite dependency coupling"
+                )
             else:
-                from .pool import SourcedStateBackend
-
-                if issubclass(state_backend, SourcedStateBackend):
-                    # overwriting arbitrary external states in the backing chain can result in invalid
-                    # derivative states when branching out and other problems, do this only manually if
-                    # you really know what you are doing which would depend on a case-by-case basis
-                    logging.warning(
-                        "Preserving the already existing snapshot due to overwrite dependency coupling"
-                    )
-                else:
-                    logging.info("Removing the already existing snapshot")
+                logging.info("Removing the already existing snapshot")
+                with StateInventory.update(state_params):
                     state_backend.unset(state_params, state_object)
-        elif state_exists:
-            raise exceptions.TestError(
-                "Invalid policy %s: The end action on present state can be "
-                "either of 'abort', 'reuse', 'force'." % state_params["set_mode"]
-            )
-        elif not state_exists and "a" == action_if_doesnt_exist:
-            logging.info("Aborting because of missing snapshot for later cleanup")
-            raise exceptions.TestAbortError(
-                "Snapshot '%s' of %s doesn't exist. Aborting "
-                "due to passive mode." % (state_params["set_state"], params_obj_name)
-            )
-        elif not state_exists and "f" == action_if_doesnt_exist:
-            if not state_params["set_state"] in ROOTS and not state_backend.check_root(
-                state_params, state_object
-            ):
-                raise exceptions.TestError(
-                    "Cannot force set state without a root state, use enforcing check "
-                    "policy to also force root (existing stateful object) creation."
-                )
-        elif not state_exists:
+    elif state_exists:
+        raise exceptions.TestError(
+            "Invalid policy %s: The end action on present state can be "
+            "either of 'abort', 'reuse', 'force'." % state_params["set_mode"]
+        )
+    elif not state_exists and "a" == action_if_doesnt_exist:
+        logging.info("Aborting because of missing snapshot for later cleanup")
+        raise exceptions.TestAbortError(
+            "Snapshot '%s' of %s doesn't exist. Aborting "
+            "due to passive mode." % (state_params["set_state"], params_obj_name)
+        )
+    elif not state_exists and "f" == action_if_doesnt_exist:
+        if not state_params["set_state"] in ROOTS and not state_backend.check_root(
+            state_params, state_object
+        ):
             raise exceptions.TestError(
-                "Invalid policy %s: The end action on missing state can be "
-                "either of 'abort', 'force'." % state_params["set_mode"]
+                "Cannot force set state without a root state, use enforcing check "
+                "policy to also force root (existing stateful object) creation."
             )
+    elif not state_exists:
+        raise exceptions.TestError(
+            "Invalid policy %s: The end action on missing state can be "
+            "either of 'abort', 'force'." % state_params["set_mode"]
+        )
 
+    with StateInventory.update(state_params):
         if state_params["set_state"] in ROOTS:
             state_backend.set_root(state_params, state_object)
         else:
@@ -546,75 +850,84 @@ def unset_states(run_params: Params, env: Env = None) -> None:
     :raises: :py:class:`exceptions.TestAbortError` if missing snapshot in passive mode (abort)
     :raises: :py:class:`exceptions.TestError` if invalid policy was used
     """
-    for state_params in _parametric_object_iteration(run_params):
-        params_obj_name = state_params["object_name"]
-        params_obj_type = state_params["object_type"]
-        if params_obj_type in state_params.objects("skip_types"):
-            logging.debug(
-                f"Skip unsetting states of types {', '.join(state_params.objects('skip_types'))}"
-            )
-            continue
-        if params_obj_type == "nets/vms/images" and state_params.get_boolean(
-            "image_readonly", False
-        ):
-            logging.warning(
-                f"Incorrect configuration: cannot use any state "
-                f"from readonly image {params_obj_name} - skipping"
-            )
-            continue
+    _parametric_object_operation(_unset_object_states, run_params, env)
 
-        # if the state is not defined skip (leaf tests that are no setup)
-        if not state_params.get("unset_state"):
-            logging.debug(
-                f"Skip unsetting any {params_obj_type} state for {params_obj_name}"
-            )
-            continue
-        else:
-            state = state_params["unset_state"]
-        state_params["unset_mode"] = state_params.get("unset_mode", "fi")
 
-        logging.info(f"Unsetting {params_obj_type} state {state} for {params_obj_name}")
-        state_exists = _state_check_chain(
-            "unset", env, params_obj_type, params_obj_name, state_params
+def _unset_object_states(state_params: Params, env: Env = None) -> None:
+    """
+    Remove a state of a single parametric object with previous changes.
+
+    All arguments are identical to the main entry method.
+    """
+    params_obj_name = state_params["object_name"]
+    params_obj_type = state_params["object_type"]
+    if params_obj_type in state_params.objects("skip_types"):
+        logging.debug(
+            f"Skip unsetting states of types {', '.join(state_params.objects('skip_types'))}"
+        )
+        return
+    if params_obj_type == "nets/vms/images" and state_params.get_boolean(
+        "image_readonly", False
+    ):
+        logging.warning(
+            f"Incorrect configuration: cannot use any state "
+            f"from readonly image {params_obj_name} - skipping"
+        )
+        return
+
+    # if the state is not defined skip (leaf tests that are no setup)
+    if not state_params.get("unset_state"):
+        logging.debug(
+            f"Skip unsetting any {params_obj_type} state for {params_obj_name}"
+        )
+        return
+    else:
+        state = state_params["unset_state"]
+    state_params["unset_mode"] = state_params.get("unset_mode", "fi")
+
+    logging.info(f"Unsetting {params_obj_type} state {state} for {params_obj_name}")
+    state_exists = _state_check_chain(
+        "unset", env, params_obj_type, params_obj_name, state_params
+    )
+    state_backend = BACKENDS[state_params["states"]]
+    # TODO: we don't support other parametric object instances
+    vm = env.get_vm(state_params["vms"]) if env is not None else None
+    state_object = env if params_obj_type == "nets" else vm
+
+    action_if_exists = state_params["unset_mode"][0]
+    action_if_doesnt_exist = state_params["unset_mode"][1]
+    if not state_exists and "a" == action_if_doesnt_exist:
+        logging.info("Aborting because of missing snapshot for final cleanup")
+        raise exceptions.TestAbortError(
+            "Snapshot '%s' of %s doesn't exist. Aborting "
+            "due to passive mode." % (state_params["unset_state"], params_obj_name)
+        )
+    elif not state_exists and "i" == action_if_doesnt_exist:
+        logging.warning(
+            "Ignoring missing snapshot for final cleanup (will not be removed)"
+        )
+        return
+    elif not state_exists:
+        raise exceptions.TestError(
+            "Invalid policy %s: The unset action on missing state can be "
+            "either of 'abort', 'ignore'." % state_params["unset_mode"]
+        )
+    elif state_exists and "r" == action_if_exists:
+        logging.info(
+            "Preserving state '%s' of %s for later test runs",
+            state_params["unset_state"],
+            params_obj_name,
+        )
+        return
+    elif state_exists and "f" == action_if_exists:
+        pass
+    elif state_exists:
+        raise exceptions.TestError(
+            "Invalid policy %s: The unset action on present state can be "
+            "either of 'reuse', 'force'." % state_params["unset_mode"]
         )
-        state_backend = BACKENDS[state_params["states"]]
-        # TODO: we don't support other parametric object instances
-        vm = env.get_vm(state_params["vms"]) if env is not None else None
-        state_object = env if params_obj_type == "nets" else vm
-
-        action_if_exists = state_params["unset_mode"][0]
-        action_if_doesnt_exist = state_params["unset_mode"][1]
-        if not state_exists and "a" == action_if_doesnt_exist:
-            logging.info("Aborting because of missing snapshot for final cleanup")
-            raise exceptions.TestAbortError(
-                "Snapshot '%s' of %s doesn't exist. Aborting "
-                "due to passive mode." % (state_params["unset_state"], params_obj_name)
-            )
-        elif not state_exists and "i" == action_if_doesnt_exist:
-            logging.warning(
-                "Ignoring missing snapshot for final cleanup (will not be removed)"
-            )
-            continue
-        elif not state_exists:
-            raise exceptions.TestError(
-                "Invalid policy %s: The unset action on missing state can be "
-                "either of 'abort', 'ignore'." % state_params["unset_mode"]
-            )
-        elif state_exists and "r" == action_if_exists:
-            logging.info(
-                "Preserving state '%s' of %s for later test runs",
-                state_params["unset_state"],
-                params_obj_name,
-            )
-            continue
-        elif state_exists and "f" == action_if_exists:
-            pass
-        elif state_exists:
-            raise exceptions.TestError(
-                "Invalid policy %s: The unset action on present state can be "
-                "either of 'reuse', 'force'." % state_params["unset_mode"]
-            )
 
+    with StateInventory.update(state_params):
         if state_params["unset_state"] in ROOTS:
             state_backend.unset_root(state_params, state_object)
         else:
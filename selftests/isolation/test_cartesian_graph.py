@@ -1688,7 +1688,7 @@ class CartesianNodeTest(Test):
         TestSwarm.run_swarms["localhost"].workers += [worker3]
         self.assertTrue(flat_node.should_parse(worker3))
 
-    @mock.patch('avocado_i2n.cartgraph.worker.remote.wait_for_login', mock.MagicMock())
+    @mock.patch('avocado_i2n.session_pool.remote.wait_for_login', mock.MagicMock())
     @mock.patch('avocado_i2n.cartgraph.node.door', DummyStateControl)
     def test_default_run_decision(self):
         """Test expectations on the default decision policy of whether to run or skip a test node."""
@@ -1758,7 +1758,51 @@ class CartesianNodeTest(Test):
         test_node1.results = [{"name": "install.net2", "status": "PASS"}]
         self.assertTrue(test_node1.default_run_decision(worker1))
 
-    @mock.patch('avocado_i2n.cartgraph.worker.remote.wait_for_login', mock.MagicMock())
+    @mock.patch('avocado_i2n.session_pool.remote.wait_for_login', mock.MagicMock())
+    @mock.patch('avocado_i2n.cartgraph.node.door', DummyStateControl)
+    def test_scan_states_batch(self):
+        """Test run decisions from a single state scan for multiple test nodes."""
+        self.config["tests_str"] += "only tutorial1\n"
+        graph = TestGraph.parse_object_trees(
+            restriction=self.config["tests_str"],
+            object_restrs=self.config["vm_strs"],
+            params={"nets": "net1"},
+        )
+        worker = graph.workers["net1"]
+        install_node = graph.get_nodes(param_val="install.+net1", unique=True)
+        customize_node = graph.get_nodes(param_val="automated.customize.+net1", unique=True)
+        leaf_node = graph.get_nodes(param_val="tutorial1.+net1", unique=True)
+        for node in [install_node, customize_node, leaf_node]:
+            node.params["nets_host"], node.params["nets_gateway"] = "1", ""
+            node.started_worker = worker
+
+        DummyStateControl.asserted_states["check"] = {"install": {self.shared_pool: True},
+                                                      "customize": {self.shared_pool: False}}
+        with mock.patch.object(DummyStateControl, "run_subcontrol",
+                               wraps=DummyStateControl.run_subcontrol) as run_subcontrol:
+            TestNode.scan_states_batch([install_node, customize_node, leaf_node], worker)
+            run_subcontrol.assert_called_once()
+            # run decisions use the batch results without any further scans
+            self.assertFalse(install_node.default_run_decision(worker))
+            self.assertTrue(customize_node.default_run_decision(worker))
+            self.assertTrue(leaf_node.default_run_decision(worker))
+            run_subcontrol.assert_called_once()
+
+            # batch results are only used once
+            DummyStateControl.asserted_states["check"]["customize"][self.shared_pool] = True
+            self.assertFalse(customize_node.default_run_decision(worker))
+            self.assertEqual(run_subcontrol.call_count, 2)
+
+            # batch results are dropped by nodes modifying states of the same objects
+            TestNode.scan_states_batch([customize_node, leaf_node], worker)
+            self.assertEqual(run_subcontrol.call_count, 3)
+            graph.drop_scans(install_node)
+            self.assertEqual(customize_node._scanned_states, {})
+            self.assertEqual(leaf_node._scanned_states, {})
+            self.assertFalse(customize_node.default_run_decision(worker))
+            self.assertEqual(run_subcontrol.call_count, 4)
+
+    @mock.patch('avocado_i2n.session_pool.remote.wait_for_login', mock.MagicMock())
     def test_default_clean_decision(self):
         """Test expectations on the default decision policy of whether to clean or not a test node."""
         self.config["tests_str"] = "only leaves\n"
@@ -2100,7 +2144,7 @@ class CartesianNodeTest(Test):
             test_node.validate()
 
 
-@mock.patch('avocado_i2n.cartgraph.worker.remote.wait_for_login', mock.MagicMock())
+@mock.patch('avocado_i2n.session_pool.remote.wait_for_login', mock.MagicMock())
 @mock.patch('avocado_i2n.cartgraph.node.door', DummyStateControl)
 @mock.patch('avocado_i2n.plugins.runner.SpawnerDispatcher', mock.MagicMock())
 @mock.patch.object(TestRunner, 'run_test_task', DummyTestRun.mock_run_test_task)
@@ -2780,6 +2824,51 @@ class CartesianGraphTest(Test):
         self.assertIn("[object]", repr)
         self.assertIn("[node]", repr)
 
+    def test_prefetch_nodes(self):
+        """Test background prefetching of setup states for the next nodes of a worker."""
+        self.config["tests_str"] += "only tutorial1\n"
+        graph = TestGraph.parse_object_trees(
+            restriction=self.config["tests_str"],
+            object_restrs=self.config["vm_strs"],
+            params={"nets": "net1"},
+        )
+        worker = graph.workers["net1"]
+        test_node = graph.get_nodes(param_val="automated.customize.+net1", unique=True)
+        DummyStateControl.asserted_states["prefetch"] = {"install": {self.shared_pool: 0},
+                                                         "customize": {self.shared_pool: 0}}
+
+        async def prefetch():
+            graph.prefetch_nodes(test_node, worker)
+            prefetch = graph._prefetches.pop(worker.id, None)
+            if prefetch is not None:
+                await prefetch
+        loop = asyncio.get_event_loop()
+
+        # no prefetching by default
+        loop.run_until_complete(prefetch())
+        self.assertEqual(DummyStateControl.asserted_states["prefetch"]["install"][self.shared_pool], 0)
+
+        # prefetch for the picked node and its children
+        test_node.params["pool_prefetch_depth"] = "2"
+        loop.run_until_complete(prefetch())
+        self.assertEqual(DummyStateControl.asserted_states["prefetch"]["install"][self.shared_pool], 1)
+        self.assertEqual(DummyStateControl.asserted_states["prefetch"]["customize"][self.shared_pool], 1)
+        # nodes are prefetched only once per worker
+        loop.run_until_complete(prefetch())
+        self.assertEqual(DummyStateControl.asserted_states["prefetch"]["install"][self.shared_pool], 1)
+        self.assertEqual(DummyStateControl.asserted_states["prefetch"]["customize"][self.shared_pool], 1)
+
+        # failed prefetches are only logged and retried later on
+        graph._prefetched.clear()
+        with mock.patch.object(TestNode, "prefetch_states",
+                               side_effect=[RuntimeError("prefetch failed"), False]):
+            loop.run_until_complete(prefetch())
+        self.assertEqual(graph._prefetched[worker.id], set())
+        loop.run_until_complete(prefetch())
+        self.assertEqual(DummyStateControl.asserted_states["prefetch"]["install"][self.shared_pool], 2)
+        self.assertEqual(DummyStateControl.asserted_states["prefetch"]["customize"][self.shared_pool], 2)
+        self.assertEqual(len(graph._prefetched[worker.id]), 2)
+
     def test_traverse_one_leaf_parallel(self):
         """Test traversal path of one test without any reusable setup."""
         graph = self._load_for_parsing("normal..tutorial1",
@@ -2824,6 +2913,23 @@ class CartesianGraphTest(Test):
 
         self._run_traversal(graph)
 
+    def test_traverse_one_leaf_with_batch_scan(self):
+        """Test traversal path of one test with a reusable setup scanned in batches."""
+        graph = self._load_for_parsing("normal..tutorial1",
+                                       {"nets": " ".join([f"net{i+1}" for i in range(3)])})
+
+        DummyStateControl.asserted_states["check"]["install"][self.shared_pool] = True
+        DummyTestRun.asserted_tests = [
+            {"shortname": "^internal.automated.customize.vm1", "vms": "^vm1$", "nets_spawner": "lxc", "nets": "^net1$"},
+            {"shortname": "^internal.automated.on_customize.vm1", "vms": "^vm1$", "nets_spawner": "lxc", "nets": "^net1$"},
+            {"shortname": "^normal.nongui.quicktest.tutorial1.vm1", "vms": "^vm1$", "nets_spawner": "lxc", "nets": "^net1$"},
+        ]
+
+        with mock.patch.object(TestNode, "scan_states_batch",
+                               wraps=TestNode.scan_states_batch) as scan_states_batch:
+            self._run_traversal(graph, {"test_timeout": 100, "states_scan_batch": "3"})
+        self.assertGreater(scan_states_batch.call_count, 0)
+
     def test_traverse_one_leaf_with_step_setup(self):
         """Test traversal path of one test with a single reusable setup test node."""
         graph = self._load_for_parsing("normal..tutorial1",
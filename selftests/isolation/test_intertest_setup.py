@@ -31,7 +31,7 @@ def new_job(config):
 
 
 @mock.patch('avocado_i2n.intertest_setup.new_job', new_job)
-@mock.patch('avocado_i2n.cartgraph.worker.remote.wait_for_login', mock.MagicMock())
+@mock.patch('avocado_i2n.session_pool.remote.wait_for_login', mock.MagicMock())
 @mock.patch('avocado_i2n.cartgraph.node.door', DummyStateControl)
 @mock.patch('avocado_i2n.cartgraph.worker.TestWorker.start', mock.MagicMock())
 @mock.patch('avocado_i2n.plugins.runner.SpawnerDispatcher', mock.MagicMock())
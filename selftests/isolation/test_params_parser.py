@@ -4,7 +4,7 @@ import unittest
 import unittest_importer
 
 from avocado import Test
-from virttest.utils_params import Params
+from virttest.utils_params import Params, ParamNotFound
 
 import avocado_i2n.params_parser as param
 
@@ -91,6 +91,86 @@ class ParamsParserTest(Test):
         with self.assertRaises(ValueError):
             config.get_params(dict_index=2)
 
+    def test_params_view(self):
+        """Test that object parameter views coincide with object parameter copies."""
+        self.base_str += "only tutorial1\n"
+        config = param.Reparsable()
+        config.parse_next_batch(base_file=self.base_file,
+                                base_str=self.base_str,
+                                base_dict=self.base_dict)
+        params = config.get_params(show_restriction=False,
+                                   show_dictionaries=False,
+                                   show_dict_fullname=False,
+                                   show_dict_contents=False)
+        params["only_image1_vm1"] = "qcow2"
+        params["image_format_vm1"] = "raw"
+
+        view = param.ParamsView(param.ParamsView(params, "vm1"), "image1")
+        copy = params.object_params("vm1").object_params("image1")
+        self.assertEqual(dict(view.items()), dict(copy.items()))
+        self.assertEqual(len(view), len(copy))
+        self.assertEqual(view["only"], "qcow2")
+        self.assertEqual(view["image_format"], "raw")
+        self.assertEqual(view.object_params("vm2")["only"], "qcow2")
+        with self.assertRaises(ParamNotFound):
+            view["nonexistent"]
+        self.assertIsNone(view.get("nonexistent"))
+
+        # changes are kept within the view (and its copies)
+        view["image_format"] = "qcow2"
+        del view["only"]
+        other = view.copy()
+        del other["image_format"]
+        self.assertEqual(view["image_format"], "qcow2")
+        self.assertNotIn("only", view)
+        self.assertNotIn("image_format", other)
+        self.assertEqual(params["image_format_vm1"], "raw")
+        self.assertEqual(params["only_image1_vm1"], "qcow2")
+        self.assertNotIn("only", params)
+
+        # copies are detached from any later parent changes
+        view = param.ParamsView(param.ParamsView(params, "vm1"), "image1")
+        other = view.copy()
+        params["image_format_vm1"] = "vmdk"
+        self.assertEqual(view["image_format"], "vmdk")
+        self.assertEqual(other["image_format"], "raw")
+        self.assertNotIsInstance(other, param.ParamsView)
+
+    def test_params_view_nested(self):
+        """Test that deeply nested parameter views coincide with parameter copies."""
+        params = Params({f"key{i}": str(i) for i in range(100)})
+        params["only"] = "root"
+        params["key1_image1_vm1"] = "image1"
+        params["key2_net1"] = "net1"
+        params["key3_vm2_obj1"] = "vm2"
+
+        view, copy = params, params
+        names = ["vm1", "image1", "net1", "obj1", "vm2", "image2"] * 3
+        for name in names:
+            view, copy = param.ParamsView(view, name), copy.object_params(name)
+        self.assertEqual(dict(view.items()), dict(copy.items()))
+        self.assertEqual(view["only"], "root")
+        self.assertEqual(view["key1"], "image1")
+        self.assertEqual(view["key2"], "net1")
+        self.assertEqual(view["key3"], "vm2")
+        self.assertNotIn("nonexistent", view)
+
+        # suffixed parameters added to intermediate views are still resolved
+        view.parent.parent["key4_image2"] = "intermediate"
+        self.assertEqual(view["key4"], "intermediate")
+        del view.parent.parent["key4_image2"]
+        view.parent.parent["key5_image2"] = "replaced"
+        self.assertEqual(view["key5"], "replaced")
+
+        # suffixed parameters replacing others in the root are still resolved
+        copy = view.copy()
+        del params["key6"]
+        params["key7_obj1"] = "root"
+        self.assertEqual(view["key7"], "root")
+        self.assertNotIn("key6", view)
+        self.assertEqual(copy["key6"], "6")
+        self.assertEqual(copy["key7"], "7")
+
 
 if __name__ == '__main__':
     unittest.main()
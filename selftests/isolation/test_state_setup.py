@@ -4,16 +4,29 @@ import unittest
 import unittest.mock as mock
 import os
 import types
+import errno
+import tempfile
+import io
+import sys
+import time
+import fcntl
+import asyncio
+import subprocess
+import threading
+import json
+import struct
 import contextlib
 
 from avocado import Test
 from avocado.core import exceptions
 from avocado.utils import process
-from virttest import utils_params
+from virttest import utils_params, env_process
 
 import unittest_importer
 # use old name to reduce amount of changes in the unit tests
 from avocado_i2n.states import setup as ss
+from avocado_i2n.session_pool import SessionPool
+from avocado_i2n.params_parser import ParamsView
 from avocado_i2n.states import qcow2
 from avocado_i2n.states import lvm
 from avocado_i2n.states import ramfile
@@ -23,6 +36,13 @@ from avocado_i2n.states import pool
 from avocado_i2n.states import vmnet
 
 
+#: beginning of a migration stream with a configuration section in the mapped ram format
+MAPPED_RAM_HEADER = (b"QEVM\x00\x00\x00\x03\x07\x00\x00\x00\x0bpc-q35-9.0"
+                     b"\x1aconfiguration/capabilities\x00\x00\x00\x01\x0amapped-ram")
+LVM_REFRESH = ["vgs --reportformat json -o vg_name",
+               "lvs --reportformat json -o vg_name,lv_name"]
+
+
 class MockDriver(unittest.TestCase):
 
     def __init__(self, params, mock_vms, mock_file_exists):
@@ -60,10 +80,22 @@ class MockDriver(unittest.TestCase):
         self._reset_extra_mocks()
         backend = self.state_backends[state_type]
         if backend == "lvm":
-            mock_driver.lv_check.return_value = root_exists
-            mock_driver.lv_list.return_value = state_names
-            with mock.patch('avocado_i2n.states.lvm.lv_utils', mock_driver):
-                yield mock_driver
+            volumes = ["thin_pool"] + [f"vm1_image1_{s}" for s in state_names]
+            if root_exists:
+                volumes += ["vm1_image1_LogVol"]
+            reports = {"vgs": {"report": [{"vg": [{"vg_name": "disk_vm1"}]}]},
+                       "lvs": {"report": [{"lv": [{"vg_name": "disk_vm1", "lv_name": v}
+                                                  for v in volumes]}]}}
+            def process_run_side_effect(cmd, **kwargs):
+                report = reports.get(cmd.split(" ", 1)[0])
+                stdout = json.dumps(report) if report else ""
+                return process.CmdResult(cmd, stdout=stdout.encode(), exit_status=0)
+            mock_driver.run.side_effect = process_run_side_effect
+            mock_driver.CmdError = process.CmdError
+            mock_driver.lv_utils.LVException = lvm.lv_utils.LVException
+            with mock.patch('avocado_i2n.states.lvm.process', mock_driver):
+                with mock.patch('avocado_i2n.states.lvm.lv_utils', mock_driver.lv_utils):
+                    yield mock_driver
         elif backend in ["qcow2", "qcow2vt"]:
             if backend == "qcow2":
                 self.mock_vms["vm1"].is_alive.return_value = False
@@ -71,13 +103,17 @@ class MockDriver(unittest.TestCase):
             elif backend == "qcow2vt":
                 self.exist_switch = True
                 self.mock_vms["vm1"].is_alive.return_value = root_exists
-            output = ""
-            for state in state_names:
-                size = "0 B" if state_type == "image" else "1 GiB"
-                output += f"0         {state}         {size} 0000-00-00 00:00:00   00:00:00.000\n"
-            mock_driver.return_value.snapshot_list.return_value = output
+            size = 0 if state_type == "image" else 1024**3
+            snapshots = [{"id": str(i), "name": state, "vm-state-size": size}
+                         for i, state in enumerate(state_names)]
+            mock_driver.return_value.info.return_value = json.dumps({"snapshots": snapshots})
+            mock_driver.return_value.image_filename = "/images/vm1/image.qcow2"
+            mock_driver.stat.return_value.st_mtime_ns = 1
+            mock_driver.stat.return_value.st_size = 1024
+            qcow2.QCOW2Backend._snapshots.clear()
             with mock.patch('avocado_i2n.states.qcow2.QemuImg', mock_driver):
-                yield mock_driver
+                with mock.patch('avocado_i2n.states.qcow2.os.stat', mock_driver.stat):
+                    yield mock_driver
         elif backend == "qcow2ext":
             self.mock_vms["vm1"].is_alive.return_value = False
             mock_driver.listdir.return_value = [s + ".qcow2" for s in state_names]
@@ -92,10 +128,49 @@ class MockDriver(unittest.TestCase):
             with mock.patch('avocado_i2n.states.qcow2.QemuImg', QemuImgMock):
                 with mock.patch('avocado_i2n.states.qcow2.os', mock_driver):
                     yield mock_driver
+        elif backend == "btrfs":
+            self.mock_vms["vm1"].is_alive.return_value = False
+            # only subvolumes have the first free inode of their own tree
+            entries = []
+            for name, inode in [(s, 256) for s in state_names] + [("nonstate", 1234)]:
+                entry = mock.Mock()
+                entry.name = name
+                entry.is_dir.return_value = True
+                entry.stat.return_value.st_ino = inode
+                entries.append(entry)
+            mock_driver.scandir.return_value.__enter__.return_value = entries
+            mock_driver.run.return_value.exit_status = 0 if root_exists else 1
+            with mock.patch('avocado_i2n.states.btrfs.process', mock_driver):
+                with mock.patch('avocado_i2n.states.btrfs.os.path.isdir',
+                                mock.Mock(return_value=True)):
+                    with mock.patch('avocado_i2n.states.btrfs.os.scandir', mock_driver.scandir):
+                        yield mock_driver
+        elif backend == "lxc":
+            comments = {f"/var/lib/lxc/c101/snaps/snap{i}/comment": state + "\n"
+                        for i, state in enumerate(state_names)}
+            snapshots = [(f"snap{i}", f"/var/lib/lxc/c101/snaps/snap{i}/comment",
+                          "2026:01:01 00:00:00", "/var/lib/lxc/c101/snaps")
+                         for i in range(len(state_names))]
+            container = mock_driver.Container.return_value
+            container.name = "c101"
+            container.defined = root_exists
+            container.running = True
+            container.snapshot_list.return_value = snapshots
+            container.snapshot.return_value = f"snap{len(snapshots)}"
+            with mock.patch.dict(sys.modules, {"lxc": mock_driver}):
+                with mock.patch('avocado_i2n.states.lxc.open', create=True,
+                                side_effect=lambda path: io.StringIO(comments[path])):
+                    with mock.patch('avocado_i2n.states.lxc.tempfile', mock_driver.tempfile):
+                        yield mock_driver
         elif backend == "ramfile":
             ramfile.RamfileBackend.image_state_backend.show.return_value = state_names
-            mock_driver.listdir.return_value = [s + ".state" for s in state_names]
-            mock_driver.stat.return_value.st_size = 0
+            entries = []
+            for state in state_names:
+                entry = mock.MagicMock()
+                entry.name = state + ".state"
+                entry.stat.return_value.st_size = 0
+                entries.append(entry)
+            mock_driver.scandir.return_value.__enter__.return_value = entries
             mock_driver.path.join = os.path.join
             mock_driver.path.exists = self.mock_file_exists
             self.exist_switch = root_exists
@@ -107,29 +182,41 @@ class MockDriver(unittest.TestCase):
     def assert_show(self, mock_driver, _state_names, state_type):
         backend = self.state_backends[state_type]
         if backend == "lvm":
-            mock_driver.lv_list.assert_called_once_with("disk_vm1")
+            commands = [c.args[0] for c in mock_driver.run.call_args_list]
+            self.assertEqual(commands, LVM_REFRESH)
         elif backend in ["qcow2", "qcow2vt"]:
-            mock_driver.return_value.snapshot_list.assert_called_once_with(force_share=True)
+            mock_driver.return_value.info.assert_called_once_with(force_share=True, output="json")
         elif backend == "qcow2ext":
             mock_driver.listdir.assert_called_once_with("/images/vm1-abc.def/image1")
+        elif backend == "btrfs":
+            mock_driver.scandir.assert_called_once_with("/images/vm1-abc.def/image1")
+            mock_driver.run.assert_not_called()
+        elif backend == "lxc":
+            mock_driver.Container.assert_called_with("c101")
+            mock_driver.Container.return_value.snapshot_list.assert_called_once_with()
         elif backend == "ramfile":
-            mock_driver.listdir.assert_called_once_with("/images/vm1-abc.def")
+            mock_driver.scandir.assert_called_once_with("/images/vm1-abc.def")
         else:
             raise ValueError(f"Unsupported backend for testing {backend}")
 
     def assert_get(self, mock_driver, state_name, state_type, action_type):
         backend = self.state_backends[state_type]
         if backend == "lvm":
-            mock_driver.lv_check.assert_called_with("disk_vm1", "LogVol")
+            commands = [c.args[0] for c in mock_driver.run.call_args_list]
+            self.assertEqual(commands[:2], LVM_REFRESH)
+            # volumes are listed anew after any (root) state modification
+            changes = [c for c in commands if c not in LVM_REFRESH]
             if action_type == 1:
-                mock_driver.lv_remove.assert_called_once_with('disk_vm1', 'current_state')
-                mock_driver.lv_take_snapshot.assert_called_once_with('disk_vm1', state_name, 'current_state')
+                self.assertEqual(changes, [
+                    "lvremove -f disk_vm1/vm1_image1_current_state",
+                    "lvcreate --snapshot --setactivationskip n --name vm1_image1_current_state "
+                    f"disk_vm1/vm1_image1_{state_name}",
+                ])
             else:
-                mock_driver.lv_remove.assert_not_called()
-                mock_driver.lv_take_snapshot.assert_not_called()
+                self.assertEqual(changes, [])
         elif backend in ["qcow2", "qcow2vt"]:
             driver_instance = mock_driver.return_value
-            driver_instance.snapshot_list.assert_called_once_with(force_share=True)
+            driver_instance.info.assert_called_once_with(force_share=True, output="json")
             if action_type == 1 and state_type == "image":
                 mock_driver.assert_called()
                 second_creation_call_params = mock_driver.call_args_list[-2].args[0]
@@ -144,9 +231,28 @@ class MockDriver(unittest.TestCase):
         elif backend == "qcow2ext":
             # would have to mock a different dependency (QemuImg) here
             raise NotImplementedError("Not isolated backend - test via integration")
+        elif backend == "btrfs":
+            commands = [c.args[0] for c in mock_driver.run.call_args_list]
+            self.assertIn("btrfs subvolume show /images/vm1/image1", commands)
+            if action_type == 1:
+                self.assertEqual(commands[-3:], [
+                    "btrfs subvolume show /images/vm1/image1",
+                    "btrfs subvolume delete /images/vm1/image1",
+                    f"btrfs subvolume snapshot /images/vm1-abc.def/image1/{state_name} /images/vm1/image1",
+                ])
+            else:
+                self.assertNotIn("btrfs subvolume delete /images/vm1/image1", commands)
+        elif backend == "lxc":
+            container = mock_driver.Container.return_value
+            if action_type == 1:
+                container.stop.assert_called_once_with()
+                container.snapshot_restore.assert_called_once_with("snap0")
+                container.start.assert_called_once_with()
+            else:
+                container.snapshot_restore.assert_not_called()
         elif backend == "ramfile":
             # TODO: cannot assert state_name as we need more isolated testing here
-            mock_driver.listdir.assert_called_with(f"/images/vm1-abc.def")
+            mock_driver.scandir.assert_called_with(f"/images/vm1-abc.def")
             if action_type == 1:
                 self.mock_vms["vm1"].restore_from_file.assert_called_once_with(f"/images/vm1-abc.def/{state_name}.state")
             else:
@@ -157,19 +263,20 @@ class MockDriver(unittest.TestCase):
     def assert_set(self, mock_driver, state_name, state_type, action_type):
         backend = self.state_backends[state_type]
         if backend == "lvm":
+            commands = [c.args[0] for c in mock_driver.run.call_args_list]
+            self.assertEqual(commands[:2], LVM_REFRESH)
+            # volumes are listed anew after any (root) state modification
+            changes = [c for c in commands if c not in LVM_REFRESH]
+            create = f"lvcreate --snapshot --name vm1_image1_{state_name} disk_vm1/vm1_image1_current_state"
+            remove = f"lvremove -f disk_vm1/vm1_image1_{state_name}"
             if action_type == 1:
-                mock_driver.lv_check.assert_called_with("disk_vm1", "LogVol")
-                mock_driver.lv_remove.assert_not_called()
-                mock_driver.lv_take_snapshot.assert_called_once_with('disk_vm1', 'current_state', state_name)
+                self.assertEqual(changes, [create])
             elif action_type == 2:
-                mock_driver.lv_check.assert_called_with("disk_vm1", "LogVol")
-                mock_driver.lv_remove.assert_called_once_with('disk_vm1', state_name)
-                mock_driver.lv_take_snapshot.assert_called_once_with('disk_vm1', 'current_state', state_name)
+                self.assertEqual(changes, [remove, create])
             else:
-                mock_driver.lv_remove.assert_not_called()
-                mock_driver.lv_take_snapshot.assert_not_called()
+                self.assertEqual(changes, [])
         elif backend in ["qcow2", "qcow2vt"]:
-            mock_driver.return_value.snapshot_list.assert_called_once_with(force_share=True)
+            mock_driver.return_value.info.assert_called_once_with(force_share=True, output="json")
             if action_type == 1 and state_type == "image":
                 mock_driver.assert_called()
                 second_creation_call_params = mock_driver.call_args_list[-2].args[0]
@@ -190,10 +297,34 @@ class MockDriver(unittest.TestCase):
         elif backend == "qcow2ext":
             # would have to mock a different dependency (shutil.copy) here
             raise NotImplementedError("Not isolated backend - test via integration")
+        elif backend == "btrfs":
+            commands = [c.args[0] for c in mock_driver.run.call_args_list]
+            state_dir = f"/images/vm1-abc.def/image1/{state_name}"
+            if action_type in [1, 2]:
+                self.assertEqual(commands[-1], f"btrfs subvolume snapshot -r /images/vm1/image1 {state_dir}")
+            else:
+                self.assertNotIn(f"btrfs subvolume snapshot -r /images/vm1/image1 {state_dir}", commands)
+            if action_type == 2:
+                self.assertIn(f"btrfs subvolume delete {state_dir}", commands)
+            else:
+                self.assertNotIn(f"btrfs subvolume delete {state_dir}", commands)
+        elif backend == "lxc":
+            container = mock_driver.Container.return_value
+            if action_type in [1, 2]:
+                comment = mock_driver.tempfile.NamedTemporaryFile.return_value.__enter__.return_value
+                comment.write.assert_called_once_with(state_name)
+                container.snapshot.assert_called_once_with(comment.name)
+                container.start.assert_called_once_with()
+            else:
+                container.snapshot.assert_not_called()
+            if action_type == 2:
+                container.snapshot_destroy.assert_called_once_with("snap0")
+            else:
+                container.snapshot_destroy.assert_not_called()
         elif backend == "ramfile":
             if action_type in [1, 2]:
                 # TODO: cannot assert state_name as we need more isolated testing here
-                mock_driver.listdir.assert_called_once_with(f"/images/vm1-abc.def")
+                mock_driver.scandir.assert_called_once_with(f"/images/vm1-abc.def")
                 self.mock_vms["vm1"].save_to_file.assert_called_once_with(f"/images/vm1-abc.def/{state_name}.state")
             else:
                 self.mock_vms["vm1"].save_to_file.assert_not_called()
@@ -203,15 +334,16 @@ class MockDriver(unittest.TestCase):
     def assert_unset(self, mock_driver, state_name, state_type, action_type):
         backend = self.state_backends[state_type]
         if backend == "lvm":
-            mock_driver.lv_check.assert_called_with("disk_vm1", "LogVol")
+            commands = [c.args[0] for c in mock_driver.run.call_args_list]
+            self.assertEqual(commands[:2], LVM_REFRESH)
+            # volumes are listed anew after any (root) state modification
+            changes = [c for c in commands if c not in LVM_REFRESH]
             if action_type == 1:
-                mock_driver.lv_remove.assert_called_once_with("disk_vm1", state_name)
-                mock_driver.lv_take_snapshot.assert_not_called()
+                self.assertEqual(changes, [f"lvremove -f disk_vm1/vm1_image1_{state_name}"])
             else:
-                mock_driver.lv_remove.assert_not_called()
-                mock_driver.lv_take_snapshot.assert_not_called()
+                self.assertEqual(changes, [])
         elif backend in ["qcow2", "qcow2vt"]:
-            mock_driver.return_value.snapshot_list.assert_called_once_with(force_share=True)
+            mock_driver.return_value.info.assert_called_once_with(force_share=True, output="json")
             if action_type == 1 and state_type == "image":
                 mock_driver.assert_called()
                 second_creation_call_params = mock_driver.call_args_list[-2].args[0]
@@ -230,9 +362,22 @@ class MockDriver(unittest.TestCase):
                 mock_driver.unlink.assert_called_once_with(f"/images/vm1-abc.def/image1/{state_name}.qcow2")
             else:
                 mock_driver.unlink.assert_not_called()
+        elif backend == "btrfs":
+            commands = [c.args[0] for c in mock_driver.run.call_args_list]
+            state_dir = f"/images/vm1-abc.def/image1/{state_name}"
+            if action_type == 1:
+                self.assertEqual(commands[-1], f"btrfs subvolume delete {state_dir}")
+            else:
+                self.assertNotIn(f"btrfs subvolume delete {state_dir}", commands)
+        elif backend == "lxc":
+            container = mock_driver.Container.return_value
+            if action_type == 1:
+                container.snapshot_destroy.assert_called_once_with("snap0")
+            else:
+                container.snapshot_destroy.assert_not_called()
         elif backend == "ramfile":
             # TODO: cannot assert state_name as we need more isolated testing here
-            mock_driver.listdir.assert_called_once_with(f"/images/vm1-abc.def")
+            mock_driver.scandir.assert_called_once_with(f"/images/vm1-abc.def")
             if action_type == 1:
                 mock_driver.unlink.assert_called_once_with(f"/images/vm1-abc.def/{state_name}.state")
             else:
@@ -312,6 +457,16 @@ class StatesBoundaryTest(Test):
         self.run_params["swarm_pool"] = "/images"
         self.run_params["object_id"] = "vm1-abc.def"
 
+    def _set_image_btrfs_params(self):
+        self.run_params["states_images"] = "btrfs"
+        self.run_params["image_name_image1_vm1"] = "image1/image"
+        self.run_params["swarm_pool"] = "/images"
+        self.run_params["object_id"] = "vm1-abc.def"
+
+    def _set_net_lxc_params(self):
+        self.run_params["states_nets"] = "lxc"
+        self.run_params["nets_host_net1"] = "c101"
+
     def _set_vm_qcow2_params(self):
         self.run_params["states_vms"] = "qcow2vt"
         self.run_params["image_format"] = "qcow2"
@@ -338,10 +493,10 @@ class StatesBoundaryTest(Test):
     def _prepare_driver_from_backend(self, backend):
         self._create_mock_vms()
 
-        if backend in ["qcow2", "qcow2ext", "lvm"]:
+        if backend in ["qcow2", "qcow2ext", "lvm", "btrfs"]:
             backend_type = "image"
             self.run_params["skip_types"] = "nets nets/vms"
-        elif backend in ["vmnet", "lxc", "btrfs"]:
+        elif backend in ["vmnet", "lxc"]:
             backend_type = "net"
             self.run_params["skip_types"] = "nets/vms nets/vms/images"
         else:
@@ -353,6 +508,10 @@ class StatesBoundaryTest(Test):
             self._set_image_qcow2ext_params()
         elif backend == "lvm":
             self._set_image_lvm_params()
+        elif backend == "btrfs":
+            self._set_image_btrfs_params()
+        elif backend == "lxc":
+            self._set_net_lxc_params()
         elif backend == "qcow2vt":
             self._set_vm_qcow2_params()
         elif backend == "ramfile":
@@ -383,7 +542,8 @@ class StatesBoundaryTest(Test):
 
     def _test_get_state(self, backend):
         backend_type = self._prepare_driver_from_backend(backend)
-        self.run_params[f"get_state_{backend_type}s_vm1"] = "launch"
+        object_name = "net1" if backend_type == "net" else "vm1"
+        self.run_params[f"get_state_{backend_type}s_{object_name}"] = "launch"
 
         # assert state is retrieved if available after it was checked
         with self.driver.mock_show(["launch"], backend_type) as driver:
@@ -397,7 +557,8 @@ class StatesBoundaryTest(Test):
 
     def _test_set_state(self, backend):
         backend_type = self._prepare_driver_from_backend(backend)
-        self.run_params[f"set_state_{backend_type}s_vm1"] = "launch"
+        object_name = "net1" if backend_type == "net" else "vm1"
+        self.run_params[f"set_state_{backend_type}s_{object_name}"] = "launch"
 
         # assert state is removed and saved if available after it was checked
         with self.driver.mock_show(["launch"], backend_type) as driver:
@@ -411,7 +572,8 @@ class StatesBoundaryTest(Test):
 
     def _test_unset_state(self, backend):
         backend_type = self._prepare_driver_from_backend(backend)
-        self.run_params[f"unset_state_{backend_type}s_vm1"] = "launch"
+        object_name = "net1" if backend_type == "net" else "vm1"
+        self.run_params[f"unset_state_{backend_type}s_{object_name}"] = "launch"
 
         # assert state is removed if available after it was checked
         with self.driver.mock_show(["launch"], backend_type) as driver:
@@ -431,6 +593,30 @@ class StatesBoundaryTest(Test):
         """Test that state listing with the QCOW2 internal state backend works correctly."""
         self._test_show_states("qcow2")
 
+    def test_show_image_qcow2_cache(self):
+        """Test that state listing with the QCOW2 backend reuses unchanged snapshot tables."""
+        backend = "qcow2"
+        backend_type = self._prepare_driver_from_backend(backend)
+        with self.driver.mock_show(["launch"], backend_type) as driver:
+            self.assertEqual(ss.show_states(self.run_params, self.env), ["launch"])
+            self.assertEqual(ss.show_states(self.run_params, self.env), ["launch"])
+            driver.return_value.info.assert_called_once_with(force_share=True, output="json")
+
+            # own changes are updated in place despite the changed image file
+            driver.return_value.snapshot_create.side_effect = \
+                lambda: setattr(driver.stat.return_value, "st_mtime_ns", 2)
+            self.run_params["set_state_images"] = "launch2"
+            self.run_params["set_mode_images"] = "ff"
+            ss.set_states(self.run_params, self.env)
+            driver.return_value.snapshot_create.assert_called_once_with()
+            self.assertEqual(sorted(ss.show_states(self.run_params, self.env)), ["launch", "launch2"])
+            driver.return_value.info.assert_called_once_with(force_share=True, output="json")
+
+            # foreign changes to the image file require parsing again
+            driver.stat.return_value.st_mtime_ns = 3
+            self.assertEqual(ss.show_states(self.run_params, self.env), ["launch"])
+            self.assertEqual(driver.return_value.info.call_count, 2)
+
     def test_show_image_qcow2ext(self):
         """Test that state listing with the QCOW2 external state backend works correctly."""
         self._test_show_states("qcow2ext")
@@ -445,6 +631,14 @@ class StatesBoundaryTest(Test):
             driver.listdir.assert_called_once_with("/some/swarm2/vm1-abc.def/image1")
         self.assertEqual(len(states), 1)
 
+    def test_show_image_btrfs(self):
+        """Test that state listing with the Btrfs backend works correctly."""
+        self._test_show_states("btrfs")
+
+    def test_show_net_lxc(self):
+        """Test that state listing with the LXC backend works correctly."""
+        self._test_show_states("lxc")
+
     def test_show_vm_qcow2(self):
         """Test that state listing with the QCOW2VT backend works correctly."""
         self._test_show_states("qcow2vt")
@@ -460,9 +654,50 @@ class StatesBoundaryTest(Test):
         self.run_params["swarm_pool"] = "/some/swarm2"
         with self.driver.mock_show(["launch"], backend_type) as driver:
             states = ss.show_states(self.run_params, self.env)
-            driver.listdir.assert_called_once_with("/some/swarm2/vm1-abc.def")
+            driver.scandir.assert_called_once_with("/some/swarm2/vm1-abc.def")
         self.assertEqual(len(states), 1)
 
+    def test_show_vm_ramfile_images(self):
+        """Test that state listing with the ramfile backend requires states of all images."""
+        backend = "ramfile"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params["images_vm1"] = "image1 image2 image3"
+        image_states = {"image1": ["launch", "launch2", "launch3"],
+                        "image2": ["launch2", "launch", "boot"],
+                        "image3": ["launch", "launch2"]}
+        with self.driver.mock_show(["launch", "launch2", "launch3", "boot"], backend_type) as driver:
+            ramfile.RamfileBackend.image_state_backend.show.side_effect = \
+                lambda params, object=None: image_states[params["images"]]
+            states = ss.show_states(self.run_params, self.env)
+            driver.scandir.assert_called_once_with("/images/vm1-abc.def")
+            ramfile.RamfileBackend.image_state_backend.show.side_effect = None
+            entries = driver.scandir.return_value.__enter__.return_value
+        self.assertEqual(sorted(states), ["launch", "launch2"])
+        # only complete vm states are inspected further
+        for entry in entries:
+            if entry.name in ["launch3.state", "boot.state"]:
+                entry.stat.assert_not_called()
+
+        # assert no entries are inspected without debug logging
+        with self.driver.mock_show(["launch", "launch2", "launch3", "boot"], backend_type) as driver:
+            ramfile.RamfileBackend.image_state_backend.show.side_effect = \
+                lambda params, object=None: image_states[params["images"]]
+            with mock.patch.object(ramfile.logging, "isEnabledFor", return_value=False):
+                states = ss.show_states(self.run_params, self.env)
+            ramfile.RamfileBackend.image_state_backend.show.side_effect = None
+            entries = driver.scandir.return_value.__enter__.return_value
+        self.assertEqual(sorted(states), ["launch", "launch2"])
+        for entry in entries:
+            entry.stat.assert_not_called()
+
+        image_states["image1"] = []
+        with self.driver.mock_show(["launch", "launch2"], backend_type) as driver:
+            ramfile.RamfileBackend.image_state_backend.show.side_effect = \
+                lambda params, object=None: image_states[params["images"]]
+            states = ss.show_states(self.run_params, self.env)
+            ramfile.RamfileBackend.image_state_backend.show.side_effect = None
+        self.assertEqual(states, [])
+
     def test_show_image_qcow2_boot(self):
         """
         Test that state checking with the QCOW2 backend considers running vms.
@@ -526,6 +761,31 @@ class StatesBoundaryTest(Test):
         self.run_params["get_mode_vm1"] = "ri"
         self._test_get_state("qcow2")
 
+    def test_get_image_btrfs(self):
+        """Test that state getting with the Btrfs backend works with available root."""
+        # use a nondefault policy that doesn't raise any errors here
+        self.run_params["get_mode_vm1"] = "ri"
+        self._test_get_state("btrfs")
+
+        # assert a missing pointer subvolume is not deleted
+        with self.driver.mock_show(["launch"], "image") as driver:
+            driver.run.side_effect = lambda cmd, **kwargs: mock.Mock(
+                exit_status=1 if cmd.startswith("btrfs subvolume show") else 0)
+            params = self.run_params.object_params("vm1").object_params("image1")
+            params.update({"vms": "vm1", "images": "image1", "get_state": "launch"})
+            btrfs.BtrfsBackend.get(params)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertEqual(commands, [
+                "btrfs subvolume show /images/vm1/image1",
+                "btrfs subvolume snapshot /images/vm1-abc.def/image1/launch /images/vm1/image1",
+            ])
+
+    def test_get_net_lxc(self):
+        """Test that state getting with the LXC backend works with available root."""
+        # use a nondefault policy that doesn't raise any errors here
+        self.run_params["get_mode_net1"] = "ri"
+        self._test_get_state("lxc")
+
     def test_get_vm_qcow2(self):
         """Test that state getting with the QCOW2VT backend works with available root."""
         # use a nondefault policy that doesn't raise any errors here
@@ -538,6 +798,24 @@ class StatesBoundaryTest(Test):
         self.run_params["get_mode_vm1"] = "ri"
         self._test_get_state("ramfile")
 
+    def test_get_vm_ramfile_compressed(self):
+        """Test that state getting with the ramfile backend detects compressed ram dumps."""
+        backend = "ramfile"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params["get_state_vms_vm1"] = "launch"
+        self.mock_vms["vm1"].MIGRATE_TIMEOUT = 10
+        self.mock_vms["vm1"].monitor.verify_status.return_value = False
+
+        with self.driver.mock_show(["launch"], backend_type) as driver:
+            with mock.patch('avocado_i2n.states.ramfile.open', create=True,
+                            new=mock.mock_open(read_data=b"\x1f\x8b\x08\x00")):
+                ss.get_states(self.run_params, self.env)
+        self.mock_vms["vm1"].restore_from_file.assert_not_called()
+        self.mock_vms["vm1"].create.assert_called_once()
+        self.assertEqual(self.mock_vms["vm1"].create.call_args.kwargs["migration_exec_cmd"],
+                         "gzip -dc /images/vm1-abc.def/launch.state")
+        self.mock_vms["vm1"].resume.assert_called_once_with(timeout=3)
+
     def test_set_image_lvm(self):
         """Test that state setting with the LVM backend works with available root."""
         self._test_set_state("lvm")
@@ -546,6 +824,14 @@ class StatesBoundaryTest(Test):
         """Test that state setting with the QCOW2 backend works with available root."""
         self._test_set_state("qcow2")
 
+    def test_set_image_btrfs(self):
+        """Test that state setting with the Btrfs backend works with available root."""
+        self._test_set_state("btrfs")
+
+    def test_set_net_lxc(self):
+        """Test that state setting with the LXC backend works with available root."""
+        self._test_set_state("lxc")
+
     def test_set_vm_qcow2(self):
         """Test that state setting with the QCOW2VT backend works with available root."""
         self._test_set_state("qcow2vt")
@@ -554,6 +840,140 @@ class StatesBoundaryTest(Test):
         """Test that state setting with the ramfile backend works with available root."""
         self._test_set_state("ramfile")
 
+    @mock.patch('avocado_i2n.states.ramfile.qemu_migration', mock.Mock())
+    def test_set_vm_ramfile_compressed(self):
+        """Test that state setting with the ramfile backend can compress the ram dump."""
+        backend = "ramfile"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params["set_state_vms_vm1"] = "launch"
+        self.run_params["ramfile_compression"] = "zstd"
+        self.mock_vms["vm1"].MIGRATE_TIMEOUT = 10
+        self.mock_vms["vm1"].monitor.info.return_value = "Migration status: completed"
+
+        with self.driver.mock_show([], backend_type) as driver:
+            ss.set_states(self.run_params, self.env)
+        self.mock_vms["vm1"].save_to_file.assert_not_called()
+        self.mock_vms["vm1"].monitor.migrate.assert_called_once_with(
+            "exec:zstd -q -T0 -c>/images/vm1-abc.def/launch.state", wait=False)
+        self.mock_vms["vm1"].destroy.assert_called_once_with(gracefully=False)
+        self.mock_vms["vm1"].resume.assert_called_once_with(timeout=3)
+
+        # assert failed saves are detected
+        self.mock_vms["vm1"].monitor.info.return_value = "Migration status: failed"
+        with self.driver.mock_show([], backend_type) as driver:
+            with self.assertRaises(ramfile.VMMigrateFailedError):
+                ss.set_states(self.run_params, self.env)
+
+    @mock.patch('avocado_i2n.states.ramfile.qemu_migration', mock.Mock())
+    def test_set_vm_ramfile_resume(self):
+        """Test that state setting with the ramfile backend can skip restoring the vm."""
+        backend = "ramfile"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params["set_state_vms_vm1"] = "launch"
+        self.run_params["ramfile_set_mode"] = "resume"
+        self.mock_vms["vm1"].MIGRATE_TIMEOUT = 10
+        self.mock_vms["vm1"].monitor.info.return_value = "Migration status: completed"
+
+        with self.driver.mock_show([], backend_type) as driver:
+            ss.set_states(self.run_params, self.env)
+        self.mock_vms["vm1"].save_to_file.assert_not_called()
+        self.mock_vms["vm1"].monitor.migrate.assert_called_once_with(
+            "exec:cat>/images/vm1-abc.def/launch.state", wait=False)
+        ramfile.RamfileBackend.image_state_backend.set.assert_called_once()
+        self.mock_vms["vm1"].destroy.assert_not_called()
+        self.mock_vms["vm1"].restore_from_file.assert_not_called()
+        self.mock_vms["vm1"].create.assert_not_called()
+        self.mock_vms["vm1"].resume.assert_called_once_with(timeout=3)
+
+    @mock.patch('avocado_i2n.states.ramfile.qemu_migration', mock.Mock())
+    def test_set_vm_ramfile_mapped(self):
+        """Test that state setting with the ramfile backend can use the mapped ram format."""
+        backend = "ramfile"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params["set_state_vms_vm1"] = "launch"
+        self.run_params["ramfile_format_vm1"] = "mapped"
+        self.run_params["ramfile_multifd_channels"] = "8"
+        self.mock_vms["vm1"].MIGRATE_TIMEOUT = 10
+        self.mock_vms["vm1"].monitor.info.return_value = "Migration status: completed"
+        self.mock_vms["vm1"].monitor.verify_status.return_value = False
+        self.mock_vms["vm1"].deferral_incoming = True
+
+        with self.driver.mock_show([], backend_type) as driver:
+            with mock.patch('avocado_i2n.states.ramfile.open', create=True,
+                            new=mock.mock_open(read_data=MAPPED_RAM_HEADER)):
+                ss.set_states(self.run_params, self.env)
+        monitor = self.mock_vms["vm1"].monitor
+        self.mock_vms["vm1"].save_to_file.assert_not_called()
+        monitor.migrate.assert_called_once_with("file:/images/vm1-abc.def/launch.state", wait=False)
+        # capabilities are needed on both the saving and the restoring side
+        self.assertEqual(monitor.set_migrate_capability.call_args_list,
+                         [mock.call(True, "mapped-ram"), mock.call(True, "multifd")] * 2)
+        monitor.set_migrate_parameter.assert_called_with("multifd-channels", 8)
+        monitor.migrate_incoming.assert_called_once_with("file:/images/vm1-abc.def/launch.state")
+        self.mock_vms["vm1"].restore_from_file.assert_not_called()
+        self.assertEqual(self.mock_vms["vm1"].create.call_args.kwargs["migration_mode"], "unix")
+
+        # assert the mapped format cannot be compressed
+        self.run_params["ramfile_compression"] = "zstd"
+        with self.driver.mock_show([], backend_type) as driver:
+            with self.assertRaises(ValueError):
+                ss.set_states(self.run_params, self.env)
+
+    def test_get_vm_ramfile_mapped(self):
+        """Test that state getting with the ramfile backend detects the mapped ram format."""
+        backend = "ramfile"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params["get_state_vms_vm1"] = "launch"
+        self.run_params["ramfile_multifd_channels"] = "0"
+        self.mock_vms["vm1"].MIGRATE_TIMEOUT = 10
+        self.mock_vms["vm1"].monitor.verify_status.return_value = False
+        self.mock_vms["vm1"].check_capability.return_value = True
+        self.mock_vms["vm1"].deferral_incoming = True
+        mapped_open = mock.mock_open(read_data=MAPPED_RAM_HEADER)
+
+        # assert the format is detected from the ram dump rather than the configuration
+        with self.driver.mock_show(["launch"], backend_type) as driver:
+            with mock.patch('avocado_i2n.states.ramfile.open', create=True, new=mapped_open):
+                ss.get_states(self.run_params, self.env)
+        monitor = self.mock_vms["vm1"].monitor
+        self.mock_vms["vm1"].restore_from_file.assert_not_called()
+        monitor.set_migrate_capability.assert_called_once_with(True, "mapped-ram")
+        monitor.migrate_incoming.assert_called_once_with("file:/images/vm1-abc.def/launch.state")
+        self.mock_vms["vm1"].resume.assert_called_once_with(timeout=3)
+
+        # assert stream dumps are restored regardless of the configured format
+        self.run_params["ramfile_format_vm1"] = "mapped"
+        stream_header = MAPPED_RAM_HEADER.replace(b"mapped-ram", b"x-ignore-shared")
+        with self.driver.mock_show(["launch"], backend_type) as driver:
+            with mock.patch('avocado_i2n.states.ramfile.open', create=True,
+                            new=mock.mock_open(read_data=stream_header)):
+                ss.get_states(self.run_params, self.env)
+        self.mock_vms["vm1"].restore_from_file.assert_called_once_with(
+            "/images/vm1-abc.def/launch.state")
+        self.mock_vms["vm1"].monitor.migrate_incoming.assert_not_called()
+
+        # assert missing support for deferred incoming migration is detected in advance
+        self.mock_vms["vm1"].check_capability.return_value = False
+        with self.driver.mock_show(["launch"], backend_type) as driver:
+            with mock.patch('avocado_i2n.states.ramfile.open', create=True, new=mapped_open):
+                with self.assertRaises(ValueError):
+                    ss.get_states(self.run_params, self.env)
+        self.mock_vms["vm1"].check_capability.assert_called_once_with(
+            ramfile.Flags.INCOMING_DEFER)
+        self.mock_vms["vm1"].create.assert_not_called()
+
+        # assert missing support is still detected for vms without known capabilities
+        self.mock_vms["vm1"].devices = None
+        self.mock_vms["vm1"].deferral_incoming = False
+        with self.driver.mock_show(["launch"], backend_type) as driver:
+            with mock.patch('avocado_i2n.states.ramfile.open', create=True, new=mapped_open):
+                with self.assertRaises(ValueError):
+                    ss.get_states(self.run_params, self.env)
+        self.mock_vms["vm1"].create.assert_called_once()
+        self.mock_vms["vm1"].monitor.migrate_incoming.assert_not_called()
+        self.mock_vms["vm1"].destroy.assert_called_with(gracefully=False,
+                                                        free_mac_addresses=False)
+
     def test_unset_image_lvm(self):
         """Test that state unsetting with the LVM backend works with available root."""
         self._test_unset_state("lvm")
@@ -566,6 +986,51 @@ class StatesBoundaryTest(Test):
         """Test that state unsetting with the QCOW2 external state backend works with available root."""
         self._test_unset_state("qcow2ext")
 
+    @mock.patch('avocado_i2n.states.qcow2.TransferOps')
+    @mock.patch('avocado_i2n.states.qcow2.QemuImg')
+    @mock.patch('avocado_i2n.states.qcow2.os.rename')
+    @mock.patch('avocado_i2n.states.qcow2.os.makedirs', mock.Mock(return_value=0))
+    def test_set_image_qcow2ext_freeze(self, mock_rename, mock_qemu_img, mock_ops):
+        """Test that state freezing with the QCOW2 external state backend avoids copying."""
+        self._prepare_driver_from_backend("qcow2ext")
+        self.run_params["set_state"] = "launch"
+        mock_qemu_img.return_value.image_filename = "/images/vm1/image.qcow2"
+        mock_qemu_img.return_value.info.return_value = "{}"
+        self.mock_file_exists.return_value = False
+        self.mock_vms["vm1"].is_alive.return_value = False
+        state_file = "/images/vm1-abc.def/image1/launch.qcow2"
+
+        # sparse-aware copy by default
+        qcow2.QCOW2ExtBackend._set(self.run_params, self.mock_vms["vm1"])
+        mock_ops.copy_file.assert_called_once_with("/images/vm1/image.qcow2", state_file, mock.ANY)
+        mock_rename.assert_not_called()
+
+        # move and recreate the pointer image in rebase mode
+        mock_ops.reset_mock()
+        self.run_params["qcow2ext_freeze"] = "rebase"
+        qcow2.QCOW2ExtBackend._set(self.run_params, self.mock_vms["vm1"])
+        mock_rename.assert_called_once_with("/images/vm1/image.qcow2", state_file)
+        mock_ops.copy_file.assert_not_called()
+        pointer_params = mock_qemu_img.return_value.create.call_args.args[0]
+        self.assertEqual(pointer_params["image_name_snapshot"], state_file[:-6])
+
+        # copy across filesystems or for running vms
+        for error in [OSError(errno.EXDEV, "Cross-device link"), None]:
+            mock_rename.reset_mock()
+            mock_ops.reset_mock()
+            mock_rename.side_effect = error
+            self.mock_vms["vm1"].is_alive.return_value = error is None
+            qcow2.QCOW2ExtBackend._set(self.run_params, self.mock_vms["vm1"])
+            mock_ops.copy_file.assert_called_once()
+
+    def test_unset_image_btrfs(self):
+        """Test that state unsetting with the Btrfs backend works with available root."""
+        self._test_unset_state("btrfs")
+
+    def test_unset_net_lxc(self):
+        """Test that state unsetting with the LXC backend works with available root."""
+        self._test_unset_state("lxc")
+
     def test_unset_vm_qcow2(self):
         """Test that state unsetting with the QCOW2VT backend works with available root."""
         self._test_unset_state("qcow2vt")
@@ -594,13 +1059,13 @@ class StatesBoundaryTest(Test):
         # assert root state is correctly detected
         with self.driver.mock_show([], backend_type, True) as driver:
             exists = ss.check_states(self.run_params, self.env)
-            driver.lv_check.assert_called_once_with("disk_vm1", "LogVol")
+            self.assertEqual([c.args[0] for c in driver.run.call_args_list], LVM_REFRESH)
         self.assertTrue(exists)
 
         # assert root state is correctly not detected
         with self.driver.mock_show([], backend_type, False) as driver:
             exists = ss.check_states(self.run_params, self.env)
-            driver.lv_check.assert_called_once_with("disk_vm1", "LogVol")
+            self.assertEqual([c.args[0] for c in driver.run.call_args_list], LVM_REFRESH)
         self.assertFalse(exists)
 
     def test_check_root_image_qcow2(self):
@@ -691,8 +1156,9 @@ class StatesBoundaryTest(Test):
                     ss.get_states(self.run_params, self.env)
 
     @mock.patch('avocado_i2n.states.lvm.env_process', mock.Mock(return_value=0))
-    @mock.patch('avocado_i2n.states.lvm.process')
-    def test_set_root_image_lvm(self, mock_process):
+    @mock.patch('avocado_i2n.states.lvm.image_lock')
+    @mock.patch('avocado_i2n.states.lvm.vg_setup')
+    def test_set_root_image_lvm(self, mock_vg_setup, mock_image_lock):
         """Test that root setting with the LVM backend works."""
         backend = "lvm"
         backend_type = self._prepare_driver_from_backend(backend)
@@ -709,38 +1175,68 @@ class StatesBoundaryTest(Test):
         self.run_params["image_raw_device_vm1"] = "no"
         # TODO: LVM is still internally tied to QCOW images and needs testing otherwise
         self.run_params["image_format"] = "qcow2"
+        create = ["lvcreate --name vm1_image1_LogVol --virtualsize 30G --thin disk_vm1/thin_pool -y",
+                  "lvcreate --snapshot --setactivationskip n --name vm1_image1_current_state "
+                  "disk_vm1/vm1_image1_LogVol"]
 
-        def process_run_side_effect(cmd, **kwargs):
-            if cmd == "pvs":
-                stdout = b"/dev/loop0 disk_vm1   lvm2"
-            elif cmd == "losetup --find":
-                stdout = b"/dev/loop0"
-            elif cmd == "losetup --all":
-                stdout = b"/dev/loop0: [0050]:2033 (/tmp/vm1_image1/virtual_hdd)"
-            else:
-                stdout = b""
-            result = process.CmdResult(cmd, stdout=stdout, exit_status=0)
-            return result
-        mock_process.run.side_effect = process_run_side_effect
-        mock_process.system.return_value = 0
+        # assert root state is detected and overwritten reusing the shared pool
+        with self.driver.mock_show(["current_state"], backend_type, True) as driver:
+            ss.set_states(self.run_params, self.env)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertNotIn("lvcreate --thinpool thin_pool --size 30G disk_vm1 -y", commands)
+            self.assertEqual(commands[-3:], [
+                "lvremove -f disk_vm1/vm1_image1_LogVol disk_vm1/vm1_image1_current_state",
+            ] + create)
+            driver.lv_utils.lv_mount.assert_called_with(
+                "disk_vm1", "vm1_image1_current_state", "/images/vm1", create_filesystem="ext4")
+        mock_vg_setup.assert_not_called()
+
+        # assert root state is not detected and created reusing the shared pool
+        with self.driver.mock_show([], backend_type, False) as driver:
+            ss.set_states(self.run_params, self.env)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertNotIn("lvcreate --thinpool thin_pool --size 30G disk_vm1 -y", commands)
+            self.assertEqual(commands[-2:], create)
+        mock_vg_setup.assert_not_called()
+
+        def mock_reports(groups):
+            def process_run_side_effect(cmd, **kwargs):
+                if cmd.startswith("vgs "):
+                    report = {"report": [{"vg": [{"vg_name": g} for g in groups]}]}
+                elif cmd.startswith("lvs "):
+                    report = {"report": [{"lv": []}]}
+                else:
+                    report = ""
+                return process.CmdResult(cmd, stdout=json.dumps(report).encode(), exit_status=0)
+            return process_run_side_effect
 
-        # assert root state is detected and overwritten
-        mock_process.reset_mock()
-        with self.driver.mock_show([], backend_type, True) as driver:
+        # assert existing volume group without logical volumes is reused
+        with self.driver.mock_show([], backend_type, False) as driver:
+            driver.run.side_effect = mock_reports(["disk_vm1"])
             ss.set_states(self.run_params, self.env)
-            driver.lv_check.assert_called_with('disk_vm1', 'LogVol')
-            driver.lv_create.assert_called_once_with('disk_vm1', 'LogVol', '30G', pool_name='thin_pool', pool_size='30G')
-            driver.lv_take_snapshot.assert_called_once_with('disk_vm1', 'LogVol', 'current_state')
-        mock_process.run.assert_called_with('vgcreate disk_vm1 /dev/loop0', sudo=True)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertEqual(commands[-3:],
+                             ["lvcreate --thinpool thin_pool --size 30G disk_vm1 -y"] + create)
+        mock_vg_setup.assert_not_called()
 
-        # assert root state is not detected and created
-        mock_process.reset_mock()
-        with self.driver.mock_show([], backend_type, True) as driver:
+        # assert failing listing of volume groups never results in their recreation
+        with self.driver.mock_show([], backend_type, False) as driver:
+            driver.run.side_effect = process.CmdError("vgs", process.CmdResult("vgs", exit_status=5))
+            with self.assertRaises(process.CmdError):
+                ss.set_states(self.run_params, self.env)
+        mock_vg_setup.assert_not_called()
+
+        # assert missing volume group and thin pool are created only once
+        mock_image_lock.reset_mock()
+        with self.driver.mock_show([], backend_type, False) as driver:
+            driver.run.side_effect = mock_reports([])
             ss.set_states(self.run_params, self.env)
-            driver.lv_check.assert_called_with('disk_vm1', 'LogVol')
-            driver.lv_create.assert_called_once_with('disk_vm1', 'LogVol', '30G', pool_name='thin_pool', pool_size='30G')
-            driver.lv_take_snapshot.assert_called_once_with('disk_vm1', 'LogVol', 'current_state')
-        mock_process.run.assert_called_with('vgcreate disk_vm1 /dev/loop0', sudo=True)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertEqual(commands[-3:],
+                             ["lvcreate --thinpool thin_pool --size 30G disk_vm1 -y"] + create)
+        mock_vg_setup.assert_called_once_with("disk_vm1", "40000", "/tmp", "virtual_hdd_vm1", True)
+        # the creation is guarded against other processes on the host
+        mock_image_lock.assert_called_once_with("/tmp/disk_vm1")
 
     @mock.patch('avocado_i2n.states.qcow2.env_process')
     def test_set_root_image_qcow2(self, mock_env_process):
@@ -820,21 +1316,161 @@ class StatesBoundaryTest(Test):
         self.run_params["disk_basedir_vm1"] = "/tmp"
         self.run_params["image_raw_device_vm1"] = "no"
 
-        # assert root state is detected and removed
-        mock_vg_cleanup.reset_mock()
-        with self.driver.mock_show([], backend_type, True) as driver:
+        # assert root state is detected and removed keeping the shared pool
+        with self.driver.mock_show(["current_state", "launch"], backend_type, True) as driver:
             ss.unset_states(self.run_params, self.env)
-            driver.vg_check.assert_called_once_with('disk_vm1')
-        mock_vg_cleanup.assert_called_once_with('virtual_hdd_vm1', '/tmp/disk_vm1', 'disk_vm1', None, True)
+            driver.lv_utils.lv_umount.assert_called_once_with("disk_vm1", "vm1_image1_current_state")
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertEqual(commands[-1], "lvremove -f disk_vm1/vm1_image1_LogVol "
+                             "disk_vm1/vm1_image1_current_state disk_vm1/vm1_image1_launch")
+        mock_vg_cleanup.assert_not_called()
 
         # test tolerance to cleanup errors
-        mock_vg_cleanup.reset_mock()
-        mock_vg_cleanup.side_effect = exceptions.TestError("cleanup failed")
         with self.driver.mock_show([], backend_type, True) as driver:
-            driver.vg_check.return_value = True
+            list_side_effect = driver.run.side_effect
+            def process_run_side_effect(cmd, **kwargs):
+                if cmd.startswith("lvremove"):
+                    raise process.CmdError(cmd, process.CmdResult(cmd, exit_status=5))
+                return list_side_effect(cmd, **kwargs)
+            driver.run.side_effect = process_run_side_effect
+            ss.unset_states(self.run_params, self.env)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertEqual(commands[:2], LVM_REFRESH)
+            self.assertEqual([c for c in commands if c not in LVM_REFRESH],
+                             ["lvremove -f disk_vm1/vm1_image1_LogVol"])
+
+        # volumes created or removed by other processes are listed anew
+        with self.driver.mock_show(["launch"], backend_type, True) as driver:
+            self.run_params[f"unset_state_{backend_type}s_vm1"] = "launch"
             ss.unset_states(self.run_params, self.env)
-            driver.vg_check.assert_called_once_with('disk_vm1')
-        mock_vg_cleanup.assert_called_once_with('virtual_hdd_vm1', '/tmp/disk_vm1', 'disk_vm1', None, True)
+            ss.unset_states(self.run_params, self.env)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            remove = "lvremove -f disk_vm1/vm1_image1_launch"
+            self.assertEqual([c for c in commands if c not in LVM_REFRESH], [remove, remove])
+            second_remove = commands.index(remove, commands.index(remove) + 1)
+            self.assertEqual(commands[second_remove - 2:second_remove], LVM_REFRESH)
+
+    def test_check_root_image_btrfs(self):
+        """Test that root checking with the Btrfs backend works."""
+        backend = "btrfs"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params[f"check_state_{backend_type}s_vm1"] = "root"
+
+        # assert root state is correctly detected
+        with self.driver.mock_show([], backend_type, True) as driver:
+            exists = ss.check_states(self.run_params, self.env)
+            driver.run.assert_called_once_with("btrfs subvolume show /images/vm1/image1",
+                                               ignore_status=True, sudo=True)
+        self.assertTrue(exists)
+
+        # assert root state is correctly not detected
+        with self.driver.mock_show([], backend_type, False) as driver:
+            exists = ss.check_states(self.run_params, self.env)
+            driver.run.assert_called_once_with("btrfs subvolume show /images/vm1/image1",
+                                               ignore_status=True, sudo=True)
+        self.assertFalse(exists)
+
+        # assert running vms result in missing root state
+        with self.driver.mock_show([], backend_type, True) as driver:
+            self.mock_vms["vm1"].is_alive.return_value = True
+            exists = ss.check_states(self.run_params, self.env)
+            driver.run.assert_not_called()
+        self.assertFalse(exists)
+
+    @mock.patch('avocado_i2n.states.btrfs.os.makedirs', mock.Mock(return_value=0))
+    @mock.patch('avocado_i2n.states.btrfs.env_process')
+    def test_set_root_image_btrfs(self, mock_env_process):
+        """Test that root setting with the Btrfs backend works."""
+        backend = "btrfs"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params[f"set_state_{backend_type}s_vm1"] = "root"
+
+        # assert root state is detected and overwritten
+        with self.driver.mock_show([], backend_type, True) as driver:
+            ss.set_states(self.run_params, self.env)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertEqual(commands[-2:], ["btrfs subvolume delete /images/vm1/image1",
+                                             "btrfs subvolume create /images/vm1/image1"])
+        mock_env_process.preprocess_image.assert_called_once()
+        self.assertEqual(mock_env_process.preprocess_image.call_args.args[2], "/images/vm1/image1/image")
+
+        # assert root state is not detected and created
+        mock_env_process.reset_mock()
+        with self.driver.mock_show([], backend_type, False) as driver:
+            ss.set_states(self.run_params, self.env)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertNotIn("btrfs subvolume delete /images/vm1/image1", commands)
+            self.assertEqual(commands[-1], "btrfs subvolume create /images/vm1/image1")
+        mock_env_process.preprocess_image.assert_called_once()
+
+        # assert images not in their own directory are rejected
+        mock_env_process.reset_mock()
+        self.run_params["image_name_image1_vm1"] = "image"
+        with self.driver.mock_show([], backend_type, False) as driver:
+            with self.assertRaises(ValueError):
+                ss.set_states(self.run_params, self.env)
+            driver.run.assert_not_called()
+        mock_env_process.preprocess_image.assert_not_called()
+
+    def test_unset_root_image_btrfs(self):
+        """Test that root unsetting with the Btrfs backend works."""
+        backend = "btrfs"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params[f"unset_state_{backend_type}s_vm1"] = "root"
+
+        # assert root state is detected and removed without its states
+        with self.driver.mock_show(["launch"], backend_type, True) as driver:
+            ss.unset_states(self.run_params, self.env)
+            commands = [c.args[0] for c in driver.run.call_args_list]
+            self.assertEqual(commands, ["btrfs subvolume show /images/vm1/image1",
+                                        "btrfs subvolume delete /images/vm1/image1"])
+
+    def test_check_root_net_lxc(self):
+        """Test that root checking with the LXC backend works."""
+        backend = "lxc"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params[f"check_state_{backend_type}s_net1"] = "root"
+
+        # assert root state is correctly detected
+        with self.driver.mock_show([], backend_type, True) as driver:
+            exists = ss.check_states(self.run_params, self.env)
+            driver.Container.assert_called_with("c101")
+        self.assertTrue(exists)
+
+        # assert root state is correctly not detected
+        with self.driver.mock_show([], backend_type, False) as driver:
+            exists = ss.check_states(self.run_params, self.env)
+        self.assertFalse(exists)
+
+    def test_set_root_net_lxc(self):
+        """Test that root setting with the LXC backend works."""
+        backend = "lxc"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params[f"set_state_{backend_type}s_net1"] = "root"
+        self.run_params["lxc_template"] = "download"
+        self.run_params["lxc_template_args"] = "--dist debian --release bookworm --arch amd64"
+
+        # assert root state is not detected and created
+        with self.driver.mock_show([], backend_type, False) as driver:
+            ss.set_states(self.run_params, self.env)
+            driver.Container.return_value.create.assert_called_once_with(
+                "download", 0, ("--dist", "debian", "--release", "bookworm",
+                                "--arch", "amd64"))
+
+    def test_unset_root_net_lxc(self):
+        """Test that root unsetting with the LXC backend works."""
+        backend = "lxc"
+        backend_type = self._prepare_driver_from_backend(backend)
+        self.run_params[f"unset_state_{backend_type}s_net1"] = "root"
+
+        # assert root state is detected and removed along with its states
+        with self.driver.mock_show(["launch", "customize"], backend_type, True) as driver:
+            ss.unset_states(self.run_params, self.env)
+            container = driver.Container.return_value
+            container.stop.assert_called_once_with()
+            self.assertEqual(container.snapshot_destroy.call_args_list,
+                             [mock.call("snap0"), mock.call("snap1")])
+            container.destroy.assert_called_once_with()
 
     @mock.patch('avocado_i2n.states.qcow2.os')
     @mock.patch('avocado_i2n.states.qcow2.env_process')
@@ -1027,6 +1663,488 @@ class StatesPoolTest(Test):
         self.assertTrue(image_locked)
         mock_fcntl.lockf.assert_called_once()
 
+    @mock.patch('avocado_i2n.states.pool.SKIP_LOCKS', False)
+    def test_pool_locks_wait(self):
+        """Test auxiliary pool module locks waiting for other lock holders."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = os.path.join(tmpdir, "image.qcow2")
+            holder = subprocess.Popen(
+                [sys.executable, "-c",
+                 "import fcntl, sys, time; fd = open(sys.argv[1], 'a+b'); "
+                 "fcntl.lockf(fd, fcntl.LOCK_EX); print('locked', flush=True); "
+                 "time.sleep(0.5)", image_path + ".lock"],
+                stdout=subprocess.PIPE, text=True,
+            )
+            self.assertEqual(holder.stdout.readline().strip(), "locked")
+            try:
+                with self.assertRaises(RuntimeError):
+                    with pool.image_lock(image_path, timeout=0):
+                        pass
+
+                # woken up by the closed lock file rather than a full polling period
+                lock = pool.ImageLock(image_path, timeout=5, shared=True)
+                lock.poll_interval = lock.event_interval = 5
+                start = time.monotonic()
+                with lock:
+                    self.assertIsNotNone(lock.fd)
+                self.assertLess(time.monotonic() - start, 3)
+                self.assertIsNone(lock.fd)
+            finally:
+                holder.wait()
+
+            async def hold_asynchronously():
+                async with pool.ImageLock(image_path, timeout=1) as lock:
+                    return lock.fd is not None
+            self.assertTrue(asyncio.run(hold_asynchronously()))
+
+    @mock.patch('avocado_i2n.states.pool.SKIP_LOCKS', False)
+    def test_pool_locks_shared(self):
+        """Test auxiliary pool module locks shared among readers but not writers."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = os.path.join(tmpdir, "image.qcow2")
+            with pool.image_lock(image_path, timeout=0, shared=True):
+                with pool.image_lock(image_path, timeout=0, shared=True):
+                    with self.assertRaises(RuntimeError):
+                        with pool.image_lock(image_path, timeout=0):
+                            pass
+                # the lock is still held by the remaining reader
+                with self.assertRaises(RuntimeError):
+                    with pool.image_lock(image_path, timeout=0):
+                        pass
+            self.assertEqual(pool.ImageLock._files, {})
+
+            with pool.image_lock(image_path, timeout=0):
+                with self.assertRaises(RuntimeError):
+                    with pool.image_lock(image_path, timeout=0, shared=True):
+                        pass
+                # readers and writers from other processes are excluded too
+                holder = subprocess.run(
+                    [sys.executable, "-c",
+                     "import fcntl, sys; fd = open(sys.argv[1], 'rb'); "
+                     "fcntl.lockf(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)", image_path + ".lock"],
+                    capture_output=True,
+                )
+                self.assertNotEqual(holder.returncode, 0)
+
+            with pool.image_lock(image_path, timeout=0, shared=True):
+                holder = subprocess.run(
+                    [sys.executable, "-c",
+                     "import fcntl, sys; fd = open(sys.argv[1], 'rb'); "
+                     "fcntl.lockf(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)", image_path + ".lock"],
+                    capture_output=True,
+                )
+                self.assertEqual(holder.returncode, 0)
+
+    @mock.patch('avocado_i2n.states.pool.SKIP_LOCKS', False)
+    def test_pool_locks_fair(self):
+        """Test auxiliary pool module locks serving waiters in FIFO order."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = os.path.join(tmpdir, "image.qcow2")
+            queue_dir = image_path + ".queue"
+            os.mkdir(queue_dir)
+            previous_path = os.path.join(queue_dir, f"{0:020d}-1-1-ex")
+            with open(previous_path, "wb") as previous:
+                fcntl.flock(previous, fcntl.LOCK_EX)
+
+                lock = pool.ImageLock(image_path, timeout=0, fair=True)
+                with self.assertRaises(RuntimeError):
+                    lock.acquire()
+                self.assertEqual(os.listdir(queue_dir), [os.path.basename(previous_path)])
+
+                # only previous exclusive waiters block shared ones
+                os.rename(previous_path, previous_path[:-2] + "sh")
+                with pool.image_lock(image_path, timeout=0, shared=True, fair=True):
+                    pass
+                os.rename(previous_path[:-2] + "sh", previous_path)
+
+            # tickets of crashed waiters are removed
+            with pool.image_lock(image_path, timeout=0, fair=True):
+                self.assertEqual(os.listdir(queue_dir), [])
+
+    @mock.patch('avocado_i2n.states.pool.SKIP_LOCKS', False)
+    def test_pool_transfer_slots(self):
+        """Test auxiliary pool module transfer scheduling with priorities and shares."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.run_params["pool_transfer_dir"] = tmpdir
+            self.run_params["pool_transfer_slots"] = "2"
+            self.run_params["pool_transfer_bandwidth"] = "1000"
+            self.run_params["update_pool_timeout"] = "0"
+            slots_dir = os.path.join(tmpdir, "host")
+            os.mkdir(slots_dir)
+            os.mkdir(os.path.join(slots_dir, "queue"))
+            scheduler = pool.TransferScheduler
+
+            with scheduler.slot("host", "upload", self.run_params):
+                self.assertEqual(scheduler.get_limit(), "1000")
+                with scheduler.slot("host", "download", self.run_params):
+                    # weighted share among a running upload and this download
+                    self.assertEqual(scheduler.get_limit(), "750")
+                    # the share in Kbit/s is converted to KiB/s for rsync
+                    self.assertEqual(scheduler.get_limit("scp"), "750")
+                    self.assertEqual(scheduler.get_limit("rsync"), "91")
+                    with self.assertRaises(RuntimeError):
+                        with scheduler.slot("host", "download", self.run_params):
+                            pass
+                self.assertEqual(scheduler.get_limit(), "")
+                # prefetches are further capped to their own bandwidth
+                self.run_params["pool_prefetch_bandwidth"] = "300"
+                with scheduler.slot("host", "prefetch", self.run_params):
+                    self.assertEqual(scheduler.get_limit(), "300")
+                self.run_params["pool_prefetch_bandwidth"] = "800"
+                with scheduler.slot("host", "prefetch", self.run_params):
+                    self.assertEqual(scheduler.get_limit(), "500")
+
+                # uploads have to let downloads that are waiting go first
+                # while downloads are served in order of arrival
+                queue_dir = os.path.join(slots_dir, "queue")
+                with open(os.path.join(queue_dir, "0-" + "9" * 20 + "-1-1"), "wb") as waiting:
+                    fcntl.flock(waiting, fcntl.LOCK_EX)
+                    with self.assertRaises(RuntimeError):
+                        with scheduler.slot("host", "upload", self.run_params):
+                            pass
+                    with scheduler.slot("host", "download", self.run_params):
+                        pass
+                # waiters that are no longer alive do not block anyone
+                with scheduler.slot("host", "upload", self.run_params):
+                    self.assertEqual(os.listdir(queue_dir), [])
+
+            # no scheduling for local pools
+            with scheduler.slot("", "upload", self.run_params):
+                self.assertEqual(scheduler.get_limit(), "")
+                self.assertFalse(os.path.exists(os.path.join(tmpdir, "localhost")))
+
+            # no scheduling without any transfer slots
+            self.run_params["pool_transfer_slots"] = "0"
+            with scheduler.slot("other", "upload", self.run_params):
+                self.assertFalse(os.path.exists(os.path.join(tmpdir, "other")))
+
+    def test_pool_dedup(self):
+        """Test auxiliary pool module content-addressed storage of identical states."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for subdir in ["cache", "pool", "pool/vm1", "pool/vm2", "pool/.objects"]:
+                os.mkdir(os.path.join(tmpdir, subdir))
+            objects_dir = os.path.join(tmpdir, "pool", ".objects")
+            self.run_params["pool_objects"] = objects_dir
+            for name, content in [("launch1", b"same"), ("launch2", b"same"), ("other", b"else")]:
+                with open(os.path.join(tmpdir, "cache", name + ".qcow2"), "wb") as image:
+                    image.write(content)
+
+            ops = pool.TransferOps
+            pool_path1 = os.path.join(tmpdir, "pool/vm1/launch.qcow2")
+            pool_path2 = os.path.join(tmpdir, "pool/vm2/launch.qcow2")
+            pool_path3 = os.path.join(tmpdir, "pool/vm2/other.qcow2")
+            ops.upload_local(os.path.join(tmpdir, "cache/launch1.qcow2"), pool_path1, self.run_params)
+            ops.upload_local(os.path.join(tmpdir, "cache/launch2.qcow2"), pool_path2, self.run_params)
+            ops.upload_local(os.path.join(tmpdir, "cache/other.qcow2"), pool_path3, self.run_params)
+            self.assertEqual(len(os.listdir(objects_dir)), 2)
+            self.assertTrue(os.path.samefile(pool_path1, pool_path2))
+            self.assertEqual(os.stat(pool_path1).st_nlink, 3)
+
+            # paths are replaced with new objects rather than overwritten
+            ops.upload_local(os.path.join(tmpdir, "cache/other.qcow2"), pool_path2, self.run_params)
+            with open(pool_path1, "rb") as image:
+                self.assertEqual(image.read(), b"same")
+            self.assertEqual(os.stat(pool_path1).st_nlink, 2)
+
+            # objects are removed only with their last reference
+            ops.delete_local(pool_path3, self.run_params)
+            self.assertEqual(len(os.listdir(objects_dir)), 2)
+            ops.delete_local(pool_path1, self.run_params)
+            self.assertEqual(len(os.listdir(objects_dir)), 1)
+            ops.delete_local(pool_path2, self.run_params)
+            self.assertEqual(os.listdir(objects_dir), [])
+
+    @mock.patch('avocado_i2n.states.pool.SKIP_LOCKS', False)
+    def test_pool_dedup_sweep(self):
+        """Test auxiliary pool module content-addressed storage concurrently with sweeping."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.mkdir(os.path.join(tmpdir, "pool"))
+            objects_dir = os.path.join(tmpdir, "pool", ".objects")
+            os.mkdir(objects_dir)
+            self.run_params["pool_objects"] = objects_dir
+            cache_path = os.path.join(tmpdir, "launch.qcow2")
+            with open(cache_path, "wb") as image:
+                image.write(b"same")
+            pool_path = os.path.join(tmpdir, "pool", "launch.qcow2")
+
+            # sweep right after the object is published but before it is linked
+            sweeps = []
+            link = os.link
+            def link_side_effect(src, dst):
+                sweep = threading.Thread(target=pool.TransferOps.sweep_local,
+                                         args=(objects_dir, self.run_params))
+                sweep.start()
+                sweep.join(0.5)
+                sweeps.append(sweep)
+                link(src, dst)
+            with mock.patch("avocado_i2n.states.pool.os.link", side_effect=link_side_effect):
+                pool.TransferOps.store_local(cache_path, pool_path, objects_dir, self.run_params)
+            sweeps[0].join(5)
+            self.assertFalse(sweeps[0].is_alive())
+            self.assertEqual(len(os.listdir(objects_dir)), 1)
+            self.assertEqual(os.stat(pool_path).st_nlink, 2)
+
+    def test_pool_gc(self):
+        """Test auxiliary pool module eviction of least recently used states."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for subdir in ["pool", "pool/vm1", "pool/vm1/image1", "vms", "vms/vm1"]:
+                os.mkdir(os.path.join(tmpdir, subdir))
+            image_dir = os.path.join(tmpdir, "pool", "vm1", "image1")
+
+            def create(path, backing_file="", access=0):
+                with open(path, "wb") as image:
+                    header = b"QFI\xfb" + struct.pack(">IQI", 3, 20 if backing_file else 0,
+                                                       len(backing_file))
+                    image.write(header + backing_file.encode())
+                os.utime(path, (access, access))
+            root = os.path.join(tmpdir, "pool", "vm1", "image1.qcow2")
+            create(root)
+            create(os.path.join(image_dir, "install.qcow2"), "../image1.qcow2", 100)
+            create(os.path.join(image_dir, "customize.qcow2"), os.path.join(image_dir, "install.qcow2"), 200)
+            create(os.path.join(image_dir, "on_customize.qcow2"), "customize.qcow2", 300)
+            create(os.path.join(image_dir, "other.qcow2"), "install.qcow2", 50)
+            create(os.path.join(tmpdir, "pool", "vm1", "on_customize.state"), access=150)
+            # a vm image currently using a state from the pool
+            create(os.path.join(tmpdir, "vms", "vm1", "image1.qcow2"), os.path.join(image_dir, "customize.qcow2"))
+            self.assertEqual(pool.PoolCollector.get_backing(os.path.join(image_dir, "install.qcow2")), root)
+
+            # nothing is evicted within the quota
+            pool_dir = os.path.join(tmpdir, "pool")
+            usage = pool.PoolCollector.scan(pool_dir)[2]
+            with mock.patch.object(pool.StateInventory, "invalidate") as mock_invalidate:
+                self.assertEqual(pool.PoolCollector.collect([pool_dir], usage, self.run_params), [])
+                mock_invalidate.assert_not_called()
+
+                # least recently used leaf states are evicted first and no longer listed
+                evicted = pool.PoolCollector.collect([pool_dir], usage - 1, self.run_params)
+                self.assertEqual(evicted, [os.path.join(image_dir, "other.qcow2")])
+                mock_invalidate.assert_called_once_with()
+
+            # backing states become leaves once their last dependent is evicted
+            self.run_params["swarm_pool"] = pool_dir
+            self.run_params["shared_pool"] = ":" + os.path.join(tmpdir, "shared")
+            self.run_params["vms_base_dir"] = os.path.join(tmpdir, "vms")
+            self.run_params["pool_gc_quota"] = "0"
+            evicted = pool.PoolCollector.run(self.run_params)
+            self.assertEqual(evicted, [os.path.join(tmpdir, "pool", "vm1", "on_customize.state"),
+                                       os.path.join(image_dir, "on_customize.qcow2")])
+            self.assertEqual(sorted(os.listdir(image_dir)), ["customize.qcow2", "install.qcow2"])
+            self.assertTrue(os.path.exists(root))
+
+    @mock.patch('avocado_i2n.states.pool.SKIP_LOCKS', False)
+    @mock.patch('avocado_i2n.states.pool.SessionPool')
+    def test_pool_remote_locks(self, mock_pool):
+        """Test auxiliary pool module remote lease locks functionality."""
+        self.run_params["pool_lock_poll"] = "0"
+        session = mock_pool.session.return_value.__enter__.return_value
+
+        # wait for a lease with heartbeats and break an expired one
+        session.cmd_output.side_effect = ["5", "1000", "", "acquired", "", ""]
+        with pool.RemoteLock("host:/pool/vm1/image.qcow2", self.run_params, timeout=1) as lock:
+            self.assertIsNotNone(lock._heartbeat)
+        commands = [c.args[0] for c in session.cmd_output.call_args_list]
+        self.assertEqual(len(commands), 5)
+        self.assertIn("mkdir /pool/vm1/image.qcow2.lease", commands[0])
+        self.assertIn("mv -T /pool/vm1/image.qcow2.lease "
+                      f"/pool/vm1/image.qcow2.lease.{lock.owner}.broken", commands[2])
+        self.assertIn(f"/pool/vm1/image.qcow2.lease/owner 2>/dev/null)\" = \"{lock.owner}\"",
+                      commands[4])
+        self.assertIn(f"rm -rf /pool/vm1/image.qcow2.lease.{lock.owner}.released", commands[4])
+        self.assertIsNone(lock._heartbeat)
+
+        # time out on leases with heartbeats
+        session.reset_mock()
+        session.cmd_output.side_effect = None
+        session.cmd_output.return_value = "5"
+        with self.assertRaises(RuntimeError):
+            with pool.RemoteLock("host:/pool/vm1/image.qcow2", self.run_params, timeout=0):
+                pass
+
+    @mock.patch('avocado_i2n.states.pool.SKIP_LOCKS', False)
+    @mock.patch('avocado_i2n.states.pool.SessionPool')
+    def test_pool_remote_locks_break(self, mock_pool):
+        """Test auxiliary pool module remote lease locks breaking and releasing only own leases."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        session = mock_pool.session.return_value.__enter__.return_value
+        session.cmd_output.side_effect = lambda cmd: subprocess.run(
+            cmd, shell=True, capture_output=True, text=True).stdout
+        pool_path = ":" + os.path.join(tmpdir.name, "image.qcow2")
+        lease_path = os.path.join(tmpdir.name, "image.qcow2.lease")
+        def lease_owner():
+            with open(os.path.join(lease_path, "owner")) as handle:
+                return handle.read().strip()
+
+        self.run_params["pool_lease_timeout"] = "60"
+        breaker1 = pool.RemoteLock(pool_path, self.run_params)
+        breaker1.owner = "breaker1"
+        breaker2 = pool.RemoteLock(pool_path, self.run_params)
+        breaker2.owner = "breaker2"
+        os.mkdir(lease_path)
+        with open(os.path.join(lease_path, "owner"), "w") as handle:
+            handle.write("crashed\n")
+        os.utime(lease_path, (time.time() - 1000, time.time() - 1000))
+
+        # both waiters consider the lease expired but only the first one breaks it
+        breaker1._break(session)
+        self.assertFalse(os.path.exists(lease_path))
+        breaker1.acquire()
+        breaker1._released.set()
+        self.assertEqual(lease_owner(), "breaker1")
+        breaker2._break(session)
+        self.assertEqual(lease_owner(), "breaker1")
+        self.assertEqual(os.listdir(tmpdir.name), ["image.qcow2.lease"])
+
+        # a previous holder whose lease was broken keeps the new lease
+        breaker2.release()
+        self.assertEqual(lease_owner(), "breaker1")
+        breaker1.release()
+        self.assertEqual(os.listdir(tmpdir.name), [])
+
+    def test_pool_copy(self):
+        """Test auxiliary pool module local copy with reflink policies."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        src_path = os.path.join(tmpdir.name, "src.qcow2")
+        dst_path = os.path.join(tmpdir.name, "dst.qcow2")
+        with open(src_path, "wb") as src:
+            src.write(b"head")
+            src.seek(4 * 1048576)
+            src.write(b"tail")
+
+        unsupported = OSError(errno.EOPNOTSUPP, "Operation not supported")
+        with mock.patch("avocado_i2n.states.pool.fcntl.ioctl",
+                        mock.MagicMock(side_effect=unsupported)) as mock_ioctl:
+            # fall back to sparse copy if reflinks are not supported
+            self.run_params["pool_reflink"] = "auto"
+            pool.TransferOps.copy_file(src_path, dst_path, self.run_params)
+            mock_ioctl.assert_called_once()
+            with open(src_path, "rb") as src, open(dst_path, "rb") as dst:
+                self.assertEqual(src.read(), dst.read())
+
+            # never attempt reflinks if forbidden
+            mock_ioctl.reset_mock()
+            os.unlink(dst_path)
+            self.run_params["pool_reflink"] = "no"
+            pool.TransferOps.copy_file(src_path, dst_path, self.run_params)
+            mock_ioctl.assert_not_called()
+            self.assertEqual(os.path.getsize(dst_path), os.path.getsize(src_path))
+
+            # fail if reflinks are required but not supported leaving no partial copies
+            os.unlink(dst_path)
+            self.run_params["pool_reflink"] = "yes"
+            with self.assertRaises(OSError):
+                pool.TransferOps.copy_file(src_path, dst_path, self.run_params)
+            self.assertEqual(os.listdir(tmpdir.name), ["src.qcow2"])
+
+        # successful reflinks do not copy any data
+        with mock.patch("avocado_i2n.states.pool.fcntl.ioctl") as mock_ioctl:
+            with mock.patch.object(pool.TransferOps, "copy_sparse") as mock_copy:
+                pool.TransferOps.copy_file(src_path, dst_path, self.run_params)
+                mock_ioctl.assert_called_once_with(mock.ANY, pool.FICLONE, mock.ANY)
+                mock_copy.assert_not_called()
+
+        # concurrent copies to the same destination don't interfere
+        other_path = os.path.join(tmpdir.name, "other.qcow2")
+        with open(other_path, "wb") as other:
+            other.write(b"other")
+        self.run_params["pool_reflink"] = "no"
+        copy_sparse = pool.TransferOps.copy_sparse
+        def copy_sparse_concurrently(src_fd, dst_fd):
+            with mock.patch.object(pool.TransferOps, "copy_sparse", copy_sparse):
+                thread = threading.Thread(target=pool.TransferOps.copy_file,
+                                          args=(other_path, dst_path, self.run_params))
+                thread.start()
+                thread.join()
+            copy_sparse(src_fd, dst_fd)
+        with mock.patch.object(pool.TransferOps, "copy_sparse", copy_sparse_concurrently):
+            pool.TransferOps.copy_file(src_path, dst_path, self.run_params)
+        with open(src_path, "rb") as src, open(dst_path, "rb") as dst:
+            self.assertEqual(src.read(), dst.read())
+        self.assertEqual(sorted(os.listdir(tmpdir.name)),
+                         ["dst.qcow2", "other.qcow2", "src.qcow2"])
+
+    @mock.patch('avocado_i2n.session_pool.remote.wait_for_login')
+    def test_pool_sessions(self, mock_login):
+        """Test auxiliary pool module session reuse, health checks and limits."""
+        self.addCleanup(SessionPool.close)
+        mock_login.side_effect = lambda *args, **kwargs: mock.MagicMock()
+        for key in ["nets_shell_client", "nets_username", "nets_password", "nets_shell_prompt"]:
+            self.run_params[key] = ""
+        self.run_params["nets_shell_host"] = "pool.host"
+        self.run_params["nets_shell_port"] = "22"
+        self.run_params["session_pool_limit"] = "2"
+        self.run_params["session_pool_timeout"] = "0"
+
+        # concurrent users get separate sessions up to the per-host limit
+        with SessionPool.session(self.run_params) as session1:
+            with SessionPool.session(self.run_params) as session2:
+                self.assertIsNot(session1, session2)
+                with self.assertRaises(RuntimeError):
+                    SessionPool.acquire(self.run_params)
+        self.assertEqual(mock_login.call_count, 2)
+
+        # released sessions are reused without health checks if recently used
+        with SessionPool.session(self.run_params) as session3:
+            self.assertIn(session3, [session1, session2])
+            session3.cmd_output.assert_not_called()
+        self.assertEqual(mock_login.call_count, 2)
+
+        # unhealthy sessions are replaced by new ones
+        self.run_params["session_pool_check_interval"] = "0"
+        for session in [session1, session2]:
+            session.is_alive.return_value = False
+        with SessionPool.session(self.run_params) as session4:
+            self.assertNotIn(session4, [session1, session2])
+        self.assertEqual(mock_login.call_count, 3)
+        session1.close.assert_called_once()
+
+        # idle sessions are evicted
+        self.run_params["session_pool_idle_timeout"] = "0"
+        SessionPool.evict(self.run_params)
+        session4.close.assert_called_once()
+
+        # shared sessions are reused among all users of the same host
+        shared1 = SessionPool.get(self.run_params)
+        shared1.cmd_output.return_value = "today"
+        shared2 = SessionPool.get(self.run_params)
+        self.assertIs(shared1, shared2)
+        shared1.cmd_output.assert_called_once()
+
+    @mock.patch('avocado_i2n.session_pool.SessionPool.close')
+    def test_pool_sessions_controls(self, mock_close):
+        """Test that the state control files close all pooled sessions."""
+        controls_dir = os.path.join(os.path.dirname(__file__), "..", "..",
+                                    "tp_folder", "controls")
+        self.addCleanup(setattr, ramfile.RamfileBackend, "image_state_backend",
+                        ramfile.RamfileBackend.image_state_backend)
+        self.addCleanup(setattr, ss, "BACKENDS", ss.BACKENDS)
+        self.addCleanup(setattr, vmnet.VMNetBackend, "network_class",
+                        vmnet.VMNetBackend.network_class)
+
+        # sessions are closed even if the state operation fails
+        with open(os.path.join(controls_dir, "pre_state.control")) as handle:
+            control = handle.read()
+        with mock.patch.object(ss, "check_states", mock.MagicMock(return_value=False)):
+            with self.assertRaises(AssertionError):
+                exec(control, {"__name__": "pre_state"}, {})
+        mock_close.assert_called_once_with()
+
+        # sessions are closed after the final off state is set
+        mock_close.reset_mock()
+        with open(os.path.join(controls_dir, "pre_test.control")) as handle:
+            control = handle.read()
+        hooks = {f"{stage}_vm_{state}_hook": None
+                 for stage in ["preprocess", "postprocess"] for state in ["on", "off"]}
+        with mock.patch.multiple(env_process, **hooks), \
+                mock.patch.object(sys, "path", list(sys.path)), \
+                mock.patch.object(ss, "set_states") as mock_set, \
+                mock.patch.dict(sys.modules, {"vncdotool": mock.MagicMock()}):
+            exec(control, {"__name__": "pre_test"}, {"params": {"suite_path": "/tests"}})
+            env_process.postprocess_vm_off_hook(mock.MagicMock(), self.run_params, self.env)
+            mock_set.assert_called_once_with(self.run_params, self.env)
+        mock_close.assert_called_once_with()
+
     @mock.patch("avocado_i2n.states.pool.os.path.exists",
                 mock.MagicMock(return_value=False))
     def test_check_root(self):
@@ -1388,6 +2506,63 @@ class StatesPoolTest(Test):
         self.backend._get.assert_called_once()
         self.backend.transport.get.assert_not_called()
 
+    def test_prefetch(self):
+        """Test that state prefetching only downloads pool states into the cache."""
+        self._set_minimal_pool_params()
+        self.run_params["states_chain"] = "vms"
+        self.run_params["states_vms"] = "mock"
+        self.run_params["get_state_vms_vm1"] = "launch"
+        self.run_params["get_location_vms_vm1"] = ":/path/1"
+        self._create_mock_sourced_backend(source_type="state")
+
+        self.backend._show.return_value = []
+        self.backend.transport.show.return_value = ["launch"]
+        ss.prefetch_states(self.run_params)
+        self.backend._get.assert_not_called()
+        self.backend.transport.get.assert_called_once()
+        prefetch_params = self.backend.transport.get.call_args.args[0]
+        self.assertEqual(prefetch_params["get_location"], ":/path/1")
+        self.assertEqual(prefetch_params["pool_prefetch"], "yes")
+
+        # failed transfers are only reported
+        self.backend.transport.get.side_effect = RuntimeError("no route to host")
+        ss.prefetch_states(self.run_params)
+        self.assertEqual(len(self.backend.transport.get.call_args_list), 2)
+
+        # root states and own scopes are never prefetched
+        self.run_params["get_state_vms_vm1"] = "root"
+        ss.prefetch_states(self.run_params)
+        self.run_params["get_state_vms_vm1"] = "launch"
+        self.run_params["pool_scope"] = "own"
+        ss.prefetch_states(self.run_params)
+        self.assertEqual(len(self.backend.transport.get.call_args_list), 2)
+
+    def test_get_single_pass(self):
+        """Test that state getting reuses all listings from its state check."""
+        self._set_minimal_pool_params()
+        self.run_params["states_chain"] = "vms"
+        self.run_params["states_vms"] = "mock"
+        self.run_params["get_state_vms_vm1"] = "launch"
+        self.run_params["get_location_vms_vm1"] = ":/path/1"
+        self._create_mock_sourced_backend(source_type="state")
+        for method in ["check_root", "get_root"]:
+            root_patch = mock.patch.object(self.backend, method, mock.MagicMock(return_value=True))
+            root_patch.start()
+            self.addCleanup(root_patch.stop)
+
+        self.backend._show.return_value = ["launch"]
+        self.backend.transport.show.return_value = ["launch"]
+        self.backend.transport.compare_chain.return_value = True
+        ss.get_states(self.run_params, self.env)
+        self.backend._get.assert_called_once()
+        self.backend._show.assert_called_once()
+        self.backend.transport.show.assert_called_once()
+
+        # listings are not reused across state operations
+        ss.get_states(self.run_params, self.env)
+        self.assertEqual(self.backend._show.call_count, 2)
+        self.assertEqual(self.backend.transport.show.call_count, 2)
+
     def test_set_all(self):
         """Test that state setting works with both cache and multiple transports."""
         self._set_minimal_pool_params()
@@ -1409,6 +2584,44 @@ class StatesPoolTest(Test):
         # no duplicate call to own scope and extra call to shared scope were made
         self.assertTrue(shared_params["set_location"], self.run_params['shared_pool'])
 
+    def test_set_async(self):
+        """Test that state setting uploads to all transports in the background."""
+        self._set_minimal_pool_params()
+        self.run_params["pool_upload_async"] = "yes"
+        self.run_params["set_state"] = "launch"
+        self.run_params["set_location"] = f":/path/1 :/path/2 :{self.run_params['swarm_pool']}"
+        self._create_mock_sourced_backend(source_type="state")
+
+        uploading = threading.Event()
+        self.backend.transport.set.side_effect = lambda *_: uploading.wait(5)
+        self.backend._show.return_value = ["launch"]
+        # object parameters are views resolved from the shared run parameters
+        self.backend.set(ParamsView(self.run_params, "vm1"), self.env)
+        self.backend._set.assert_called_once()
+        self.assertEqual(sorted(pool.UploadQueue._pending),
+                         [":/path/1/vm1-abc.def", ":/path/2/vm1-abc.def"])
+
+        # consumers of the pool wait only for pending uploads to the same pool path
+        uploading.set()
+        self.run_params["show_location"] = ":/path/1"
+        self.backend.show(self.run_params, self.env)
+        self.assertEqual(list(pool.UploadQueue._pending), [":/path/2/vm1-abc.def"])
+        pool.UploadQueue.wait()
+        self.assertEqual(pool.UploadQueue._pending, {})
+        self.assertEqual(len(self.backend.transport.set.call_args_list), 2)
+        # later changes are not seen by uploads that are still pending
+        self.run_params["set_state"] = "other"
+        for call in self.backend.transport.set.call_args_list:
+            self.assertEqual(call.args[0]["set_state"], "launch")
+        self.run_params["set_state"] = "launch"
+
+        # failed uploads are reported when waited for
+        self.backend.transport.set.side_effect = RuntimeError("no space left")
+        self.backend.set(self.run_params, self.env)
+        with self.assertRaises(RuntimeError):
+            pool.UploadQueue.wait()
+        pool.UploadQueue.wait()
+
     def test_set_no_pool(self):
         """Test that not updating the state pool sets just the cache state."""
         self._set_minimal_pool_params()
@@ -1540,6 +2753,39 @@ class StatesPoolTest(Test):
         self.assertListEqual(self.backend.ops.list_paths.call_args_list, expected_checks)
         self.assertTrue(exists)
 
+    @mock.patch('avocado_i2n.states.pool.SessionPool')
+    def test_list_batched_remote(self, mock_pool):
+        """Test that remote states of an entire pool location are listed at once within a check."""
+        self._set_minimal_pool_params()
+        self.run_params["show_location"] = "container.host:/dir/subdir"
+        session = mock_pool.session.return_value.__enter__.return_value
+        session.cmd_status_output.return_value = (0, "vm1-abc.def\n"
+                                                     "vm1-abc.def/launch.state\n"
+                                                     "vm1-abc.def/image1\n"
+                                                     "vm1-abc.def/image1/launch.qcow2\n"
+                                                     "vm1-abc.def/image1/prelaunch.qcow2\n")
+
+        with pool.TransferOps.cached_listings():
+            vm_states = pool.TransferOps.list_paths("container.host:/dir/subdir/vm1-abc.def",
+                                                    self.run_params)
+            image_states = pool.TransferOps.list_paths("container.host:/dir/subdir/vm1-abc.def/image1",
+                                                       self.run_params)
+            missing_states = pool.TransferOps.list_paths("container.host:/dir/subdir/vm2-abc.def",
+                                                         self.run_params)
+        session.cmd_status_output.assert_called_once_with(
+            "find /dir/subdir -mindepth 1 -maxdepth 3 -printf '%P\\n'")
+        self.assertEqual(vm_states, ["launch.state", "image1"])
+        self.assertEqual(image_states, ["launch.qcow2", "prelaunch.qcow2"])
+        self.assertEqual(missing_states, [])
+
+        # listings outside of a cached context are not batched
+        session.reset_mock()
+        session.cmd_status_output.return_value = (0, "launch.state image1")
+        vm_states = pool.TransferOps.list_paths("container.host:/dir/subdir/vm1-abc.def",
+                                                self.run_params)
+        session.cmd_status_output.assert_called_once_with("ls /dir/subdir/vm1-abc.def")
+        self.assertEqual(vm_states, ["launch.state", "image1"])
+
     def test_compare_chain_valid(self):
         """Test that a local and remote state and their complete backing chains are validated."""
         self._set_minimal_pool_params()
@@ -1604,6 +2850,160 @@ class StatesPoolTest(Test):
                                      "container.host:/dir/subdir/vm1-abc.def/image1/prelaunch.qcow2", mock.ANY)]
         self.assertListEqual(self.backend.ops.download.call_args_list, expected_checks)
 
+    def _create_mock_compression(self, mock_qemu_img, states):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.run_params["swarm_pool"] = tmpdir.name
+        os.mkdir(os.path.join(tmpdir.name, "vm1-abc.def"))
+        image_dir = os.path.join(tmpdir.name, "vm1-abc.def", "image1")
+        os.mkdir(image_dir)
+        for state in states:
+            with open(os.path.join(image_dir, state + ".qcow2"), "wb") as image:
+                image.write(state.encode())
+
+        qemu_img = mock.MagicMock()
+        def create_qemu_img(params, root_dir, tag):
+            qemu_img.image_filename = os.path.join(root_dir, params["image_name"] + ".qcow2")
+            return qemu_img
+        mock_qemu_img.side_effect = create_qemu_img
+        def convert(params, root_dir):
+            target = params.object_params("compressed")["image_name"]
+            with open(os.path.join(root_dir, target + ".qcow2"), "wb") as image:
+                image.write(b"compressed")
+        qemu_img.convert.side_effect = convert
+        return qemu_img, image_dir
+
+    @mock.patch('avocado_i2n.states.pool.QemuImg')
+    def test_upload_chain_compressed(self, mock_qemu_img):
+        """Test that a state chain is compressed in separate artifacts for uploading."""
+        self._set_minimal_pool_params()
+        self.run_params["set_state"] = "launch"
+        self.run_params["set_location"] = "container.host:/dir/subdir"
+        self.run_params["object_type"] = "nets/vms/images"
+        self.run_params["pool_compression"] = "zstd"
+
+        self._create_mock_transfer_backend()
+        self.deps = ["launch", "prelaunch", ""]
+        qemu_img, image_dir = self._create_mock_compression(mock_qemu_img, ["launch", "prelaunch"])
+        qemu_img.info.side_effect = [
+            json.dumps({"backing-filename": "prelaunch.qcow2",
+                        "format-specific": {"data": {"compression-type": "zlib"}}}),
+            # already compressed states are not compressed again
+            json.dumps({"format-specific": {"data": {"compression-type": "zstd"}}}),
+        ]
+        qemu_img.check.return_value.stdout_text = json.dumps(
+            {"allocated-clusters": 10, "compressed-clusters": 8})
+
+        self.backend.set(self.run_params, self.env)
+        qemu_img.convert.assert_called_once()
+        convert_params = qemu_img.convert.call_args.args[0]
+        self.assertEqual(convert_params["convert_target"], "compressed")
+        self.assertEqual(convert_params["convert_compressed"], "yes")
+        compressed_params = convert_params.object_params("compressed")
+        self.assertEqual(compressed_params["image_compression_type"], "zstd")
+        self.assertEqual(compressed_params["convert_backing_file"], "prelaunch.qcow2")
+        # the cache states remain untouched while the artifact is uploaded instead
+        launch_path = os.path.join(image_dir, "launch.qcow2")
+        compressed_path = pool.QCOW2ImageTransfer.get_compressed_path(launch_path)
+        with open(launch_path, "rb") as image:
+            self.assertEqual(image.read(), b"launch")
+        with open(compressed_path, "rb") as image:
+            self.assertEqual(image.read(), b"compressed")
+        self.assertEqual(sorted(os.listdir(image_dir)),
+                         sorted(["launch.qcow2", "prelaunch.qcow2",
+                                 os.path.basename(compressed_path)]))
+        upload_sources = [c.args[0] for c in self.backend.ops.upload.call_args_list]
+        self.assertEqual(upload_sources, [compressed_path,
+                                          os.path.join(image_dir, "prelaunch.qcow2")])
+
+        # artifacts are reused as long as the state image is unchanged
+        qemu_img.reset_mock()
+        qemu_img.info.side_effect = [
+            json.dumps({"format-specific": {"data": {"compression-type": "zstd"}}})]
+        self.backend.set(self.run_params, self.env)
+        qemu_img.convert.assert_not_called()
+        # and compared instead of the state image with the pool
+        self.backend.ops.compare.return_value = True
+        self.assertTrue(self.backend.compare_chain("launch", self.run_params["swarm_pool"],
+                                                   "container.host:/dir/subdir", self.run_params))
+        self.assertEqual(self.backend.ops.compare.call_args_list[0].args[0], compressed_path)
+
+        # artifacts of modified state images are replaced
+        qemu_img.info.side_effect = [
+            json.dumps({"format-specific": {"data": {"compression-type": "zlib"}}}),
+            json.dumps({"format-specific": {"data": {"compression-type": "zstd"}}}),
+        ]
+        os.unlink(launch_path)
+        with open(launch_path, "wb") as image:
+            image.write(b"relaunch")
+        self.backend.set(self.run_params, self.env)
+        qemu_img.convert.assert_called_once()
+        self.assertNotIn(os.path.basename(compressed_path), os.listdir(image_dir))
+        self.assertTrue(os.path.exists(pool.QCOW2ImageTransfer.get_compressed_path(launch_path)))
+
+        self.run_params["pool_compression"] = "lzma"
+        with self.assertRaises(ValueError):
+            self.backend.set(self.run_params, self.env)
+
+    @mock.patch('avocado_i2n.states.pool.QemuImg')
+    def test_upload_chain_compressed_zlib(self, mock_qemu_img):
+        """Test that a state chain is compressed despite the default zlib compression type."""
+        self._set_minimal_pool_params()
+        self.run_params["set_state"] = "launch"
+        self.run_params["set_location"] = "container.host:/dir/subdir"
+        self.run_params["object_type"] = "nets/vms/images"
+        self.run_params["pool_compression"] = "zlib"
+
+        self._create_mock_transfer_backend()
+        self.deps = ["launch", "prelaunch", ""]
+        qemu_img, image_dir = self._create_mock_compression(mock_qemu_img, ["launch", "prelaunch"])
+        # all QCOW2 v3 images report zlib compression even if uncompressed
+        qemu_img.info.return_value = json.dumps(
+            {"format-specific": {"data": {"compression-type": "zlib"}}})
+        qemu_img.check.return_value.stdout_text = json.dumps(
+            {"allocated-clusters": 10, "compressed-clusters": 0})
+
+        self.backend.set(self.run_params, self.env)
+        self.assertEqual(len(qemu_img.convert.call_args_list), 2)
+        qemu_img.check.assert_called_with(mock.ANY, os.path.dirname(image_dir),
+                                          force_share=True, output="json")
+        compressed_params = qemu_img.convert.call_args.args[0].object_params("compressed")
+        self.assertEqual(compressed_params["image_compression_type"], "zlib")
+
+        # states with compressed clusters are not compressed again
+        for path in os.listdir(image_dir):
+            if path.endswith(".compressed"):
+                os.unlink(os.path.join(image_dir, path))
+        qemu_img.convert.reset_mock()
+        qemu_img.check.return_value.stdout_text = json.dumps(
+            {"allocated-clusters": 10, "compressed-clusters": 8})
+        self.backend.set(self.run_params, self.env)
+        qemu_img.convert.assert_not_called()
+        upload_sources = [c.args[0] for c in self.backend.ops.upload.call_args_list[-2:]]
+        self.assertEqual(upload_sources, [os.path.join(image_dir, "launch.qcow2"),
+                                          os.path.join(image_dir, "prelaunch.qcow2")])
+
+    def test_upload_chain_dedup(self):
+        """Test that a state chain is uploaded and removed as content-addressed objects."""
+        self._set_minimal_pool_params()
+        self.run_params["set_state"] = "launch"
+        self.run_params["set_location"] = "container.host:/dir/subdir"
+        self.run_params["unset_state"] = "launch"
+        self.run_params["unset_location"] = ":/dir/subdir;"
+        self.run_params["object_type"] = "nets/vms/images"
+        self.run_params["pool_dedup"] = "yes"
+
+        self._create_mock_transfer_backend()
+        self.deps = ["launch", "prelaunch", ""]
+
+        self.backend.set(self.run_params, self.env)
+        for call in self.backend.ops.upload.call_args_list:
+            self.assertEqual(call.args[2]["pool_objects"], "/dir/subdir/.objects")
+        self.backend.unset(self.run_params, self.env)
+        self.backend.ops.delete.assert_called_once()
+        self.assertEqual(self.backend.ops.delete.call_args.args[1]["pool_objects"], "/dir/subdir/.objects")
+        self.assertNotIn("pool_objects", self.run_params)
+
     def test_upload_bundle(self):
         """Test that a state bundle (e.g. image with internal states) will be uploaded."""
         self._set_minimal_pool_params()
@@ -1948,6 +3348,54 @@ class StatesSetupTest(Test):
         self.backend.show.assert_called_once()
         self.assertFalse(exists)
 
+    def test_check_inventory(self):
+        """Test that state checking reuses listings of unmodified objects."""
+        self._set_up_generic_params("check", "state", "objects", "object1")
+        self.run_params["states_inventory_cache"] = "yes"
+        self.run_params["get_state_objects_object1"] = "state"
+        self.run_params["get_mode"] = "rx"
+        ss.StateInventory.invalidate()
+
+        self.backend.check_root.return_value = True
+        self.backend.show.return_value = ["state"]
+        self.assertTrue(ss.check_states(self.run_params, self.env))
+        self.assertTrue(ss.check_states(self.run_params, self.env))
+        self.backend.show.assert_called_once()
+
+        # listings are specific to locations and objects
+        self.run_params["show_location"] = "/other/loc"
+        self.assertTrue(ss.check_states(self.run_params, self.env))
+        self.assertEqual(self.backend.show.call_count, 2)
+        del self.run_params["show_location"]
+
+        # listings of modified objects are dropped
+        ss.get_states(self.run_params, self.env)
+        self.backend.get.assert_called_once()
+        self.backend.show.reset_mock()
+        self.assertTrue(ss.check_states(self.run_params, self.env))
+        self.backend.show.assert_called_once()
+
+        # listings of states shared through pools are never reused across operations
+        with mock.patch.object(ss.StateBackend, "transport", mock.Mock(), create=True):
+            self.run_params["pool_scope"] = "own shared"
+            self.assertTrue(ss.check_states(self.run_params, self.env))
+            self.assertTrue(ss.check_states(self.run_params, self.env))
+            self.assertEqual(self.backend.show.call_count, 3)
+            self.run_params["pool_scope"] = "own"
+            self.assertTrue(ss.check_states(self.run_params, self.env))
+            self.assertEqual(self.backend.show.call_count, 4)
+            self.assertTrue(ss.check_states(self.run_params, self.env))
+            self.assertEqual(self.backend.show.call_count, 4)
+        del self.run_params["pool_scope"]
+        self.backend.show.reset_mock()
+        ss.StateInventory.invalidate()
+
+        # listings are not reused by default
+        self.run_params["states_inventory_cache"] = "no"
+        self.assertTrue(ss.check_states(self.run_params, self.env))
+        self.assertTrue(ss.check_states(self.run_params, self.env))
+        self.assertEqual(self.backend.show.call_count, 2)
+
     @mock.patch("avocado_i2n.states.setup.check_states")
     def test_get(self, mock_show):
         """Test that state getting works with default policies."""
@@ -2404,6 +3852,92 @@ class StatesSetupTest(Test):
         self.assertEqual(call_params[1]["images"], "image2")
         self.assertEqual(call_params[1]["get_state"], "launch21")
 
+    def test_get_multiobj_concurrent(self):
+        """Test that getting states of multiple objects concurrently respects composition."""
+        self._set_up_multiobj_params()
+        self.run_params["vms"] = "vm1 vm2"
+        self.run_params["images"] = "image1 image2"
+        self.run_params["get_state_images"] = "launch1"
+        self.run_params["get_state_vms"] = "launch2"
+        self.run_params["get_mode"] = "ra"
+        self.run_params["skip_types"] = "nets"
+        self.run_params["states_concurrency"] = "4"
+        self._create_mock_vms()
+
+        self.backend.reset_mock()
+        self.backend.show.return_value = ["launch1", "launch2"]
+        ss.get_states(self.run_params, self.env)
+        call_params = [call.args[0] for call in self.backend.get.call_args_list]
+        self.assertEqual(len(call_params), 6)
+        object_names = [p["object_name"] for p in call_params]
+        self.assertEqual(
+            sorted(object_names),
+            sorted(["net1/vm1/image1", "net1/vm1/image2", "net1/vm1",
+                    "net1/vm2/image1", "net1/vm2/image2", "net1/vm2"]),
+        )
+        # vms are processed only after all of their images
+        for vm_name in ["vm1", "vm2"]:
+            vm_index = object_names.index(f"net1/{vm_name}")
+            self.assertGreater(vm_index, object_names.index(f"net1/{vm_name}/image1"))
+            self.assertGreater(vm_index, object_names.index(f"net1/{vm_name}/image2"))
+
+        # a failed image skips its vm but not any independent objects
+        self.backend.reset_mock()
+        self.backend.show.side_effect = lambda params, _: (
+            [] if params.get("images") == "image2" and params["vms"] == "vm1"
+            else ["launch1", "launch2"]
+        )
+        with self.assertRaises(exceptions.TestAbortError):
+            ss.get_states(self.run_params, self.env)
+        object_names = [call.args[0]["object_name"] for call in self.backend.get.call_args_list]
+        self.assertEqual(
+            sorted(object_names),
+            sorted(["net1/vm1/image1", "net1/vm2/image1", "net1/vm2/image2", "net1/vm2"]),
+        )
+
+        # errors for multiple objects are aggregated
+        self.backend.reset_mock()
+        self.backend.show.side_effect = lambda params, _: (
+            [] if params.get("images") == "image2" else ["launch1", "launch2"]
+        )
+        with self.assertRaises(exceptions.TestAbortError) as error:
+            ss.get_states(self.run_params, self.env)
+        self.assertIn("failed for 2 objects", str(error.exception))
+        self.assertIsInstance(error.exception.__cause__, exceptions.TestAbortError)
+        object_names = [call.args[0]["object_name"] for call in self.backend.get.call_args_list]
+        self.assertEqual(sorted(object_names), ["net1/vm1/image1", "net1/vm2/image1"])
+
+        # aborts among other errors are not downgraded to errors
+        self.backend.reset_mock()
+        self.backend.show.side_effect = lambda params, _: (
+            [] if params.get("images") == "image2" and params["vms"] == "vm2"
+            else ["launch1", "launch2"]
+        )
+
+        def get(params, _):
+            if params["object_name"] == "net1/vm1/image1":
+                raise RuntimeError("get failed")
+        self.backend.get.side_effect = get
+        with self.assertRaises(exceptions.TestAbortError) as error:
+            ss.get_states(self.run_params, self.env)
+        self.assertIn("failed for 2 objects", str(error.exception))
+        self.assertIn("get failed", str(error.exception))
+        self.assertIsInstance(error.exception.__cause__, exceptions.TestAbortError)
+
+        # other errors are aggregated as test errors
+        self.backend.reset_mock()
+        self.backend.show.side_effect = None
+
+        def get(params, _):
+            if params["vms"] == "vm2":
+                raise RuntimeError("get failed")
+        self.backend.get.side_effect = get
+        with self.assertRaises(exceptions.TestError) as error:
+            ss.get_states(self.run_params, self.env)
+        self.assertNotIsInstance(error.exception, exceptions.TestAbortError)
+        self.assertIsInstance(error.exception.__cause__, RuntimeError)
+        self.backend.get.side_effect = None
+
     def test_set_multiobj(self):
         """Test that setting various states of multiple vms and their images works."""
         self._set_up_multiobj_params()
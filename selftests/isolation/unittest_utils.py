@@ -1,5 +1,6 @@
 import unittest.mock as mock
 import re
+import json
 import asyncio
 
 from aexpect.exceptions import ShellCmdError
@@ -70,7 +71,7 @@ class DummyTestRun(object):
 
 class DummyStateControl(object):
 
-    asserted_states = {"check": {}, "get": {}, "set": {}, "unset": {}}
+    asserted_states = {"check": {}, "get": {}, "set": {}, "unset": {}, "prefetch": {}}
     states_params = {}
     action = "check"
 
@@ -83,11 +84,12 @@ class DummyStateControl(object):
             vm_params = params.object_params(vm)
             for image in params.objects("images"):
                 image_params = vm_params.object_params(image)
-                do_loc = "show" if do == "check" else do
+                do_loc = "show" if do == "check" else "get" if do == "prefetch" else do
+                do_key = "get" if do == "prefetch" else do
                 do_source = image_params.get(f"{do_loc}_location_images", "")
-                do_state = image_params.get(f"{do}_state_images")
+                do_state = image_params.get(f"{do_key}_state_images")
                 if not do_state:
-                    do_state = image_params.get(f"{do}_state_vms")
+                    do_state = image_params.get(f"{do_key}_state_vms")
                     do_source = image_params.get(f"{do_loc}_location_vms", "")
                     if not do_state:
                         continue
@@ -107,8 +109,17 @@ class DummyStateControl(object):
 
     @staticmethod
     def run_subcontrol(session, mod_control_path):
+        if DummyStateControl.action == "scan":
+            batch_params, results = DummyStateControl.states_params, {}
+            DummyStateControl.action = "check"
+            for node_id, node_params in batch_params.items():
+                DummyStateControl.states_params = node_params
+                results[node_id] = DummyStateControl().result
+            DummyStateControl.action = "scan"
+            return "SCAN RESULTS: " + json.dumps(results)
         if not DummyStateControl().result:
             raise ShellCmdError(1, "command", "AssertionError")
+        return ""
 
     @staticmethod
     def set_subcontrol_parameter(_, __, do):
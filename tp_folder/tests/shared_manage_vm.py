@@ -15,6 +15,7 @@ INTERFACE
 
 import time
 import os
+import json
 import logging
 
 # avocado imports
@@ -22,6 +23,7 @@ from aexpect import remote_door as door
 from avocado.core import exceptions
 from virttest import error_context
 from avocado_i2n.states import setup as ss
+from avocado_i2n.states import pool
 
 # custom imports
 pass
@@ -103,3 +105,55 @@ def run(test, params, env):
     elif params.get("vm_action", "run") == "unset":
         log.info(f"Unsetting {params['main_vm']}'s (and its images') states")
         ss.unset_states(params, env)
+    elif params.get("vm_action", "run") == "gc":
+        log.info("Collecting least recently used states from the local pools")
+        evicted = pool.PoolCollector.run(params)
+        log.info(f"Evicted {len(evicted)} states from the local pools")
+    elif params.get("vm_action", "run") == "benchmark":
+        benchmark_restore(test, params, env)
+
+
+def benchmark_restore(test, params, env):
+    """
+    Measure the time to first command after restoring a vm state in each ram file format.
+
+    :param test: test object
+    :type test: :py:class:`avocado_vt.test.VirtTest`
+    :param params: extended dictionary of parameters
+    :type params: :py:class:`virttest.utils_params.Params`
+    :param env: environment object
+    :type env: :py:class:`virttest.utils_env.Env`
+    """
+    vm_name = params["main_vm"]
+    vm = env.get_vm(vm_name)
+    repeats = params.get_numeric("benchmark_repeats", 3)
+    results = {}
+    for ramfile_format in params.objects("benchmark_ramfile_formats"):
+        state_params = params.copy()
+        state_params["vms"] = vm_name
+        state_params["skip_types"] = "nets nets/vms/images"
+        state_params["ramfile_format"] = ramfile_format
+        state_name = f"benchmark_{ramfile_format}"
+
+        log.info(f"Saving {vm_name}'s vm state {state_name}")
+        state_params["set_state_vms"] = state_name
+        ss.set_states(state_params, env)
+
+        timings = []
+        state_params["get_state_vms"] = state_name
+        for _ in range(repeats):
+            start = time.monotonic()
+            ss.get_states(state_params, env)
+            session = vm.wait_for_login(timeout=params.get_numeric("login_timeout", 360))
+            session.cmd("true")
+            timings.append(time.monotonic() - start)
+            session.close()
+        results[ramfile_format] = timings
+        log.info(f"Time to first command with {ramfile_format} ram files: "
+                 f"{', '.join(f'{t:.2f}s' for t in timings)}")
+
+        state_params["unset_state_vms"] = state_name
+        ss.unset_states(state_params, env)
+
+    with open(os.path.join(test.logdir, "benchmark_restore.json"), "w") as handle:
+        json.dump(results, handle, indent=4)